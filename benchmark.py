@@ -0,0 +1,654 @@
+# banc d'essai hors ligne de papillon-python
+#
+# Lance server.py dans un sous-processus avec un faux pronotepy (aucune requête vers une vraie école),
+# simule des élèves qui appellent toutes les routes en parallèle puis affiche les latences
+# (p50/p95/p99), le débit et la mémoire du serveur.
+#
+#   python benchmark.py --users 100 --concurrency 32 --latency 80
+#   python benchmark.py --save base.json                # garde les résultats
+#   python benchmark.py --compare base.json             # échoue si le p95 d'une route a trop augmenté
+#   python benchmark.py --failures 0.02 --session-timeout 1   # erreurs de Pronote et reconnexion des tokens inactifs
+import argparse
+import concurrent.futures
+import datetime
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import types
+
+import requests
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FIRST_DAY = datetime.date(2022, 1, 3) # un lundi, les dates des requêtes avancent d'une semaine par tour
+
+# faux pronotepy (utilisé dans le sous-processus serveur, configuré par les variables BENCH_*)
+bench_latency = float(os.environ.get('BENCH_LATENCY', 50)) / 1000 # le temps de réponse moyen de la fausse instance Pronote
+bench_login_latency = float(os.environ.get('BENCH_LOGIN_LATENCY', 500)) / 1000 # le temps d'une connexion
+bench_size = max(1, int(os.environ.get('BENCH_SIZE', 1))) # multiplie la quantité de données renvoyées
+bench_failures = float(os.environ.get('BENCH_FAILURES', 0)) # la proportion d'appels (connexions comprises) qui échouent avec PronoteAPIError
+
+class Fake(types.SimpleNamespace):
+	pass
+
+def fake_wait(latency: float = None) -> None:
+	"""
+	Simule le temps de réponse de Pronote (± 25 %), et ses erreurs dans une proportion bench_failures des appels.
+
+	Args:
+		latency (float, optional): Le temps moyen en secondes. Defaults to bench_latency.
+
+	Raises:
+		pronotepy.PronoteAPIError: pour une proportion bench_failures des appels
+	"""
+
+	latency = bench_latency if latency is None else latency
+	if latency > 0:
+		time.sleep(latency * random.uniform(0.75, 1.25))
+	if bench_failures > 0 and random.random() < bench_failures:
+		import pronotepy
+		raise pronotepy.PronoteAPIError('Erreur simulée de la fausse instance Pronote')
+
+def fake_subject(i: int) -> Fake:
+	return Fake(id=f'subject{i % 12}', name=f'Matière {i % 12}', groups=False)
+
+class FakeLesson:
+	def __init__(self, day: datetime.date, i: int):
+		self.id = f'lesson-{day.isoformat()}-{i}'
+		self.num = i
+		self.subject = fake_subject(i)
+		self.teacher_names = ['M. Professeur']
+		self.classrooms = [f'B{i}']
+		self.group_names = []
+		self.memo = None
+		self.virtual_classrooms = []
+		self.start = datetime.datetime.combine(day, datetime.time(8 + i))
+		self.end = self.start + datetime.timedelta(minutes=55)
+		self.background_color = '#4a90d9'
+		self.status = None
+		self.canceled = i == 3 and day.weekday() == 2
+		self.outing = False
+		self.detention = False
+		self.exempted = False
+		self.test = i == 1
+		self.__content = None
+
+	@property
+	def content(self):
+		# comme pronotepy, le contenu demande un appel à Pronote puis est gardé sur le cours
+		if self.__content is None:
+			fake_wait()
+			self.__content = Fake(title=f'Chapitre {self.num}', description='Lire les pages 42 à 45. ' * 4, category='Cours', files=[])
+		return self.__content
+
+class FakeHomework:
+	def __init__(self, day: datetime.date, i: int):
+		self.id = f'homework-{day.isoformat()}-{i}'
+		self.description = f'Exercices {i} et {i + 1} page {day.day + 40}'
+		self.subject = fake_subject(i)
+		self.date = day
+		self.background_color = '#e94e77'
+		self.done = False
+		self.files = [Fake(id=f'file-{i}', name='sujet.pdf', url='https://example.invalid/sujet.pdf', type=1)]
+
+	def set_done(self, status: bool) -> None:
+		fake_wait()
+		self.done = status
+
+class FakeDiscussion:
+	def __init__(self, i: int):
+		self.id = f'discussion-{i}'
+		self.subject = f'Sujet {i}'
+		self.creator = 'Mme Professeure'
+		self.participants = ['Mme Professeure', 'Élève']
+		self.date = datetime.datetime(2022, 1, 3, 8) + datetime.timedelta(hours=i)
+		self.unread = i % 3 == 0
+		self.close = False
+		self.replyable = True
+
+	@property
+	def messages(self):
+		fake_wait()
+		return [Fake(id=f'{self.id}-{j}', content='Bonjour, ' + 'voici le message. ' * 10, author='Mme Professeure', date=self.date + datetime.timedelta(minutes=j), seen=True) for j in range(3)]
+
+	def delete(self) -> None:
+		fake_wait()
+
+	def mark_as(self, read: bool) -> None:
+		fake_wait()
+		self.unread = not read
+
+	def reply(self, content: str) -> None:
+		fake_wait()
+
+class FakePeriod:
+	def __init__(self, number: int, name: str, start: datetime.datetime, end: datetime.datetime):
+		self.id = str(number)
+		self.name = name
+		self.start = start
+		self.end = end
+
+	@property
+	def grades(self):
+		fake_wait()
+		values = ['12,5', '15', '8', '17,5', 'Absent', '14', '9,5', 'NonRendu']
+		return [Fake(id=f'grade-{self.id}-{i}', subject=fake_subject(i), date=self.start + datetime.timedelta(days=2 * i), comment=f'Contrôle {i}',
+			is_bonus=False, is_optionnal=i % 11 == 0, is_out_of_20=True, grade=values[i % len(values)], out_of='20', coefficient=str(1 + i % 3),
+			average='11,8', max='19', min='4') for i in range(30 * bench_size)]
+
+	@property
+	def averages(self):
+		fake_wait()
+		return [Fake(subject=fake_subject(i), student='13,2', class_average='11,6', max='18,5', min='5', out_of='20', background_color='#50b848') for i in range(12)]
+
+	@property
+	def overall_average(self):
+		return '13,4'
+
+	@property
+	def class_overall_average(self):
+		return '11,9'
+
+	@property
+	def evaluations(self):
+		fake_wait()
+		return [Fake(id=f'evaluation-{self.id}-{i}', subject=fake_subject(i), name=f'Évaluation {i}', description='', teacher='M. Professeur',
+			date=self.start + datetime.timedelta(days=i), paliers=[], coefficient='1',
+			acquisitions=[Fake(id=f'acquisition-{i}-{j}', name='Compétence', coefficient='1', abbreviation='A', domain='Domaine', level='Maîtrise satisfaisante') for j in range(3)]) for i in range(10 * bench_size)]
+
+	@property
+	def absences(self):
+		fake_wait()
+		return [Fake(id=f'absence-{self.id}-{i}', from_date=self.start + datetime.timedelta(days=7 * i), to_date=self.start + datetime.timedelta(days=7 * i, hours=2),
+			justified=i % 2 == 0, hours='2h00', reasons=['Maladie']) for i in range(3 * bench_size)]
+
+	@property
+	def delays(self):
+		fake_wait()
+		return [Fake(id=f'delay-{self.id}-{i}', date=self.start + datetime.timedelta(days=5 * i), minutes=5, justified=False, justification=None, reasons=[]) for i in range(3 * bench_size)]
+
+	@property
+	def punishments(self):
+		fake_wait()
+		return [Fake(id=f'punishment-{self.id}-{i}', schedulable=False, schedule=[Fake(id=f'schedule-{i}', start=self.start + datetime.timedelta(days=10 * i), duration=60)],
+			given=self.start + datetime.timedelta(days=10 * i), giver='M. CPE', exclusion=False, during_lesson=False, homework='Recopier le règlement',
+			homework_documents=[], reasons=['Bavardages'], circumstances='En classe', circumstance_documents=[], nature='Retenue', duration=60) for i in range(bench_size)]
+
+class FakeClient:
+	"""
+	Remplace pronotepy.Client : des données inventées mais de la même forme, avec un temps de réponse réglable.
+	"""
+
+	def __init__(self, pronote_url: str, username: str = '', password: str = '', ent=None, mode: str = 'normal', uuid: str = '', **kwargs):
+		fake_wait(bench_login_latency)
+		self.pronote_url = pronote_url
+		self.username = username
+		self.password = password
+		self.ent = ent
+		self.uuid = uuid
+		self.login_mode = mode
+		self.client_identifier = None
+		self.logged_in = True
+		self.communication = Fake(session=requests.Session(), root_site=pronote_url.rsplit('/', 1)[0])
+		self.info = Fake(name=f'Élève {username}', class_name='3A', establishment='Collège Banc d\'Essai', phone='0600000000', email='eleve@example.invalid',
+			address=[], ine_number='000000000AA', profile_picture=None, delegue=[])
+		self.__periods = [
+			FakePeriod(1, 'Trimestre 1', datetime.datetime(2021, 9, 1), datetime.datetime(2021, 11, 30)),
+			FakePeriod(2, 'Trimestre 2', datetime.datetime(2021, 12, 1), datetime.datetime(2022, 2, 28)),
+			FakePeriod(3, 'Trimestre 3', datetime.datetime(2022, 3, 1), datetime.datetime(2022, 7, 5)),
+		]
+		self.current_period = self.__periods[1]
+
+	@classmethod
+	def token_login(cls, pronote_url: str, username: str, password: str, uuid: str, **kwargs):
+		return cls(pronote_url, username, password, mode='token', uuid=uuid)
+
+	@classmethod
+	def qrcode_login(cls, qr_code: dict, pin: str, uuid: str, **kwargs):
+		return cls(qr_code['url'], 'qrcode', secrets_token(), mode='qr_code', uuid=uuid)
+
+	@property
+	def periods(self):
+		return list(self.__periods)
+
+	def export_credentials(self) -> dict:
+		return {'pronote_url': self.pronote_url, 'username': self.username, 'password': self.password, 'client_identifier': self.client_identifier, 'uuid': self.uuid}
+
+	def session_check(self) -> bool:
+		return False
+
+	def refresh(self) -> None:
+		fake_wait(bench_login_latency)
+		if self.login_mode != 'normal':
+			# comme pronotepy : une reconnexion par jeton donne un nouveau mot de passe (voir /credentials)
+			self.password = secrets_token()
+
+	def lessons(self, date_from, date_to=None):
+		fake_wait()
+		date_from = date_from.date() if isinstance(date_from, datetime.datetime) else date_from
+		date_to = date_from if date_to is None else date_to
+		date_to = date_to.date() if isinstance(date_to, datetime.datetime) else date_to
+		days = [date_from + datetime.timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+		return [FakeLesson(day, i) for day in days if day.weekday() < 5 for i in range(6 * bench_size)]
+
+	def homework(self, date_from, date_to=None):
+		fake_wait()
+		date_to = date_to or date_from + datetime.timedelta(days=30)
+		days = [date_from + datetime.timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+		return [FakeHomework(day, i) for day in days if day.weekday() < 5 for i in range(2 * bench_size)]
+
+	def discussions(self, only_unread: bool = False):
+		fake_wait()
+		return [FakeDiscussion(i) for i in range(10 * bench_size)]
+
+	def get_recipients(self):
+		fake_wait()
+		return [Fake(id=f'recipient-{i}', name=f'Personne {i}', type='teacher', email=None, functions=['Professeur'], with_discussion=True) for i in range(50 * bench_size)]
+
+	def new_discussion(self, subject: str, content: str, recipients: list) -> None:
+		fake_wait()
+
+	def information_and_surveys(self, only_unread: bool = False):
+		fake_wait()
+		return [Fake(id=f'news-{i}', title=f'Information {i}', creation_date=datetime.datetime(2022, 1, 3) + datetime.timedelta(days=i), category='Vie scolaire',
+			read=i % 2 == 0, survey=False, anonymous_response=False, author='Direction', content='Texte de l\'information. ' * 20, attachments=[],
+			_raw_content='<p>' + 'Texte de l\'information. ' * 20 + '</p>') for i in range(10 * bench_size)]
+
+	def menus(self, date_from, date_to=None):
+		fake_wait()
+		date_to = date_from if date_to is None else date_to
+		food = lambda name: [Fake(name=name, labels=[Fake(id='bio', name='Bio', color='#50b848')])]
+		return [Fake(id=f'menu-{date_from + datetime.timedelta(days=i)}', name='Déjeuner', date=date_from + datetime.timedelta(days=i), is_lunch=True, is_dinner=False,
+			first_meal=food('Carottes râpées'), main_meal=food('Poulet rôti'), side_meal=food('Haricots verts'), other_meal=None, cheese=food('Emmental'), dessert=food('Pomme'))
+			for i in range((date_to - date_from).days + 1)]
+
+	def export_ical(self) -> str:
+		fake_wait()
+		return 'https://example.invalid/ical'
+
+def secrets_token() -> str:
+	return '%032x' % random.getrandbits(128)
+
+def serve() -> None:
+	"""
+	Lance server.py (comme `python server.py`) avec le faux pronotepy.
+	"""
+
+	import pronotepy
+	import runpy
+	pronotepy.Client = FakeClient
+	os.chdir(BASE_DIR)
+	sys.argv = [os.path.join(BASE_DIR, 'server.py')]
+	runpy.run_path(sys.argv[0], run_name='__main__')
+
+# mesure
+def percentile(values: list[float], percent: float) -> float:
+	"""
+	Calcule un percentile (au rang le plus proche) d'une liste triée.
+	"""
+
+	if not values:
+		return 0
+	return values[min(len(values) - 1, max(0, round(percent / 100 * len(values) + 0.5) - 1))]
+
+def process_tree(pid: int) -> list[int]:
+	"""
+	Retourne le processus et ses descendants (workers), d'après /proc.
+	"""
+
+	children = {}
+	for entry in os.listdir('/proc'):
+		if entry.isdigit():
+			try:
+				with open(f'/proc/{entry}/stat', 'r') as file:
+					ppid = int(file.read().rsplit(')', 1)[1].split()[1])
+			except (OSError, IndexError, ValueError):
+				continue
+			children.setdefault(ppid, []).append(int(entry))
+
+	tree = [pid]
+	for parent in tree:
+		tree.extend(children.get(parent, []))
+	return tree
+
+def server_memory(pid: int) -> dict|None:
+	"""
+	Retourne la mémoire (RSS actuelle et max, en Mio) du serveur et de ses workers, ou None hors de Linux.
+	"""
+
+	if not os.path.isdir('/proc'):
+		return None
+
+	memory = {'rss': 0, 'peak': 0}
+	for process in process_tree(pid):
+		try:
+			with open(f'/proc/{process}/status', 'r') as file:
+				for line in file:
+					if line.startswith('VmRSS:'):
+						memory['rss'] += int(line.split()[1]) / 1024
+					elif line.startswith('VmHWM:'):
+						memory['peak'] += int(line.split()[1]) / 1024
+		except OSError:
+			continue
+	return {key: round(value, 1) for key, value in memory.items()}
+
+class Recorder:
+	"""
+	Garde la durée et le statut de chaque requête, par route, et le nombre de tokens reconnectés par le serveur.
+	"""
+
+	def __init__(self):
+		self.durations = {}
+		self.errors = {}
+		self.reauthenticated = 0
+		self.lock = threading.Lock()
+
+	def add(self, name: str, seconds: float, ok: bool) -> None:
+		with self.lock:
+			self.durations.setdefault(name, []).append(seconds)
+			if not ok:
+				self.errors[name] = self.errors.get(name, 0) + 1
+
+	def report(self) -> dict:
+		report = {}
+		for name, durations in sorted(self.durations.items()):
+			durations = sorted(durations)
+			report[name] = {
+				'count': len(durations),
+				'errors': self.errors.get(name, 0),
+				'p50': round(percentile(durations, 50) * 1000, 1),
+				'p95': round(percentile(durations, 95) * 1000, 1),
+				'p99': round(percentile(durations, 99) * 1000, 1),
+			}
+		return report
+
+# scénario d'un élève
+thread_sessions = threading.local()
+
+def send(recorder: Recorder, base_url: str, method: str, path: str, name: str = None, **kwargs):
+	"""
+	Envoie une requête (avec une session HTTP par thread) et enregistre sa durée.
+
+	Returns:
+		requests.Response|None: La réponse, ou None en cas d'erreur réseau
+	"""
+
+	session = getattr(thread_sessions, 'session', None)
+	if session is None:
+		session = thread_sessions.session = requests.Session()
+
+	start = time.perf_counter()
+	try:
+		response = session.request(method, base_url + path, timeout=120, **kwargs)
+		response.content
+	except requests.RequestException:
+		recorder.add(name or path, time.perf_counter() - start, False)
+		return None
+	recorder.add(name or path, time.perf_counter() - start, response.status_code in (200, 304))
+	if response.headers.get('X-Session-Reauthenticated') == 'true':
+		with recorder.lock:
+			recorder.reauthenticated += 1
+	return response
+
+def login(recorder: Recorder, base_url: str, number: int) -> str|None:
+	"""
+	Connecte un élève : un sur quatre avec le jeton de l'application (méthode token), les autres avec leur mot de passe.
+
+	Returns:
+		str|None: Le token, ou None si la connexion a échoué trois fois
+	"""
+
+	body = {
+		'url': f'https://{number % 20:08x}.index-education.net/pronote/eleve.html',
+		'username': f'eleve{number}',
+		'password': 'motdepasse',
+	}
+	params = None
+	if number % 4 == 0:
+		body['uuid'] = f'appareil-{number}'
+		params = {'method': 'token'}
+
+	for _ in range(3):
+		response = send(recorder, base_url, 'POST', '/generatetoken', data=body, params=params)
+		if response is not None and response.status_code == 200 and response.json().get('token'):
+			return response.json()['token']
+	return None
+
+def run_user(recorder: Recorder, base_url: str, number: int, rounds: int, session_timeout: float = 0) -> None:
+	"""
+	Simule un élève : connexion, puis chaque route de l'API à chaque tour (les dates avancent d'une semaine par tour).
+	Avec session_timeout, l'élève attend entre deux tours que son token soit inactif, pour que le serveur le reconnecte.
+	"""
+
+	token = login(recorder, base_url, number)
+	if token is None:
+		return
+	discussions = None
+
+	for round_number in range(rounds):
+		if round_number > 0 and session_timeout > 0:
+			time.sleep(session_timeout + 0.5)
+
+		send(recorder, base_url, 'GET', '/infos')
+		user = send(recorder, base_url, 'GET', '/user', params={'token': token})
+		if user is not None and user.status_code == 498:
+			# le serveur n'a pas pu reconnecter le token (erreur de Pronote) : l'application se reconnecte
+			token = login(recorder, base_url, number)
+			if token is None:
+				return
+		if number % 4 == 0:
+			send(recorder, base_url, 'GET', '/credentials', params={'token': token})
+		if number % 10 == 0:
+			send(recorder, base_url, 'GET', '/metrics')
+
+		monday = FIRST_DAY + datetime.timedelta(weeks=round_number)
+		friday = monday + datetime.timedelta(days=4)
+		week = {'token': token, 'dateFrom': monday.isoformat(), 'dateTo': friday.isoformat()}
+		day = {'token': token, 'dateString': monday.isoformat()}
+
+		send(recorder, base_url, 'GET', '/timetable', params=day)
+		send(recorder, base_url, 'GET', '/timetable/range', params=week)
+		send(recorder, base_url, 'GET', '/content', params=day)
+		homework = send(recorder, base_url, 'GET', '/homework', params=week)
+		send(recorder, base_url, 'GET', '/homework', '/homework?stream=ndjson', params=dict(week, stream='ndjson'))
+		send(recorder, base_url, 'GET', '/grades', params={'token': token})
+		send(recorder, base_url, 'GET', '/grades/stats', params={'token': token})
+		send(recorder, base_url, 'GET', '/evaluations', params={'token': token})
+		send(recorder, base_url, 'GET', '/absences', params={'token': token})
+		send(recorder, base_url, 'GET', '/delays', params={'token': token})
+		send(recorder, base_url, 'GET', '/punishments', params={'token': token})
+		send(recorder, base_url, 'GET', '/news', params={'token': token})
+		send(recorder, base_url, 'GET', '/news', '/news?stream=ndjson', params={'token': token, 'stream': 'ndjson'})
+		discussions = send(recorder, base_url, 'GET', '/discussions', params={'token': token})
+		send(recorder, base_url, 'GET', '/recipients', params={'token': token})
+		send(recorder, base_url, 'GET', '/menu', params=week)
+		send(recorder, base_url, 'GET', '/export/ical', params={'token': token})
+		send(recorder, base_url, 'POST', '/batch', json={'token': token, 'requests': [
+			{'endpoint': '/user', 'params': {}},
+			{'endpoint': '/timetable', 'params': {'dateString': friday.isoformat()}},
+			{'endpoint': '/grades', 'params': {}},
+		]})
+
+		# routes d'écriture
+		if homework is not None and homework.status_code == 200 and homework.json():
+			send(recorder, base_url, 'POST', '/homework/changeState', params=dict(week, homeworkId=homework.json()[0]['local_id']))
+		if discussions is not None and discussions.status_code == 200 and discussions.json():
+			discussion = discussions.json()[round_number % len(discussions.json())]['id']
+			send(recorder, base_url, 'POST', '/discussion/readState', params={'token': token, 'discussionId': discussion})
+			send(recorder, base_url, 'POST', '/discussion/reply', params={'token': token, 'discussionId': discussion, 'content': 'Merci !'})
+		send(recorder, base_url, 'POST', '/discussion/create', params={'token': token, 'subject': 'Question', 'content': 'Bonjour', 'recipientsId': json.dumps(['recipient-1'])})
+		send(recorder, base_url, 'POST', '/changePeriod', params={'token': token, 'periodName': ('Trimestre 1', 'Trimestre 2', 'Trimestre 3')[round_number % 3]})
+
+	if discussions is not None and discussions.status_code == 200 and discussions.json():
+		send(recorder, base_url, 'POST', '/discussion/delete', params={'token': token, 'discussionId': discussions.json()[-1]['id']})
+
+# lancement
+def free_port() -> int:
+	with socket.socket() as sock:
+		sock.bind(('127.0.0.1', 0))
+		return sock.getsockname()[1]
+
+def start_server(args: argparse.Namespace, port: int) -> subprocess.Popen:
+	"""
+	Lance le serveur avec le faux pronotepy et attend qu'il réponde.
+	"""
+
+	env = dict(os.environ,
+		PAPILLON_HOST='127.0.0.1',
+		PAPILLON_PORT=str(port),
+		PAPILLON_WORKERS=str(args.workers),
+		PAPILLON_WORKER_PORT_BASE=str(free_port()),
+		PAPILLON_SESSION_BACKEND='none',
+		BENCH_LATENCY=str(args.latency),
+		BENCH_LOGIN_LATENCY=str(args.login_latency),
+		BENCH_SIZE=str(args.size),
+		BENCH_FAILURES=str(args.failures),
+	)
+	if args.session_timeout > 0:
+		env.update(PAPILLON_SESSION_TIMEOUT=str(args.session_timeout), PAPILLON_SESSION_REAUTH='3600')
+	# un groupe de processus à part pour pouvoir arrêter aussi les workers
+	server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve'], cwd=BASE_DIR, env=env, start_new_session=True,
+		stdout=None if args.verbose else subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+
+	deadline = time.time() + 30
+	while time.time() < deadline:
+		if server.poll() is not None:
+			raise SystemExit(f'Le serveur s\'est arrêté (code {server.returncode}), relancer avec --verbose')
+		try:
+			if requests.get(f'http://127.0.0.1:{port}/infos', timeout=1).status_code == 200:
+				return server
+		except requests.RequestException:
+			pass
+		time.sleep(0.2)
+	stop_server(server)
+	raise SystemExit('Le serveur n\'a pas démarré en 30 s, relancer avec --verbose')
+
+def stop_server(server: subprocess.Popen) -> None:
+	"""
+	Arrête le serveur et ses workers.
+	"""
+
+	try:
+		if hasattr(os, 'killpg'):
+			os.killpg(server.pid, signal.SIGTERM)
+		else:
+			server.terminate()
+		server.wait(timeout=10)
+	except ProcessLookupError:
+		pass
+	except subprocess.TimeoutExpired:
+		if hasattr(os, 'killpg'):
+			os.killpg(server.pid, signal.SIGKILL)
+		else:
+			server.kill()
+
+def print_report(result: dict) -> None:
+	print(f"{'route':<28}{'requêtes':>9}{'erreurs':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+	for name, row in result['endpoints'].items():
+		print(f"{name:<28}{row['count']:>9}{row['errors']:>9}{row['p50']:>10}{row['p95']:>10}{row['p99']:>10}")
+	print()
+	print(f"{result['requests']} requêtes en {result['duration']} s : {result['throughput']} req/s, {result['errors']} erreurs")
+	if result.get('reauthenticated'):
+		print(f"{result['reauthenticated']} tokens reconnectés par le serveur")
+	if result['memory'] is not None:
+		print(f"Mémoire du serveur : {result['memory']['start']['rss']} Mio au démarrage, {result['memory']['end']['rss']} Mio à la fin, {result['memory']['end']['peak']} Mio au max")
+
+def compare(result: dict, baseline: dict, tolerance: float, min_delta: float) -> list[str]:
+	"""
+	Compare le p95 de chaque route et le débit avec des résultats précédents.
+
+	Returns:
+		list[str]: Les régressions trouvées
+	"""
+
+	regressions = []
+	for name, row in result['endpoints'].items():
+		before = baseline.get('endpoints', {}).get(name)
+		if before is not None and row['p95'] > before['p95'] * (1 + tolerance) and row['p95'] - before['p95'] > min_delta:
+			regressions.append(f"{name} : p95 {before['p95']} ms -> {row['p95']} ms")
+	if baseline.get('throughput') and result['throughput'] < baseline['throughput'] * (1 - tolerance):
+		regressions.append(f"débit : {baseline['throughput']} -> {result['throughput']} req/s")
+	if result['errors'] > baseline.get('errors', 0):
+		regressions.append(f"erreurs : {baseline.get('errors', 0)} -> {result['errors']}")
+	return regressions
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description='Banc d\'essai de papillon-python avec une fausse instance Pronote.')
+	parser.add_argument('--users', type=int, default=50, help='nombre d\'élèves simulés (défaut : 50)')
+	parser.add_argument('--rounds', type=int, default=3, help='nombre de passages sur toutes les routes par élève (défaut : 3)')
+	parser.add_argument('--concurrency', type=int, default=16, help='nombre d\'élèves actifs en même temps (défaut : 16)')
+	parser.add_argument('--latency', type=float, default=50, help='temps de réponse moyen de la fausse instance Pronote en ms (défaut : 50)')
+	parser.add_argument('--login-latency', type=float, default=500, help='temps d\'une connexion en ms (défaut : 500)')
+	parser.add_argument('--size', type=int, default=1, help='multiplie la quantité de données renvoyées (défaut : 1)')
+	parser.add_argument('--workers', type=int, default=1, help='valeur de PAPILLON_WORKERS pour le serveur (défaut : 1)')
+	parser.add_argument('--failures', type=float, default=0, help='proportion des appels à la fausse instance qui échouent avec PronoteAPIError (défaut : 0)')
+	parser.add_argument('--session-timeout', type=int, default=0, help='valeur de PAPILLON_SESSION_TIMEOUT pour le serveur, avec PAPILLON_SESSION_REAUTH : les élèves attendent ce temps entre deux tours (défaut : 0, désactivé)')
+	parser.add_argument('--url', help='utiliser un serveur déjà lancé (avec le faux pronotepy) au lieu d\'en lancer un')
+	parser.add_argument('--save', help='écrire les résultats dans ce fichier JSON')
+	parser.add_argument('--compare', help='comparer avec un fichier JSON écrit par --save (code de sortie 1 en cas de régression)')
+	parser.add_argument('--tolerance', type=float, default=0.2, help='augmentation relative tolérée du p95 et baisse du débit avec --compare (défaut : 0.2)')
+	parser.add_argument('--min-delta', type=float, default=5, help='écart de p95 ignoré avec --compare, en ms (défaut : 5)')
+	parser.add_argument('--verbose', action='store_true', help='afficher la sortie du serveur')
+	parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.serve:
+		serve()
+		return
+
+	server = None
+	if args.url:
+		base_url = args.url.rstrip('/')
+	else:
+		port = free_port()
+		server = start_server(args, port)
+		base_url = f'http://127.0.0.1:{port}'
+
+	try:
+		memory_start = server_memory(server.pid) if server is not None else None
+		recorder = Recorder()
+		start = time.perf_counter()
+		with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+			for future in [pool.submit(run_user, recorder, base_url, number, args.rounds, args.session_timeout) for number in range(args.users)]:
+				future.result()
+		duration = time.perf_counter() - start
+		memory_end = server_memory(server.pid) if server is not None else None
+	finally:
+		if server is not None:
+			stop_server(server)
+
+	endpoints = recorder.report()
+	requests_count = sum(row['count'] for row in endpoints.values())
+	result = {
+		'settings': {key: value for key, value in vars(args).items() if key in ('users', 'rounds', 'concurrency', 'latency', 'login_latency', 'size', 'workers', 'failures', 'session_timeout')},
+		'endpoints': endpoints,
+		'requests': requests_count,
+		'errors': sum(row['errors'] for row in endpoints.values()),
+		'duration': round(duration, 2),
+		'throughput': round(requests_count / duration, 1),
+		'reauthenticated': recorder.reauthenticated,
+		'memory': {'start': memory_start, 'end': memory_end} if memory_start is not None and memory_end is not None else None,
+	}
+	print_report(result)
+
+	if args.save:
+		with open(args.save, 'w', encoding='utf8') as file:
+			json.dump(result, file, indent=2, ensure_ascii=False)
+
+	if args.compare:
+		with open(args.compare, 'r', encoding='utf8') as file:
+			regressions = compare(result, json.load(file), args.tolerance, args.min_delta)
+		if regressions:
+			print('\nRégressions :')
+			for regression in regressions:
+				print(f'- {regression}')
+			sys.exit(1)
+		print('\nAucune régression')
+
+if __name__ == '__main__':
+	main()
@@ -13,7 +13,7 @@ start_api() {
         rm maintenance.json
         wget https://cdn.tryon-lab.fr/papillon/maintenance.json 
         echo "Papillon    ^|^e   Lancement de l'api"
-        python3.11 -m hug -f server.py
+        python3.11 server.py
 }
 
 while true; do
@@ -8,6 +8,26 @@ import secrets
 import falcon
 import json
 import socket
+import os
+import threading
+import collections
+import concurrent.futures
+import urllib.parse
+import requests
+import urllib3
+import sqlite3
+import atexit
+import abc
+import io
+import sys
+import hashlib
+import base64
+import hmac
+import bisect
+import array
+import functools
+import signal
+from wsgiref.simple_server import make_server, WSGIServer
 
 
 import resource
@@ -15,6 +35,7 @@ resource.setrlimit(resource.RLIMIT_CORE, (resource.RLIM_INFINITY, resource.RLIM_
 
 # importe les ENT
 from pronotepy.ent import *
+from Crypto.Cipher import AES # installé avec pronotepy
 
 API_VERSION = open('VERSION', 'r').read().strip()
 MAINTENANCE = json.load(open('maintenance.json', 'r', encoding='utf8'))
@@ -28,12 +49,12 @@ def CORS(request, response, resource):
 	response.set_header(
 		'Access-Control-Allow-Headers',
 		'Authorization,Keep-Alive,User-Agent,'
-		'If-Modified-Since,Cache-Control,Content-Type'
+		'If-Modified-Since,If-None-Match,Cache-Control,Content-Type'
 	)
 	response.set_header(
 		'Access-Control-Expose-Headers',
 		'Authorization,Keep-Alive,User-Agent,'
-		'If-Modified-Since,Cache-Control,Content-Type'
+		'If-Modified-Since,Cache-Control,Content-Type,ETag,X-Session-Reauthenticated'
 	)
 	if request.method == 'OPTIONS':
 		response.set_header('Access-Control-Max-Age', 1728000)
@@ -41,57 +62,1964 @@ def CORS(request, response, resource):
 		response.set_header('Content-Length', 0)
 		response.status_code = hug.HTTP_204
 
+# réponses conditionnelles : chaque réponse GET porte l'empreinte de son contenu (ETag),
+# si le client renvoie la même empreinte (If-None-Match) il reçoit un 304 sans contenu
+@hug.response_middleware()
+def ETag(request, response, resource):
+	if request.method != 'GET' or response.data is None or not response.status.startswith('200'):
+		return
+	# réponses à ne pas garder (identifiants)
+	if response.get_header('Cache-Control') == 'no-store':
+		return
+
+	etag = '"' + hashlib.sha1(response.data).hexdigest() + '"'
+	response.set_header('ETag', etag)
+	response.set_header('Cache-Control', 'private, no-cache')
+
+	if __etag_matches(request, etag):
+		response.status = falcon.HTTP_304
+		response.data = None
+
+def __etag_matches(request, etag: str) -> bool:
+	"""
+	Vérifie si l'en-tête If-None-Match de la requête contient l'empreinte (les données du client sont à jour).
+	"""
+
+	if_none_match = request.get_header('If-None-Match')
+	if if_none_match is None:
+		return False
+	tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+	return etag in tags or '*' in tags
+
+# sérialisation JSON : orjson s'il est installé (bien plus rapide), sinon le module json
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+def json_default(obj):
+	"""
+	Convertit les objets que le JSON ne connaît pas, en particulier les dates.
+	Les routes renvoient directement les datetime de pronotepy : ils sont formatés ici, une seule fois, au format "%Y-%m-%d %H:%M".
+
+	Args:
+		obj (Any): L'objet à convertir
+
+	Raises:
+		TypeError: si l'objet n'est pas sérialisable
+
+	Returns:
+		str|list: L'objet converti.
+	"""
+
+	if isinstance(obj, datetime.datetime):
+		# isoformat donne le même résultat que strftime("%Y-%m-%d %H:%M") pour une date sans fuseau, en trois fois moins de temps
+		if obj.tzinfo is None:
+			return obj.isoformat(' ', 'minutes')
+		return obj.strftime("%Y-%m-%d %H:%M")
+	if isinstance(obj, datetime.date):
+		return obj.isoformat() + ' 00:00'
+	if isinstance(obj, (set, frozenset)):
+		return list(obj)
+	raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+def dump_json(data) -> bytes:
+	"""
+	Sérialise des données en JSON (UTF-8).
+
+	Args:
+		data (Any): Les données à sérialiser
+
+	Returns:
+		bytes: Le JSON encodé en UTF-8.
+	"""
+
+	if orjson is not None:
+		return orjson.dumps(data, default=json_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+	return json.dumps(data, default=json_default, ensure_ascii=False, separators=(',', ':')).encode('utf8')
+
+serialized_response = threading.local() # data, body : le JSON déjà produit pour une réponse qui vient d'être mise en cache (voir __get_cached_data)
+
+@hug.default_output_format(content_type='application/json; charset=utf-8')
+def json_output(content, request=None, response=None):
+	# les flux (fichiers, exports...) sont transmis tels quels comme avec la sortie JSON de hug
+	if hasattr(content, 'read'):
+		return content
+	if content is not None and content is getattr(serialized_response, 'data', None):
+		body = serialized_response.body
+		serialized_response.data = serialized_response.body = None
+		return body
+	start = time.perf_counter()
+	data = dump_json(content)
+	request_timings.serialization = getattr(request_timings, 'serialization', 0) + time.perf_counter() - start
+	return data
+
+# métriques (format Prometheus, voir /metrics)
+metrics_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30) # les limites en sec des histogrammes de durée
+
+class Metrics:
+	"""
+	Compteurs et histogrammes du processus, exportés au format texte de Prometheus.
+	Chaque série est identifiée par son nom et ses labels (tuple de couples (nom, valeur)).
+	"""
+
+	def __init__(self, buckets: tuple = metrics_buckets):
+		self.buckets = buckets
+		self.counters = {} # (nom, labels) -> valeur
+		self.histograms = {} # (nom, labels) -> [compte par limite..., compte au-delà, somme, total]
+		self.help = {} # nom -> (type, description)
+		self.lock = threading.Lock()
+
+	def describe(self, name: str, kind: str, description: str) -> None:
+		self.help[name] = (kind, description)
+
+	def inc(self, name: str, labels: tuple = (), value: float = 1) -> None:
+		"""
+		Incrémente un compteur.
+
+		Args:
+			name (str): Le nom du compteur
+			labels (tuple, optional): Les labels, sous la forme ((nom, valeur), ...). Defaults to ().
+			value (float, optional): L'incrément. Defaults to 1.
+		"""
+
+		with self.lock:
+			self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+	def observe(self, name: str, labels: tuple, seconds: float) -> None:
+		"""
+		Ajoute une durée à un histogramme.
+
+		Args:
+			name (str): Le nom de l'histogramme
+			labels (tuple): Les labels, sous la forme ((nom, valeur), ...)
+			seconds (float): La durée en secondes
+		"""
+
+		with self.lock:
+			histogram = self.histograms.get((name, labels))
+			if histogram is None:
+				histogram = self.histograms[(name, labels)] = [0] * (len(self.buckets) + 3)
+			histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+			histogram[-2] += seconds
+			histogram[-1] += 1
+
+	@staticmethod
+	def __labels(labels: tuple, extra: tuple = ()) -> str:
+		labels = labels + extra
+		if not labels:
+			return ''
+		escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for name, value in labels)
+		return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+	def render(self, gauges: list[tuple] = ()) -> str:
+		"""
+		Exporte toutes les séries au format texte de Prometheus.
+
+		Args:
+			gauges (list[tuple], optional): Des valeurs instantanées à ajouter, sous la forme (nom, labels, valeur). Defaults to ().
+
+		Returns:
+			str: Le texte à renvoyer sur /metrics
+		"""
+
+		with self.lock:
+			counters = sorted(self.counters.items())
+			histograms = sorted((key, list(value)) for key, value in self.histograms.items())
+
+		lines = []
+		described = set()
+		def header(name):
+			if name not in described and name in self.help:
+				kind, description = self.help[name]
+				lines.append(f'# HELP {name} {description}')
+				lines.append(f'# TYPE {name} {kind}')
+				described.add(name)
+
+		for name, labels, value in gauges:
+			header(name)
+			lines.append(f'{name}{self.__labels(labels)} {value}')
+		for (name, labels), value in counters:
+			header(name)
+			lines.append(f'{name}{self.__labels(labels)} {value}')
+		for (name, labels), histogram in histograms:
+			header(name)
+			cumulative = 0
+			for bucket, count in zip(self.buckets + ('+Inf',), histogram):
+				cumulative += count
+				lines.append(f'{name}_bucket{self.__labels(labels, (("le", bucket),))} {cumulative}')
+			lines.append(f'{name}_sum{self.__labels(labels)} {histogram[-2]}')
+			lines.append(f'{name}_count{self.__labels(labels)} {histogram[-1]}')
+		return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+metrics.describe('papillon_requests_total', 'counter', 'Requêtes HTTP traitées, par route, méthode et statut')
+metrics.describe('papillon_request_duration_seconds', 'histogram', 'Durée totale des requêtes HTTP, par route')
+metrics.describe('papillon_request_upstream_seconds', 'histogram', 'Temps passé à attendre Pronote pendant une requête, par route')
+metrics.describe('papillon_request_serialization_seconds', 'histogram', 'Temps passé à sérialiser la réponse en JSON, par route')
+metrics.describe('papillon_upstream_calls_total', 'counter', 'Appels à Pronote, par instance')
+metrics.describe('papillon_upstream_errors_total', 'counter', 'Appels à Pronote en erreur ou hors délai, par instance')
+metrics.describe('papillon_upstream_duration_seconds', 'histogram', 'Durée des appels à Pronote, par instance')
+metrics.describe('papillon_cache_hits_total', 'counter', 'Réponses servies depuis le cache, par route')
+metrics.describe('papillon_cache_misses_total', 'counter', 'Réponses absentes du cache, par route')
+metrics.describe('papillon_sessions', 'gauge', 'Jetons gardés en mémoire')
+metrics.describe('papillon_sessions_evicted_total', 'counter', 'Jetons supprimés car le stockage était plein')
+metrics.describe('papillon_sessions_expired_total', 'counter', 'Jetons supprimés car expirés')
+metrics.describe('papillon_cache_bytes', 'gauge', 'Taille totale des caches de réponses (octets de JSON)')
+metrics.describe('papillon_establishment_cache_bytes', 'gauge', 'Taille du cache partagé par établissement (octets de JSON)')
+
+request_timings = threading.local() # temps passé dans Pronote et dans la sérialisation pour la requête en cours du thread
+
+@hug.request_middleware()
+def start_request_timer(request, response):
+	request.context['started'] = time.perf_counter()
+	request_timings.upstream = 0
+	request_timings.serialization = 0
+	serialized_response.data = serialized_response.body = None
+
+@hug.response_middleware()
+def record_request_metrics(request, response, resource):
+	started = request.context.get('started')
+	if started is None:
+		return
+
+	endpoint = request.uri_template if resource is not None and request.uri_template else 'unknown'
+	status = response.status.split(' ')[0]
+
+	def record():
+		metrics.inc('papillon_requests_total', (('endpoint', endpoint), ('method', request.method), ('status', status)))
+		labels = (('endpoint', endpoint),)
+		metrics.observe('papillon_request_duration_seconds', labels, time.perf_counter() - started)
+		metrics.observe('papillon_request_upstream_seconds', labels, getattr(request_timings, 'upstream', 0))
+		metrics.observe('papillon_request_serialization_seconds', labels, getattr(request_timings, 'serialization', 0))
+
+	# une réponse NDJSON appelle Pronote pendant l'envoi du corps, après ce middleware : elle est mesurée à sa fermeture
+	if isinstance(response.stream, NDJSONStream):
+		response.stream.on_close = record
+	else:
+		record()
+
+# reconnexions automatiques (PAPILLON_SESSION_REAUTH) : la réponse d'une requête dont le client a été reconnecté
+# porte l'en-tête X-Session-Reauthenticated, pour que l'application récupère ses nouveaux identifiants (/credentials)
+request_session = threading.local() # reauthenticated : le client de la requête en cours du thread a été reconnecté à Pronote
+
+@hug.request_middleware()
+def reset_session_state(request, response):
+	request_session.reauthenticated = False
+
+@hug.response_middleware()
+def add_session_headers(request, response, resource):
+	if getattr(request_session, 'reauthenticated', False):
+		response.set_header('X-Session-Reauthenticated', 'true')
+
 # système de tokens
-saved_clients = {}
+client_timeout_threshold = int(os.environ.get('PAPILLON_SESSION_TIMEOUT', 300)) # le temps en sec avant qu'un jeton ne soit rendu invalide
+session_reauth_window = int(os.environ.get('PAPILLON_SESSION_REAUTH', 0)) # le temps en sec pendant lequel un jeton inactif est reconnecté automatiquement au lieu d'expirer (0 pour désactiver)
+session_lifetime = max(client_timeout_threshold, session_reauth_window) # le temps en sec avant qu'un jeton inactif ne soit supprimé
+session_max_count = int(os.environ.get('PAPILLON_SESSION_MAX', 5000)) # le nombre max de clients gardés en mémoire
+session_shard_count = int(os.environ.get('PAPILLON_SESSION_SHARDS', 16)) # le nombre de sous-dictionnaires (chacun avec son verrou)
+session_sweep_interval = int(os.environ.get('PAPILLON_SESSION_SWEEP_INTERVAL', 60)) # le temps en sec entre deux nettoyages des jetons expirés
+client_memory_estimate = 256 * 1024 # estimation de la mémoire occupée par un pronotepy.Client (en octets)
+session_tombstone_lifetime = 24 * 3600 # le temps en sec pendant lequel un jeton supprimé par le nettoyage est encore signalé comme expiré
+
+class SessionStore:
+	"""
+	Stockage des clients par jeton, borné et découpé en plusieurs sous-dictionnaires.
+
+	Chaque sous-dictionnaire a son propre verrou et garde ses jetons dans l'ordre d'utilisation :
+	quand il est plein, le jeton le moins récemment utilisé est supprimé et sa session HTTP fermée.
+	Un thread de nettoyage supprime régulièrement les jetons expirés.
+	Les entrées créées par /generatetoken sont aussi indexées par identifiants (voir __get_login_key) pour être réutilisées.
+	"""
+
+	def __init__(self, max_count: int = session_max_count, shard_count: int = session_shard_count):
+		self.shards = [collections.OrderedDict() for _ in range(shard_count)]
+		self.locks = [threading.Lock() for _ in range(shard_count)]
+		self.max_shard_count = max(1, max_count // shard_count)
+		self.evicted = 0
+		self.expired = 0
+		self.sweeper = None
+		self.logins = {} # clé des identifiants -> (jeton, entrée)
+		self.logins_lock = threading.Lock()
+		self.tombstones = collections.OrderedDict() # jeton supprimé par sweep -> date de suppression
+		self.tombstones_lock = threading.Lock()
+		self.max_tombstones = max_count
+
+	def __shard(self, token: str) -> int:
+		return hash(token) % len(self.shards)
+
+	def get(self, token: str) -> dict|None:
+		"""
+		Récupère l'entrée associée à un jeton et la marque comme la plus récemment utilisée.
+
+		Args:
+			token (str): Le jeton
+
+		Returns:
+			dict|None: L'entrée (client, last_interaction, cache...) ou None si le jeton est inconnu.
+		"""
+
+		i = self.__shard(token)
+		with self.locks[i]:
+			entry = self.shards[i].get(token)
+			if entry is not None:
+				self.shards[i].move_to_end(token)
+			return entry
+
+	def pop(self, token: str) -> dict|None:
+		"""
+		Supprime un jeton et ferme la session HTTP de son client.
+
+		Args:
+			token (str): Le jeton
+
+		Returns:
+			dict|None: L'entrée supprimée ou None si le jeton est inconnu.
+		"""
+
+		i = self.__shard(token)
+		with self.locks[i]:
+			entry = self.shards[i].pop(token, None)
+		if entry is not None:
+			self.__close(entry)
+		return entry
+
+	def find_login(self, login_key: str, timeout: int = client_timeout_threshold) -> tuple[str, dict]|None:
+		"""
+		Retrouve le jeton encore valide d'un client connecté avec les mêmes identifiants.
+
+		Args:
+			login_key (str): La clé des identifiants (voir __get_login_key)
+			timeout (int, optional): Le temps en sec avant qu'un jeton ne soit considéré comme expiré. Defaults to client_timeout_threshold.
+
+		Returns:
+			tuple[str, dict]|None: Le jeton et son entrée, ou None si aucun client valide n'existe.
+		"""
+
+		with self.logins_lock:
+			login = self.logins.get(login_key)
+		if login is None:
+			return None
+
+		token, entry = login
+		if self.get(token) is not entry or time.time() - entry['last_interaction'] >= timeout or not entry['client'].logged_in:
+			return None
+		return login
+
+	def share(self, token: str, entry: dict, client) -> dict:
+		"""
+		Ouvre un nouveau jeton sur le client d'une entrée existante (même verrou, même cache).
+		La session HTTP du client n'est fermée qu'à la suppression du dernier jeton qui l'utilise.
+
+		Args:
+			token (str): Le nouveau jeton
+			entry (dict): L'entrée dont le client est partagé
+			client (SessionClient): Le client du nouveau jeton, avec sa propre période
+
+		Returns:
+			dict: L'entrée du nouveau jeton
+		"""
+
+		with self.logins_lock:
+			shared = entry.setdefault('shared', {'count': 1})
+			shared['count'] += 1
+		self[token] = {
+			'client': client,
+			'last_interaction': time.time(),
+			'cache': entry['cache'],
+			'lock': entry['lock'],
+			'login_key': entry.get('login_key'),
+			'shared': shared
+		}
+		return self.get(token)
+
+	def __getitem__(self, token: str) -> dict:
+		entry = self.get(token)
+		if entry is None:
+			raise KeyError(token)
+		return entry
+
+	def __setitem__(self, token: str, entry: dict) -> None:
+		i = self.__shard(token)
+		evicted = []
+		with self.locks[i]:
+			shard = self.shards[i]
+			shard[token] = entry
+			shard.move_to_end(token)
+			while len(shard) > self.max_shard_count:
+				evicted.append(shard.popitem(last=False)[1])
+			self.evicted += len(evicted)
+		if entry.get('login_key') is not None:
+			with self.logins_lock:
+				self.logins[entry['login_key']] = (token, entry)
+		if self.tombstones:
+			with self.tombstones_lock:
+				self.tombstones.pop(token, None)
+		for old_entry in evicted:
+			self.__close(old_entry)
+
+	def __delitem__(self, token: str) -> None:
+		if self.pop(token) is None:
+			raise KeyError(token)
+
+	def __contains__(self, token: str) -> bool:
+		i = self.__shard(token)
+		with self.locks[i]:
+			return token in self.shards[i]
+
+	def __len__(self) -> int:
+		return sum(len(shard) for shard in self.shards)
+
+	def items(self) -> list[tuple[str, dict]]:
+		"""
+		Retourne une copie de la liste des couples (jeton, entrée).
+
+		Returns:
+			list[tuple[str, dict]]: Les jetons et leurs entrées
+		"""
+
+		items = []
+		for i, shard in enumerate(self.shards):
+			with self.locks[i]:
+				items.extend(shard.items())
+		return items
+
+	def __close(self, entry: dict) -> None:
+		with self.logins_lock:
+			login_key = entry.get('login_key')
+			if login_key is not None and self.logins.get(login_key, (None, None))[1] is entry:
+				del self.logins[login_key]
+			shared = entry.get('shared')
+			if shared is not None:
+				shared['count'] -= 1
+				if shared['count'] > 0:
+					return # le client est encore utilisé par un autre jeton
+		try:
+			upstream_hosts.release(entry['client'])
+			entry['client'].communication.session.close()
+		except Exception as e:
+			print(f"Error while closing a session: {e}")
+
+	def pop_expired(self, token: str) -> bool:
+		"""
+		Indique si un jeton a été supprimé par sweep, et l'oublie (comme un jeton expiré supprimé par get_client).
+
+		Args:
+			token (str): Le jeton
+
+		Returns:
+			bool: True si le jeton a été supprimé par sweep depuis moins de session_tombstone_lifetime secondes
+		"""
+
+		with self.tombstones_lock:
+			return self.tombstones.pop(token, None) is not None
+
+	def sweep(self, timeout: int = session_lifetime) -> int:
+		"""
+		Supprime les jetons dont la dernière intéraction date de plus de timeout secondes.
+		Les jetons supprimés sont gardés dans tombstones pour être signalés comme expirés (voir pop_expired).
+
+		Args:
+			timeout (int, optional): Le temps en sec avant qu'un jeton ne soit supprimé. Defaults to session_lifetime.
+
+		Returns:
+			int: Le nombre de jetons supprimés
+		"""
+
+		now = time.time()
+		expired = []
+		for i, shard in enumerate(self.shards):
+			with self.locks[i]:
+				for token in [token for token, entry in shard.items() if now - entry['last_interaction'] >= timeout]:
+					expired.append((token, shard.pop(token)))
+		self.expired += len(expired)
+
+		with self.tombstones_lock:
+			while self.tombstones and next(iter(self.tombstones.values())) < now - session_tombstone_lifetime:
+				self.tombstones.popitem(last=False)
+			for token, entry in expired:
+				self.tombstones[token] = now
+			while len(self.tombstones) > self.max_tombstones:
+				self.tombstones.popitem(last=False)
+
+		for token, entry in expired:
+			self.__close(entry)
+		return len(expired)
+
+	def stats(self) -> dict:
+		"""
+		Récupère des statistiques sur les jetons gardés en mémoire.
+
+		Returns:
+			dict: Le nombre de jetons, de suppressions et une estimation de la mémoire occupée (en octets)
+		"""
+
+		cache_bytes = 0
+		for i, shard in enumerate(self.shards):
+			with self.locks[i]:
+				cache_bytes += sum(entry['cache'].size for entry in shard.values() if 'cache' in entry)
+		count = len(self)
+		return {
+			'sessions': count,
+			'max_sessions': self.max_shard_count * len(self.shards),
+			'evicted': self.evicted,
+			'expired': self.expired,
+			'cache_bytes': cache_bytes,
+			'memory_estimate': count * client_memory_estimate + cache_bytes,
+		}
+
+	def start_sweeper(self, interval: int = session_sweep_interval) -> None:
+		"""
+		Lance le thread de nettoyage des jetons expirés (une seule fois).
+
+		Args:
+			interval (int, optional): Le temps en sec entre deux nettoyages. Defaults to session_sweep_interval.
+		"""
+
+		if self.sweeper is not None:
+			return
+
+		def sweep_forever():
+			while True:
+				time.sleep(interval)
+				if self.sweep():
+					print(len(self), 'valid tokens')
+
+		self.sweeper = threading.Thread(target=sweep_forever, name='session-sweeper', daemon=True)
+		self.sweeper.start()
+
+saved_clients = SessionStore()
 """
 saved_clients ->
 	token ->
 		client -> instance de pronotepy.Client
 		last_interaction -> int (provenant de time.time(), entier représentant le temps depuis la dernière intéraction avec le client)
+		cache -> instance de ResponseCache (réponses des routes de lecture)
+		lock -> threading.Lock (un client Pronote ne supporte qu'une requête à la fois)
+		login_key -> str|None (empreinte des identifiants de connexion, voir __get_login_key)
+		shared -> dict (optionnel, {'count': int} : le nombre de jetons qui partagent le client, le verrou et le cache, voir SessionStore.share)
 """
-client_timeout_threshold = 300 # le temps en sec avant qu'un jeton ne soit rendu invalide
 
-def get_client(token: str) -> tuple[str, pronotepy.Client|None]:
-	"""Retourne le client Pronote associé au jeton.
+# sauvegarde des jetons (partagée entre les processus selon le stockage choisi)
+session_backend_url = os.environ.get('PAPILLON_SESSION_BACKEND', 'memory') # 'memory', 'sqlite:///chemin/vers/sessions.db' ou 'redis://hôte:port/0'
+if os.environ.get('PAPILLON_SESSION_SNAPSHOT'):
+	session_backend_url = 'sqlite:///' + os.environ['PAPILLON_SESSION_SNAPSHOT']
+
+session_key = os.environ.get('PAPILLON_SESSION_KEY', '') # la clé de chiffrement des mots de passe sauvegardés dans PAPILLON_SESSION_BACKEND (générée au démarrage si vide)
+
+class CredentialCipher:
+	"""
+	Chiffrement (AES-GCM) des mots de passe sauvegardés dans les stockages persistants des jetons.
+	Le jeton est authentifié avec le mot de passe : une ligne copiée sur un autre jeton ne se déchiffre pas.
+	"""
+
+	prefix = 'aesgcm:'
+
+	def __init__(self, secret: str):
+		self.generated = not secret
+		if self.generated:
+			secret = secrets.token_urlsafe(32)
+		self.key = hashlib.sha256(secret.encode('utf8')).digest()
+
+	def encrypt(self, token: str, value: str) -> str:
+		"""
+		Chiffre une valeur.
+
+		Args:
+			token (str): Le jeton auquel appartient la valeur
+			value (str): La valeur en clair
+
+		Returns:
+			str: La valeur chiffrée, en base64
+		"""
+
+		cipher = AES.new(self.key, AES.MODE_GCM)
+		cipher.update(token.encode('utf8'))
+		data, tag = cipher.encrypt_and_digest(value.encode('utf8'))
+		return self.prefix + base64.urlsafe_b64encode(cipher.nonce + tag + data).decode('ascii')
+
+	def decrypt(self, token: str, value: str) -> str|None:
+		"""
+		Déchiffre une valeur produite par encrypt.
+
+		Args:
+			token (str): Le jeton auquel appartient la valeur
+			value (str): La valeur chiffrée
+
+		Returns:
+			str|None: La valeur en clair, ou None si elle n'a pas été chiffrée avec cette clé (clé changée, ancienne ligne en clair)
+		"""
+
+		if not value.startswith(self.prefix):
+			return None
+		try:
+			raw = base64.urlsafe_b64decode(value[len(self.prefix):])
+			cipher = AES.new(self.key, AES.MODE_GCM, nonce=raw[:16])
+			cipher.update(token.encode('utf8'))
+			return cipher.decrypt_and_verify(raw[32:], raw[16:32]).decode('utf8')
+		except ValueError:
+			return None
+
+credential_cipher = CredentialCipher(session_key)
+
+class SessionBackend(abc.ABC):
+	"""
+	Stockage des informations nécessaires pour reconnecter un jeton (méthode, URL, identifiants, ENT, UUID, période sélectionnée).
+
+	Permet de reconnecter un jeton après un redémarrage, une suppression du SessionStore
+	ou sur un autre processus que celui qui l'a créé. Les stockages persistants chiffrent les mots de passe avec credential_cipher.
+	"""
+
+	def __init__(self):
+		self.flusher = None
+
+	@abc.abstractmethod
+	def save(self, token: str, method: str, url: str, username: str, password: str, ent: str|None = None, uuid: str|None = None, period: str|None = None) -> None:
+		"""
+		Sauvegarde (ou remplace) les informations de connexion d'un jeton.
+
+		Args:
+			token (str): Le jeton
+			method (str): La méthode de connexion utilisée ('url', 'qrcode' ou 'token')
+			url (str): L'URL de l'instance Pronote
+			username (str): Le nom d'utilisateur
+			password (str): Le mot de passe
+			ent (str, optional): Le nom de l'ENT. Defaults to None.
+			uuid (str, optional): L'UUID de l'appareil (connexion par jeton). Defaults to None.
+			period (str, optional): Le nom de la période sélectionnée. Defaults to None.
+		"""
+
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def set_period(self, token: str, period: str) -> None:
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def load(self, token: str) -> dict|None:
+		"""
+		Récupère les informations de connexion d'un jeton.
+
+		Args:
+			token (str): Le jeton
+
+		Returns:
+			dict|None: Les informations passées à save et last_interaction, ou None si le jeton n'est pas sauvegardé.
+		"""
+
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def delete(self, token: str) -> None:
+		raise NotImplementedError
+
+	@abc.abstractmethod
+	def flush(self, store: SessionStore) -> None:
+		"""
+		Enregistre la dernière intéraction des jetons en mémoire et supprime les jetons expirés.
+
+		Args:
+			store (SessionStore): Le stockage des clients
+		"""
+
+		raise NotImplementedError
+
+	def start_flusher(self, store: SessionStore, interval: int = session_sweep_interval) -> None:
+		"""
+		Lance le thread qui appelle flush régulièrement (une seule fois).
+
+		Args:
+			store (SessionStore): Le stockage des clients
+			interval (int, optional): Le temps en sec entre deux appels. Defaults to session_sweep_interval.
+		"""
+
+		if self.flusher is not None:
+			return
+
+		def flush_forever():
+			while True:
+				time.sleep(interval)
+				try:
+					self.flush(store)
+				except Exception as e:
+					print(f"Error while saving sessions: {e}")
+
+		self.flusher = threading.Thread(target=flush_forever, name='session-backend', daemon=True)
+		self.flusher.start()
+
+class MemorySessionBackend(SessionBackend):
+	"""
+	Stockage dans le processus : permet de reconnecter un jeton supprimé du SessionStore (limite de taille), mais pas après un redémarrage.
+	"""
+
+	def __init__(self):
+		super().__init__()
+		self.rows = {}
+		self.lock = threading.Lock()
+
+	def save(self, token: str, method: str, url: str, username: str, password: str, ent: str|None = None, uuid: str|None = None, period: str|None = None) -> None:
+		with self.lock:
+			self.rows[token] = {'token': token, 'method': method, 'url': url, 'username': username, 'password': password, 'ent': ent, 'uuid': uuid, 'period': period, 'last_interaction': time.time()}
+
+	def set_period(self, token: str, period: str) -> None:
+		with self.lock:
+			if token in self.rows:
+				self.rows[token]['period'] = period
+
+	def load(self, token: str) -> dict|None:
+		with self.lock:
+			row = self.rows.get(token)
+			return dict(row) if row is not None else None
+
+	def delete(self, token: str) -> None:
+		with self.lock:
+			self.rows.pop(token, None)
+
+	def flush(self, store: SessionStore) -> None:
+		touched = store.items()
+		limit = time.time() - session_lifetime
+		with self.lock:
+			for token, entry in touched:
+				if token in self.rows:
+					self.rows[token]['last_interaction'] = entry['last_interaction']
+			for token in [token for token, row in self.rows.items() if row['last_interaction'] < limit]:
+				del self.rows[token]
+
+class SQLiteSessionBackend(SessionBackend):
+	"""
+	Stockage dans un fichier SQLite, partagé par les processus d'une même machine et conservé entre les redémarrages.
+	Le fichier et ses fichiers -wal et -shm sont créés avec les droits 600 (SQLite donne ensuite aux fichiers -wal et -shm
+	les droits de la base) et les mots de passe y sont chiffrés.
+	"""
+
+	def __init__(self, path: str):
+		super().__init__()
+		self.path = path
+		self.lock = threading.Lock()
+		self.db = None
+		self.pid = None
+		with self.lock:
+			umask = os.umask(0o077)
+			try:
+				self.__connect()
+			finally:
+				os.umask(umask)
+			for suffix in ('', '-wal', '-shm'):
+				if os.path.exists(path + suffix):
+					os.chmod(path + suffix, 0o600)
+
+	def __connect(self) -> sqlite3.Connection:
+		# une connexion SQLite ne doit pas être partagée entre le processus principal et ses workers
+		if self.db is None or self.pid != os.getpid():
+			self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+			self.pid = os.getpid()
+			self.db.execute('PRAGMA journal_mode=WAL')
+			self.db.execute(
+				'CREATE TABLE IF NOT EXISTS sessions ('
+				'token TEXT PRIMARY KEY, method TEXT NOT NULL, url TEXT NOT NULL, username TEXT NOT NULL, password TEXT NOT NULL, '
+				'ent TEXT, uuid TEXT, period TEXT, last_interaction REAL NOT NULL)'
+			)
+		return self.db
+
+	def save(self, token: str, method: str, url: str, username: str, password: str, ent: str|None = None, uuid: str|None = None, period: str|None = None) -> None:
+		with self.lock:
+			self.__connect().execute(
+				'INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+				(token, method, url, username, credential_cipher.encrypt(token, password), ent, uuid, period, time.time())
+			)
+
+	def set_period(self, token: str, period: str) -> None:
+		with self.lock:
+			self.__connect().execute('UPDATE sessions SET period = ? WHERE token = ?', (period, token))
+
+	def load(self, token: str) -> dict|None:
+		with self.lock:
+			cursor = self.__connect().execute('SELECT * FROM sessions WHERE token = ?', (token,))
+			row = cursor.fetchone()
+			if row is None:
+				return None
+			row = dict(zip([column[0] for column in cursor.description], row))
+		row['password'] = credential_cipher.decrypt(token, row['password'])
+		return row if row['password'] is not None else None
+
+	def delete(self, token: str) -> None:
+		with self.lock:
+			self.__connect().execute('DELETE FROM sessions WHERE token = ?', (token,))
+
+	def flush(self, store: SessionStore) -> None:
+		touched = [(entry['last_interaction'], token) for token, entry in store.items()]
+		with self.lock:
+			db = self.__connect()
+			db.execute('BEGIN')
+			db.executemany('UPDATE sessions SET last_interaction = ? WHERE token = ?', touched)
+			db.execute('DELETE FROM sessions WHERE last_interaction < ?', (time.time() - session_lifetime,))
+			db.execute('COMMIT')
+
+class RedisSessionBackend(SessionBackend):
+	"""
+	Stockage dans un serveur compatible Redis, partagé par plusieurs machines.
+	Chaque jeton est un hash qui expire tout seul après session_lifetime secondes sans intéraction, avec le mot de passe chiffré.
+	"""
+
+	key_prefix = 'papillon:session:'
+
+	def __init__(self, url: str):
+		super().__init__()
+		try:
+			import redis
+		except ImportError:
+			raise RuntimeError('PAPILLON_SESSION_BACKEND=redis://... needs the redis package (pip3 install redis)')
+		self.redis = redis.Redis.from_url(url, decode_responses=True)
+
+	def save(self, token: str, method: str, url: str, username: str, password: str, ent: str|None = None, uuid: str|None = None, period: str|None = None) -> None:
+		row = {'method': method, 'url': url, 'username': username, 'password': credential_cipher.encrypt(token, password), 'ent': ent or '', 'uuid': uuid or '', 'period': period or ''}
+		pipeline = self.redis.pipeline()
+		pipeline.delete(self.key_prefix + token)
+		pipeline.hset(self.key_prefix + token, mapping=row)
+		pipeline.expire(self.key_prefix + token, session_lifetime)
+		pipeline.execute()
+
+	def set_period(self, token: str, period: str) -> None:
+		if self.redis.exists(self.key_prefix + token):
+			self.redis.hset(self.key_prefix + token, 'period', period)
+
+	def load(self, token: str) -> dict|None:
+		row = self.redis.hgetall(self.key_prefix + token)
+		if not row:
+			return None
+		for column in ('ent', 'uuid', 'period'):
+			row[column] = row.get(column) or None
+		row['password'] = credential_cipher.decrypt(token, row['password'])
+		if row['password'] is None:
+			return None
+		row['token'] = token
+		row['last_interaction'] = time.time() # la clé n'existe plus une fois expirée
+		return row
+
+	def delete(self, token: str) -> None:
+		self.redis.delete(self.key_prefix + token)
+
+	def flush(self, store: SessionStore) -> None:
+		pipeline = self.redis.pipeline(transaction=False)
+		for token, entry in store.items():
+			pipeline.expireat(self.key_prefix + token, int(entry['last_interaction'] + session_lifetime))
+		pipeline.execute()
+
+def __create_session_backend(url: str) -> SessionBackend|None:
+	"""
+	Crée le stockage des jetons à partir de son URL.
+
+	Args:
+		url (str): 'memory', 'sqlite:///chemin/vers/sessions.db', 'redis://hôte:port/0' ou 'none'
+
+	Returns:
+		SessionBackend|None: Le stockage, ou None si la sauvegarde des jetons est désactivée.
+	"""
+
+	if url in ('', 'none'):
+		return None
+	if url == 'memory':
+		return MemorySessionBackend()
+	if url.startswith(('sqlite:///', 'redis://', 'rediss://', 'unix://')) and credential_cipher.generated:
+		print('PAPILLON_SESSION_KEY is not set: saved sessions will not be restored after a restart')
+	if url.startswith('sqlite:///'):
+		return SQLiteSessionBackend(url[len('sqlite:///'):])
+	if url.startswith(('redis://', 'rediss://', 'unix://')):
+		return RedisSessionBackend(url)
+	raise ValueError(f'Unknown session backend: {url}')
+
+session_backend = __create_session_backend(session_backend_url)
+restore_locks = [threading.Lock() for _ in range(64)] # un seul rétablissement à la fois par jeton
+
+if session_backend is not None:
+	atexit.register(session_backend.flush, saved_clients)
+
+@hug.startup()
+def start_session_sweeper(api):
+	saved_clients.start_sweeper()
+	if session_backend is not None:
+		session_backend.start_flusher(saved_clients)
+	__start_prefetch_refresher()
+	__start_config_watcher()
+
+def __new_token() -> str:
+	"""
+	Génère un nouveau jeton. Avec plusieurs workers, le jeton commence par le numéro du worker qui l'a créé (voir worker_router).
+
+	Returns:
+		str: Le jeton
+	"""
+
+	token = secrets.token_urlsafe(16)
+	if worker_id is not None:
+		token = f'{worker_id}.{token}'
+	return token
+
+class SessionClient:
+	"""
+	Client Pronote partagé par un jeton ouvert avec les mêmes identifiants qu'un autre (voir __login).
+	Le jeton garde sa propre période sélectionnée (calculated_period), tout le reste est lu et modifié sur le client partagé.
+	"""
+
+	def __init__(self, client: pronotepy.Client, calculated_period: pronotepy.Period):
+		object.__setattr__(self, 'shared_client', client)
+		object.__setattr__(self, 'calculated_period', calculated_period)
+
+	def __getattr__(self, name: str):
+		return getattr(self.shared_client, name)
+
+	def __setattr__(self, name: str, value) -> None:
+		if name == 'calculated_period':
+			object.__setattr__(self, name, value)
+		else:
+			setattr(self.shared_client, name, value)
+
+	def __delattr__(self, name: str) -> None:
+		delattr(self.shared_client, name)
+
+def __open_session(token: str, client: pronotepy.Client, periodName: str|None = None, login_key: str|None = None) -> None:
+	"""
+	Sélectionne les périodes du client et l'enregistre dans saved_clients.
+
+	Args:
+		token (str): Le jeton
+		client (pronotepy.Client): Le client Pronote connecté
+		periodName (str, optional): Le nom de la période à sélectionner, sinon la période actuelle. Defaults to None.
+		login_key (str, optional): La clé des identifiants utilisés, pour réutiliser le client lors des prochaines connexions. Defaults to None.
+	"""
+
+	if periodName is None:
+		client.calculated_period = __get_current_period(client)
+	else:
+		client.calculated_period = __get_current_period(client, True, periodName)
+	client.activated_period = __get_current_period(client, False, None, True)
+
+	saved_clients[token] = {
+		'client': client,
+		'last_interaction': time.time(),
+		'cache': ResponseCache(),
+		'lock': threading.Lock(),
+		'login_key': login_key
+	}
+	__start_prefetch(token)
+
+def __restore_session(token: str) -> tuple[str, pronotepy.Client|None]:
+	"""
+	Reconnecte un jeton sauvegardé dans session_backend (après un redémarrage, une suppression du SessionStore ou sur un autre processus).
+
+	Args:
+		token (str): Le jeton
+
+	Returns:
+		tuple[str, pronotepy.Client|None]: Le statut (voir get_client) et le client reconnecté : 'notfound' si le jeton n'est pas sauvegardé,
+			'expired' s'il est sauvegardé mais a expiré ou si la connexion a échoué.
+	"""
+
+	if session_backend is None:
+		return 'notfound', None
+
+	with restore_locks[hash(token) % len(restore_locks)]:
+		# un autre thread a pu reconnecter le jeton pendant l'attente
+		client_dict = saved_clients.get(token)
+		if client_dict is not None:
+			return 'ok', client_dict['client']
+
+		row = session_backend.load(token)
+		if row is None:
+			return 'notfound', None
+		idle = time.time() - row['last_interaction']
+		if idle >= session_lifetime or (row['method'] != 'url' and not session_reauth_window):
+			session_backend.delete(token)
+			return 'expired', None
+
+		try:
+			if row['method'] == 'url':
+				client = __run_upstream(None, pronotepy.Client, row['url'], username=row['username'], password=row['password'], ent=getattr(pronotepy.ent, row['ent']) if row['ent'] else None, upstream_url=row['url'])
+			else:
+				client = __run_upstream(None, pronotepy.Client.token_login, pronote_url=row['url'], username=row['username'], password=row['password'], uuid=row['uuid'], upstream_url=row['url'])
+		except Exception as e:
+			print(f"Error while trying to restore a session on {row['url']}")
+			print(e)
+			session_backend.delete(token)
+			return 'expired', None
+
+		if not client.logged_in:
+			session_backend.delete(token)
+			return 'expired', None
+
+		__open_session(token, client, row['period'])
+		if row['method'] != 'url':
+			# le mot de passe d'une connexion par jeton change à chaque connexion
+			__save_session(token, client, row['method'])
+		if idle >= client_timeout_threshold:
+			request_session.reauthenticated = True
+		print(len(saved_clients), 'valid tokens')
+		return 'ok', client
+
+def __save_session(token: str, client: pronotepy.Client, method: str, body: dict|None = None) -> None:
+	"""
+	Sauvegarde les informations de reconnexion d'un jeton dans session_backend.
+	Les connexions par jeton ou QR code ne sont sauvegardées qu'avec PAPILLON_SESSION_REAUTH : leur mot de passe
+	change à chaque connexion et appartient à l'application (qui le récupère avec /credentials après une reconnexion).
+
+	Args:
+		token (str): Le jeton
+		client (pronotepy.Client): Le client Pronote connecté
+		method (str): La méthode de connexion ('url', 'qrcode' ou 'token')
+		body (dict, optional): Le corps de la requête /generatetoken (identifiants d'une connexion par URL). Defaults to None.
+	"""
+
+	if session_backend is None or not client.logged_in:
+		return
+	if method == 'url':
+		if body is not None:
+			session_backend.save(token, method, body['url'], body['username'], body['password'], body.get('ent'), None, client.calculated_period.name)
+	elif session_reauth_window:
+		session_backend.save(token, 'token', client.pronote_url, client.username, client.password, None, client.uuid, client.calculated_period.name)
+
+def __refresh_client(client: pronotepy.Client) -> None:
+	"""
+	Reconnecte le client à Pronote. Le pool partagé de l'instance est détaché avant que pronotepy
+	ne ferme l'ancienne session HTTP, puis rattaché à la nouvelle.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+	"""
+
+	upstream_hosts.release(client)
+	try:
+		client.refresh()
+	finally:
+		upstream_hosts.mount(client)
+
+def __reauthenticate(token: str, client_dict: dict) -> bool:
+	"""
+	Reconnecte à Pronote le client d'un jeton inactif depuis plus de client_timeout_threshold secondes (voir PAPILLON_SESSION_REAUTH).
+	Le client garde ses identifiants (mot de passe ou jeton de connexion de l'application), les données gardées
+	pour l'ancienne session Pronote (index, caches) sont oubliées.
+
+	Args:
+		token (str): Le jeton
+		client_dict (dict): L'entrée du jeton dans saved_clients
+
+	Returns:
+		bool: True si le client est de nouveau connecté
+	"""
+
+	with restore_locks[hash(token) % len(restore_locks)]:
+		# une autre requête a pu reconnecter le jeton pendant l'attente
+		if time.time() - client_dict['last_interaction'] < client_timeout_threshold:
+			return True
+
+		client = client_dict['client']
+		try:
+			__run_upstream(token, __refresh_client, client)
+		except Exception as e:
+			print(f"Error while trying to reauthenticate a session on {client.pronote_url}")
+			print(e)
+			return False
+		if not client.logged_in:
+			return False
+
+		shared_client = client.shared_client if isinstance(client, SessionClient) else client
+		for attribute in ('period_index', 'discussion_index', 'homework_index', 'recipient_directory', 'date_range_stores', 'period_items'):
+			shared_client.__dict__.pop(attribute, None)
+		client.calculated_period = __get_current_period(client, True, client.calculated_period.name)
+		client.activated_period = __get_current_period(client, False, None, True)
+		client_dict['cache'] = ResponseCache()
+		client_dict['last_interaction'] = time.time()
+		if client.login_mode != 'normal':
+			__save_session(token, client, 'token')
+		request_session.reauthenticated = True
+		return True
+
+def get_client(token: str) -> tuple[str, pronotepy.Client|None]:
+	"""Retourne le client Pronote associé au jeton.
+
+	Args:
+		token (str): le jeton à partir duquel retrouver le client.
+		instance (bool): si True, le client ne sera pas recherché sur les autres instances.
+
+	Returns:
+		tuple: le couple (statut, client?) associé au jeton
+			str: le statut de la demande ('ok' si le client est trouvé, 'expired' si le jeton a expiré, 'notfound' si le jeton n'est pas associé à un client)
+			pronotepy.Client|None: une instance de client si le token est valide, None sinon.
+
+	"""
+	if MAINTENANCE['enable']:
+		return 'maintenance', None
+	client_dict = saved_clients.get(token)
+	if client_dict is not None:
+		idle = time.time() - client_dict['last_interaction']
+		if idle < client_timeout_threshold:
+			client_dict['last_interaction'] = time.time()
+			return 'ok', client_dict['client']
+		elif idle < session_reauth_window and __reauthenticate(token, client_dict):
+			return 'ok', client_dict['client']
+		else:
+			saved_clients.pop(token)
+			if session_backend is not None:
+				session_backend.delete(token)
+			print(len(saved_clients), 'valid tokens')
+			return 'expired', None
+	elif saved_clients.pop_expired(token):
+		# supprimé par le nettoyage des jetons inactifs : l'application doit savoir qu'il a expiré
+		if session_backend is not None:
+			session_backend.delete(token)
+		return 'expired', None
+	else:
+		return __restore_session(token)
+
+# exécution des appels à Pronote
+upstream_max_workers = int(os.environ.get('PAPILLON_UPSTREAM_WORKERS', 32)) # le nombre max d'appels à Pronote en parallèle
+upstream_timeout = int(os.environ.get('PAPILLON_UPSTREAM_TIMEOUT', 20)) # le temps en sec avant qu'une requête vers Pronote ne soit abandonnée
+upstream_pool = concurrent.futures.ThreadPoolExecutor(max_workers=upstream_max_workers, thread_name_prefix='pronote')
+upstream_host_max_connections = int(os.environ.get('PAPILLON_HOST_MAX_CONNECTIONS', 16)) # le nombre max d'appels en parallèle vers une même instance Pronote
+upstream_queue_timeout = int(os.environ.get('PAPILLON_UPSTREAM_QUEUE_TIMEOUT', 60)) # le temps max en sec d'attente de son tour (client ou instance occupés) avant un appel à Pronote
+
+class SharedPoolAdapter(requests.adapters.HTTPAdapter):
+	"""
+	Adaptateur HTTP propre à une session, qui utilise le pool de connexions partagé de son instance Pronote.
+
+	pronotepy ferme sa session HTTP à chaque reconnexion : la fermeture de l'adaptateur
+	ne ferme donc pas le pool partagé, seulement les éventuels proxys de la session.
+	"""
+
+	def __init__(self, poolmanager: urllib3.PoolManager):
+		self.shared_poolmanager = poolmanager
+		super().__init__()
+
+	def init_poolmanager(self, connections: int, maxsize: int, block: bool = False, **pool_kwargs) -> None:
+		self._pool_connections = connections
+		self._pool_maxsize = maxsize
+		self._pool_block = block
+		self.poolmanager = self.shared_poolmanager
+
+	def close(self) -> None:
+		for proxy in self.proxy_manager.values():
+			proxy.clear()
+
+class UpstreamHosts:
+	"""
+	Connexions partagées par instance Pronote.
+
+	Tous les clients d'une même instance utilisent le même pool de connexions keep-alive
+	(les cookies restent propres à chaque session), et le nombre d'appels en parallèle
+	vers une instance est limité : les appels en trop attendent leur tour.
+	"""
+
+	def __init__(self, max_connections: int = upstream_host_max_connections):
+		self.max_connections = max_connections
+		self.poolmanagers = {}
+		self.semaphores = {}
+		self.lock = threading.Lock()
+
+	def __prefix(self, url: str) -> str:
+		parts = urllib.parse.urlsplit(url)
+		return f'{parts.scheme}://{parts.netloc.lower()}/'
+
+	def __get(self, prefix: str) -> tuple[urllib3.PoolManager, threading.BoundedSemaphore]:
+		with self.lock:
+			if prefix not in self.poolmanagers:
+				self.poolmanagers[prefix] = urllib3.PoolManager(num_pools=1, maxsize=self.max_connections, block=True)
+				self.semaphores[prefix] = threading.BoundedSemaphore(self.max_connections)
+			return self.poolmanagers[prefix], self.semaphores[prefix]
+
+	def semaphore(self, url: str) -> threading.BoundedSemaphore:
+		"""
+		Retourne le sémaphore qui limite les appels en parallèle vers l'instance d'une URL.
+
+		Args:
+			url (str): L'URL de l'instance Pronote
+
+		Returns:
+			threading.BoundedSemaphore: Le sémaphore de l'instance
+		"""
+
+		return self.__get(self.__prefix(url))[1]
+
+	def mount(self, client: pronotepy.Client) -> None:
+		"""
+		Fait utiliser au client le pool de connexions partagé de son instance.
+		À rappeler après chaque reconnexion du client (pronotepy recrée alors sa session HTTP).
+
+		Args:
+			client (pronotepy.Client): Le client Pronote
+		"""
+
+		prefix = self.__prefix(client.pronote_url)
+		poolmanager = self.__get(prefix)[0]
+		session = client.communication.session
+		adapter = session.adapters.get(prefix)
+		if not isinstance(adapter, SharedPoolAdapter) or adapter.poolmanager is not poolmanager:
+			session.mount(prefix, SharedPoolAdapter(poolmanager))
+
+	def release(self, client: pronotepy.Client) -> None:
+		"""
+		Détache le pool partagé de la session du client, avant de la fermer ou de la laisser à pronotepy.
+
+		Args:
+			client (pronotepy.Client): Le client Pronote
+		"""
+
+		prefix = self.__prefix(client.pronote_url)
+		session = client.communication.session
+		if isinstance(session.adapters.get(prefix), SharedPoolAdapter):
+			del session.adapters[prefix]
+
+upstream_hosts = UpstreamHosts()
+
+class UpstreamSkipped(Exception):
+	"""
+	Levée à la place d'un appel à Pronote pendant la recherche en cache des sous-requêtes de /batch.
+	"""
+
+batch_phase = threading.local() # phase : 'lookup' (réponses en cache uniquement) puis 'upstream' (recherches déjà comptées) pendant un /batch
+
+def __run_upstream(token: str|None, function, *args, upstream_url: str|None = None, **kwargs):
+	"""
+	Exécute un appel bloquant à Pronote sur le pool de threads, avec un délai max.
+
+	Les appels d'un même client sont exécutés l'un après l'autre (verrou du client),
+	ceux de clients différents en parallèle, dans la limite de upstream_host_max_connections par instance.
+	Le verrou et le sémaphore sont pris avant l'envoi sur le pool : un appel qui attend son tour n'occupe pas de thread,
+	et le délai upstream_timeout ne compte que l'exécution de l'appel.
 
 	Args:
-		token (str): le jeton à partir duquel retrouver le client.
-		instance (bool): si True, le client ne sera pas recherché sur les autres instances.
+		token (str|None): Le token du client Pronote, ou None si l'appel n'utilise pas de client existant (connexion)
+		function (callable): La fonction à exécuter
+		*args, **kwargs: Les arguments passés à function
+		upstream_url (str, optional): L'URL de l'instance Pronote, si token est None. Defaults to None.
 
-	Returns:
-		tuple: le couple (statut, client?) associé au jeton
-			str: le statut de la demande ('ok' si le client est trouvé, 'expired' si le jeton a expiré, 'notfound' si le jeton n'est pas associé à un client)
-			pronotepy.Client|None: une instance de client si le token est valide, None sinon.
+	Raises:
+		TimeoutError: si l'appel n'a pas pu commencer avant upstream_queue_timeout secondes, ou si Pronote n'a pas répondu avant upstream_timeout secondes
+		UpstreamSkipped: pendant la recherche en cache des sous-requêtes de /batch
 
+	Returns:
+		Any: Le résultat de function
 	"""
-	if MAINTENANCE['enable']:
-		return 'maintenance', None
-	if token in saved_clients:
-		client_dict = saved_clients[token]
-		if time.time() - client_dict['last_interaction'] < client_timeout_threshold:
-			client_dict['last_interaction'] = time.time()
-			return 'ok', client_dict['client']
-		else:
-			del saved_clients[token]
-			print(len(saved_clients), 'valid tokens')
-			return 'expired', None
-	else:
-		return 'notfound', None
 
-@hug.get('/infos')
-def infos():
+	if getattr(batch_phase, 'phase', None) == 'lookup':
+		raise UpstreamSkipped()
+
+	client_dict = saved_clients.get(token) if token is not None else None
+	lock = client_dict['lock'] if client_dict is not None else None
+	if client_dict is not None:
+		upstream_url = client_dict['client'].pronote_url
+	semaphore = upstream_hosts.semaphore(upstream_url) if upstream_url else None
+	host = (('host', urllib.parse.urlsplit(upstream_url).hostname or 'unknown'),) if upstream_url else (('host', 'unknown'),)
+	running = threading.Event()
+	acquired = []
+
+	def release(future=None):
+		while acquired:
+			acquired.pop().release()
+
+	def run():
+		running.set()
+		if client_dict is not None:
+			upstream_hosts.mount(client_dict['client'])
+		started = time.perf_counter()
+		try:
+			return function(*args, **kwargs)
+		finally:
+			metrics.inc('papillon_upstream_calls_total', host)
+			metrics.observe('papillon_upstream_duration_seconds', host, time.perf_counter() - started)
+
+	started = time.perf_counter()
+	future = None
+	try:
+		queue_deadline = time.time() + upstream_queue_timeout
+		for primitive in (lock, semaphore):
+			if primitive is None:
+				continue
+			if not primitive.acquire(timeout=max(0, queue_deadline - time.time())):
+				raise TimeoutError('Pronote is busy, try again later')
+			acquired.append(primitive)
+
+		# le verrou et le sémaphore sont rendus à la fin de l'appel, même s'il se termine après notre abandon
+		future = upstream_pool.submit(run)
+		future.add_done_callback(release)
+		if not running.wait(timeout=max(0, queue_deadline - time.time())) and future.cancel():
+			raise TimeoutError('Pronote is busy, try again later')
+		return future.result(timeout=upstream_timeout)
+	except (TimeoutError, concurrent.futures.TimeoutError) as exception:
+		# avant Python 3.11, concurrent.futures.TimeoutError n'est pas le TimeoutError natif
+		metrics.inc('papillon_upstream_errors_total', host)
+		if str(exception) and isinstance(exception, TimeoutError):
+			raise
+		raise TimeoutError('Pronote did not respond in time') from None
+	except Exception:
+		metrics.inc('papillon_upstream_errors_total', host)
+		raise
+	finally:
+		if future is None:
+			release()
+		request_timings.upstream = getattr(request_timings, 'upstream', 0) + time.perf_counter() - started
+
+@hug.exception((TimeoutError, concurrent.futures.TimeoutError))
+def upstream_timeout_handler(exception, response):
+	response.status = falcon.get_http_status(504)
 	return {
+		'status': 'timeout',
+		'error': str(exception)
+	}
+
+class SingleFlight:
+	"""
+	Fusionne les appels identiques en cours : le premier appel pour une clé exécute la fonction,
+	ceux qui arrivent avant la fin attendent et reçoivent le même résultat (ou la même exception).
+	"""
+
+	def __init__(self):
+		self.calls = {} # clé -> concurrent.futures.Future de l'appel en cours
+		self.lock = threading.Lock()
+
+	def run(self, key, function, *args, **kwargs) -> tuple:
+		"""
+		Exécute function(*args, **kwargs), ou attend le résultat de l'appel en cours pour la même clé.
+
+		Args:
+			key (Hashable): La clé qui identifie les appels identiques
+			function (callable): La fonction à exécuter
+
+		Returns:
+			tuple: Le résultat et True s'il a été calculé par cet appel
+		"""
+
+		with self.lock:
+			future = self.calls.get(key)
+			leader = future is None
+			if leader:
+				future = self.calls[key] = concurrent.futures.Future()
+		if not leader:
+			# sans délai : l'appel en cours est déjà borné par __run_upstream (attente de son tour puis appel à Pronote)
+			return future.result(), False
+
+		try:
+			result = function(*args, **kwargs)
+		except BaseException as e:
+			future.set_exception(e)
+			raise
+		finally:
+			with self.lock:
+				del self.calls[key]
+		future.set_result(result)
+		return result, True
+
+# cache des réponses
+cache_ttl = {
+	'user': 600,
+	'timetable': 300,
+	'timetable/range': 300,
+	'homework': 300,
+	'grades': 600,
+	'grades/stats': 600,
+	'absences': 900,
+	'delays': 900,
+	'punishments': 900,
+	'news': 600,
+	'discussions': 60,
+	'recipients': 3600,
+	'evaluations': 600,
+	'menu': 3600,
+	'establishment/menu': 3600,
+} # la durée de vie en sec d'une réponse en cache pour chaque route
+cache_max_bytes = int(os.environ.get('PAPILLON_CACHE_MAX_BYTES', 2 * 1024 * 1024)) # la taille max du cache d'un client (en octets de JSON)
+establishment_cache_max_bytes = int(os.environ.get('PAPILLON_ESTABLISHMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024)) # la taille max du cache partagé par établissement (en octets de JSON)
+
+class ResponseCache:
+	"""
+	Cache LRU des réponses d'un client, rangé à côté du client dans saved_clients (ou partagé par établissement, voir establishment_cache).
+
+	Les entrées sont indexées par (route, arguments normalisés) et expirent selon cache_ttl.
+	Quand la taille totale dépasse max_bytes, les entrées les moins récemment utilisées sont supprimées.
+	"""
+
+	def __init__(self, max_bytes: int = cache_max_bytes):
+		self.entries = collections.OrderedDict() # (route, arguments) -> (expiration, taille, données)
+		self.max_bytes = max_bytes
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+
+	def get(self, endpoint: str, args: tuple, count: bool = True):
+		"""
+		Récupère une réponse en cache.
+
+		Args:
+			endpoint (str): Le nom de la route
+			args (tuple): Les arguments normalisés de la requête
+			count (bool, optional): Compter la recherche dans les statistiques et les métriques. Defaults to True.
+
+		Returns:
+			Any: Les données en cache, ou None si elles sont absentes ou expirées.
+		"""
+
+		key = (endpoint, args)
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is not None and entry[0] < time.time():
+				self.__remove(key)
+				entry = None
+			if entry is None:
+				if count:
+					self.misses += 1
+					metrics.inc('papillon_cache_misses_total', (('endpoint', endpoint),))
+				return None
+			self.entries.move_to_end(key)
+			if count:
+				self.hits += 1
+				metrics.inc('papillon_cache_hits_total', (('endpoint', endpoint),))
+			return entry[2]
+
+	def set(self, endpoint: str, args: tuple, data, size: int|None = None) -> None:
+		"""
+		Ajoute une réponse au cache, en supprimant les entrées les plus anciennes si nécessaire.
+
+		Args:
+			endpoint (str): Le nom de la route
+			args (tuple): Les arguments normalisés de la requête
+			data (Any): Les données à garder en cache
+			size (int, optional): La taille des données en octets de JSON, si elle est déjà connue. Defaults to None.
+		"""
+
+		if data is None:
+			return
+		if size is None:
+			size = len(dump_json(data))
+		if size > self.max_bytes:
+			return
+
+		key = (endpoint, args)
+		with self.lock:
+			if key in self.entries:
+				self.__remove(key)
+			self.entries[key] = (time.time() + cache_ttl.get(endpoint, 0), size, data)
+			self.size += size
+			while self.size > self.max_bytes:
+				self.__remove(next(iter(self.entries)))
+
+	def find(self, endpoint: str, match=None) -> list:
+		"""
+		Retourne les réponses en cache (non expirées) d'une route, pour les modifier sur place.
+
+		Args:
+			endpoint (str): Le nom de la route
+			match (callable, optional): Si défini, seules les entrées dont les arguments vérifient match(args) sont retournées. Defaults to None.
+
+		Returns:
+			list: Les données en cache
+		"""
+
+		now = time.time()
+		with self.lock:
+			return [entry[2] for key, entry in self.entries.items() if key[0] == endpoint and entry[0] >= now and (match is None or match(key[1]))]
+
+	def invalidate(self, endpoint: str, match=None) -> None:
+		"""
+		Supprime les réponses en cache d'une route.
+
+		Args:
+			endpoint (str): Le nom de la route
+			match (callable, optional): Si défini, seules les entrées dont les arguments vérifient match(args) sont supprimées. Defaults to None.
+		"""
+
+		with self.lock:
+			for key in [key for key in self.entries if key[0] == endpoint and (match is None or match(key[1]))]:
+				self.__remove(key)
+
+	def __remove(self, key: tuple) -> None:
+		self.size -= self.entries.pop(key)[1]
+
+def __get_cached_data(token: str, endpoint: str, args: tuple, builder, *builder_args):
+	"""
+	Retourne la réponse en cache d'une route, ou la construit avec builder puis la garde en cache.
+
+	Args:
+		token (str): Le token du client Pronote
+		endpoint (str): Le nom de la route
+		args (tuple): Les arguments normalisés de la requête
+		builder (callable): La fonction qui construit la réponse à partir de Pronote
+		*builder_args: Les arguments passés à builder
+
+	Returns:
+		Any: La réponse de la route
+	"""
+
+	client_dict = saved_clients.get(token)
+	if client_dict is None:
+		return __run_upstream(token, builder, *builder_args)
+
+	cache = client_dict['cache']
+	data = cache.get(endpoint, args, count=getattr(batch_phase, 'phase', None) != 'upstream')
+	if data is None:
+		data, body = __run_upstream(token, __build_cached_data, cache, endpoint, args, builder, *builder_args)
+		if body is not None:
+			# le JSON mesuré pour le cache sert aussi de réponse si la route renvoie les données telles quelles
+			serialized_response.data, serialized_response.body = data, body
+	return data
+
+def __build_cached_data(cache: ResponseCache, endpoint: str, args: tuple, builder, *builder_args) -> tuple:
+	"""
+	Construit une réponse et la garde en cache, sauf si elle y a été ajoutée entre temps.
+	Exécutée avec le verrou du client : une requête qui attendait la fin d'un préchargement (ou d'une requête identique) réutilise son résultat.
+
+	Returns:
+		tuple: Les données et leur JSON, ou None à la place du JSON si les données étaient déjà en cache
+	"""
+
+	data = cache.get(endpoint, args, count=False)
+	if data is not None:
+		return data, None
+	data = builder(*builder_args)
+	if data is None:
+		return data, None
+	body = dump_json(data)
+	cache.set(endpoint, args, data, len(body))
+	return data, body
+
+# cache partagé par établissement : les données identiques pour tous les élèves d'une instance Pronote (menus)
+# sont demandées à Pronote par la première session puis servies à toutes les autres
+establishment_cache = ResponseCache(establishment_cache_max_bytes)
+establishment_flights = SingleFlight()
+
+def __get_establishment_key(client: pronotepy.Client) -> str:
+	"""
+	Retourne la clé de l'instance Pronote d'un client : l'hôte et le dossier de son URL, sans l'espace (eleve.html, parent.html...).
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+
+	Returns:
+		str: La clé de l'établissement (ex: "0152054e.index-education.net/pronote")
+	"""
+
+	url = urllib.parse.urlsplit(client.pronote_url)
+	return url.netloc.lower() + url.path.rsplit('/', 1)[0]
+
+def __get_establishment_data(token: str, client: pronotepy.Client, endpoint: str, args: tuple, builder, *builder_args):
+	"""
+	Retourne une réponse partagée par tous les clients du même établissement, ou la construit avec builder.
+	Les sessions qui la demandent en même temps attendent la première au lieu d'appeler Pronote.
+
+	Args:
+		token (str): Le token du client Pronote qui construit la réponse si besoin
+		client (pronotepy.Client): Le client Pronote
+		endpoint (str): Le nom de la route (la durée de vie est celle de cache_ttl['establishment/' + endpoint])
+		args (tuple): Les arguments normalisés de la requête
+		builder (callable): La fonction qui construit la réponse à partir de Pronote
+		*builder_args: Les arguments passés à builder
+
+	Returns:
+		Any: La réponse de la route
+	"""
+
+	endpoint = 'establishment/' + endpoint
+	args = (__get_establishment_key(client),) + args
+	data = establishment_cache.get(endpoint, args, count=getattr(batch_phase, 'phase', None) != 'upstream')
+	if data is None:
+		if getattr(batch_phase, 'phase', None) == 'lookup':
+			raise UpstreamSkipped() # avant de rejoindre un appel en cours : les autres sessions ne doivent pas recevoir l'exception
+		(data, body), leader = establishment_flights.run((endpoint, args), __build_establishment_data, token, endpoint, args, builder, *builder_args)
+		if leader and body is not None:
+			serialized_response.data, serialized_response.body = data, body
+	return data
+
+def __build_establishment_data(token: str, endpoint: str, args: tuple, builder, *builder_args) -> tuple:
+	data = establishment_cache.get(endpoint, args, count=False)
+	if data is not None:
+		return data, None
+	data = __run_upstream(token, builder, *builder_args)
+	if data is None:
+		return data, None
+	body = dump_json(data)
+	establishment_cache.set(endpoint, args, data, len(body))
+	return data, body
+
+def __refresh_cached_data(token: str, endpoint: str, args: tuple, builder, *builder_args) -> None:
+	"""
+	Reconstruit une réponse depuis Pronote et remplace celle en cache (utilisé par le préchargement).
+
+	Args:
+		token (str): Le token du client Pronote
+		endpoint (str): Le nom de la route
+		args (tuple): Les arguments normalisés de la requête
+		builder (callable): La fonction qui construit la réponse à partir de Pronote
+		*builder_args: Les arguments passés à builder
+	"""
+
+	client_dict = saved_clients.get(token)
+	if client_dict is not None:
+		data = __run_upstream(token, builder, *builder_args)
+		client_dict['cache'].set(endpoint, args, data)
+
+def __invalidate_cached_data(token: str, endpoint: str, match=None) -> None:
+	"""
+	Supprime les réponses en cache d'une route pour un token (voir ResponseCache.invalidate).
+
+	Args:
+		token (str): Le token du client Pronote
+		endpoint (str): Le nom de la route
+		match (callable, optional): Si défini, seules les entrées dont les arguments vérifient match(args) sont supprimées. Defaults to None.
+	"""
+
+	client_dict = saved_clients.get(token)
+	if client_dict is not None:
+		client_dict['cache'].invalidate(endpoint, match)
+
+def __find_cached_data(token: str, endpoint: str, match=None) -> list:
+	"""
+	Retourne les réponses en cache d'une route pour un token (voir ResponseCache.find).
+
+	Args:
+		token (str): Le token du client Pronote
+		endpoint (str): Le nom de la route
+		match (callable, optional): Si défini, seules les entrées dont les arguments vérifient match(args) sont retournées. Defaults to None.
+
+	Returns:
+		list: Les données en cache
+	"""
+
+	client_dict = saved_clients.get(token)
+	if client_dict is None:
+		return []
+	return client_dict['cache'].find(endpoint, match)
+
+def __get_periods_key(client: pronotepy.Client, allPeriods: bool) -> tuple:
+	"""
+	Retourne les arguments normalisés des routes qui peuvent porter sur toutes les périodes (absences, retards, punitions).
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		allPeriods (bool): Si toutes les périodes sont demandées
+
+	Returns:
+		tuple: Les arguments à utiliser dans la clé du cache
+	"""
+
+	return ('all',) if allPeriods else (client.calculated_period.id,)
+
+# réponses en flux (stream=ndjson) :
+# les routes qui renvoient de longues listes peuvent envoyer un objet JSON par ligne au fur et à mesure,
+# sans construire la liste complète en mémoire
+class NDJSONStream:
+	"""
+	Corps de réponse NDJSON lu par falcon (response.stream) : chaque appel à read() renvoie la ligne suivante.
+	on_close est appelé une fois le corps envoyé (métriques de la requête, voir record_request_metrics).
+	"""
+
+	def __init__(self, lines):
+		self.lines = lines
+		self.on_close = None
+
+	def read(self, size: int = -1) -> bytes:
+		return next(self.lines, b'')
+
+	def close(self) -> None:
+		try:
+			self.lines.close()
+		except ValueError:
+			# le générateur est encore utilisé par un appel à Pronote qui a dépassé le délai
+			pass
+		if self.on_close is not None:
+			on_close, self.on_close = self.on_close, None
+			on_close()
+
+def __dump_stream_line(item) -> bytes:
+	# même mesure que json_output : le temps de sérialisation d'un flux compte dans celui de sa requête
+	start = time.perf_counter()
+	line = dump_json(item) + b'\n'
+	request_timings.serialization = getattr(request_timings, 'serialization', 0) + time.perf_counter() - start
+	return line
+
+def __iter_stream_lines(token: str, endpoint: str, args: tuple, iterator):
+	"""
+	Génère les lignes NDJSON d'une route, depuis le cache ou depuis Pronote.
+
+	Chaque élément est construit sur le pool de threads (voir __run_upstream) : un élément qui déclenche
+	un appel à Pronote (messages d'une discussion, punitions d'une période...) a donc le même délai max qu'une requête normale.
+	La liste complète est gardée en cache si elle ne dépasse pas cache_max_bytes.
+
+	Args:
+		token (str): Le token du client Pronote
+		endpoint (str): Le nom de la route
+		args (tuple): Les arguments normalisés de la requête
+		iterator (Iterator[dict]): Les éléments de la réponse
+
+	Yields:
+		bytes: Un élément encodé en JSON suivi d'un retour à la ligne
+	"""
+
+	client_dict = saved_clients.get(token)
+	cache = client_dict['cache'] if client_dict is not None else None
+	data = cache.get(endpoint, args) if cache is not None else None
+	if data is not None:
+		for item in data:
+			yield __dump_stream_line(item)
+		return
+
+	collected = []
+	size = 2
+	while True:
+		try:
+			item = __run_upstream(token, next, iterator, None)
+		except (TimeoutError, concurrent.futures.TimeoutError) as e:
+			yield __dump_stream_line({'status': 'timeout', 'error': str(e)})
+			return
+		if item is None:
+			break
+
+		line = __dump_stream_line(item)
+		if collected is not None:
+			size += len(line)
+			collected.append(item)
+			if size > cache_max_bytes:
+				collected = None
+		yield line
+
+	if cache is not None and collected is not None:
+		cache.set(endpoint, args, collected, size)
+
+def __stream_cached_data(token: str, response, endpoint: str, args: tuple, iterator) -> NDJSONStream:
+	"""
+	Prépare une réponse NDJSON (voir __iter_stream_lines).
+
+	Args:
+		token (str): Le token du client Pronote
+		response (falcon.Response): La réponse de la requête
+		endpoint (str): Le nom de la route
+		args (tuple): Les arguments normalisés de la requête
+		iterator (Iterator[dict]): Les éléments de la réponse
+
+	Returns:
+		NDJSONStream: Le corps de la réponse
+	"""
+
+	response.content_type = 'application/x-ndjson; charset=utf-8'
+	return NDJSONStream(__iter_stream_lines(token, endpoint, args, iterator))
+
+# configuration rechargée à chaud : maintenance.json, cas_list.json et VERSION sont relus quand ils changent
+# (vérification toutes les config_reload_interval secondes) ou à la réception de SIGHUP, sans redémarrer le serveur
+config_reload_interval = int(os.environ.get('PAPILLON_CONFIG_RELOAD_INTERVAL', 10)) # le temps en sec entre deux vérifications des fichiers (0 pour désactiver, SIGHUP fonctionne toujours)
+config_files = ('maintenance.json', 'cas_list.json', 'VERSION')
+config_lock = threading.RLock() # réentrant : SIGHUP peut arriver pendant un rechargement du thread principal
+config_versions = {} # fichier -> (date de modification, taille) lors du dernier chargement
+config_watcher = None
+worker_processes = {} # pid -> numéro des workers (processus principal uniquement, voir __name__ == '__main__')
+
+def __get_config_version(path: str) -> tuple|None:
+	try:
+		stat = os.stat(path)
+	except OSError:
+		return None
+	return (stat.st_mtime_ns, stat.st_size)
+
+def __build_infos() -> tuple[bytes, str]:
+	"""
+	Construit la réponse de /infos une fois pour toutes (jusqu'au prochain rechargement de la configuration).
+
+	Returns:
+		tuple[bytes, str]: Le corps JSON et son ETag
+	"""
+
+	body = dump_json({
 		'status': 'ok' if not MAINTENANCE['enable'] else 'maintenance',
 		'message': 'server is running' if not MAINTENANCE['enable'] else MAINTENANCE['message'],
 		'server': socket.gethostname(),
 		'version': API_VERSION,
 		'ent_list': CAS_LIST if not MAINTENANCE['enable'] else []
-	}
+	})
+	return body, '"' + hashlib.sha1(body).hexdigest() + '"'
+
+def reload_config(force: bool = False) -> bool:
+	"""
+	Relit les fichiers de configuration modifiés depuis leur dernier chargement et reconstruit /infos.
+	Un fichier illisible (en cours d'écriture, JSON invalide) est ignoré et l'ancienne valeur est gardée.
+
+	Args:
+		force (bool, optional): Relire tous les fichiers, même s'ils n'ont pas changé. Defaults to False.
+
+	Returns:
+		bool: True si la configuration a changé
+	"""
+
+	global MAINTENANCE, CAS_LIST, API_VERSION, infos_response
+
+	with config_lock:
+		changed = False
+		for path in config_files:
+			version = __get_config_version(path)
+			if version is None or (not force and config_versions.get(path) == version):
+				continue
+			config_versions[path] = version
+
+			try:
+				with open(path, 'r', encoding='utf8') as file:
+					if path == 'VERSION':
+						value = file.read().strip()
+					else:
+						value = json.load(file)
+			except (OSError, ValueError) as e:
+				print(f"Error while reloading {path}, keeping the previous version: {e}")
+				continue
+
+			if path == 'maintenance.json':
+				changed = changed or value != MAINTENANCE
+				MAINTENANCE = value
+			elif path == 'cas_list.json':
+				changed = changed or value != CAS_LIST
+				CAS_LIST = value
+			else:
+				changed = changed or value != API_VERSION
+				API_VERSION = value
+
+		if changed:
+			infos_response = __build_infos()
+			print(f"Configuration reloaded (maintenance: {MAINTENANCE['enable']}, version: {API_VERSION})")
+		return changed
+
+def __start_config_watcher() -> None:
+	"""
+	Lance le thread qui recharge la configuration quand ses fichiers changent (une seule fois par processus).
+	"""
+
+	global config_watcher
+
+	if config_watcher is not None or config_reload_interval <= 0:
+		return
+
+	def watch_forever():
+		while True:
+			time.sleep(config_reload_interval)
+			try:
+				reload_config()
+			except Exception as e:
+				print(f"Error while reloading the configuration: {e}")
+
+	config_watcher = threading.Thread(target=watch_forever, name='config-watcher', daemon=True)
+	config_watcher.start()
+
+def __handle_sighup(signum, frame) -> None:
+	reload_config(force=True)
+	# le processus principal transmet le signal à ses workers
+	for pid in list(worker_processes):
+		try:
+			os.kill(pid, signal.SIGHUP)
+		except OSError:
+			pass
+
+for path in config_files:
+	config_versions[path] = __get_config_version(path)
+infos_response = __build_infos()
+if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+	signal.signal(signal.SIGHUP, __handle_sighup)
+
+@hug.get('/infos')
+def infos(request, response):
+	"""
+	Renvoie l'état du serveur, sa version et la liste des ENT.
+	La réponse est construite au chargement de la configuration et porte un ETag fixe : un client à jour reçoit un 304.
+	"""
+
+	body, etag = infos_response
+	response.set_header('ETag', etag)
+	response.set_header('Cache-Control', 'public, no-cache')
+	if __etag_matches(request, etag):
+		response.status = falcon.HTTP_304
+		return None
+	return io.BytesIO(body)
+
+@hug.get('/metrics', output=hug.output_format.text)
+def metrics_endpoint(response):
+	"""
+	Exporte les métriques du processus au format texte de Prometheus (avec plusieurs workers, chacun a ses propres métriques).
+
+	Returns:
+		str: Les métriques
+	"""
+
+	stats = saved_clients.stats()
+	response.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+	return metrics.render([
+		('papillon_sessions', (), stats['sessions']),
+		('papillon_sessions_evicted_total', (), stats['evicted']),
+		('papillon_sessions_expired_total', (), stats['expired']),
+		('papillon_cache_bytes', (), stats['cache_bytes']),
+		('papillon_establishment_cache_bytes', (), establishment_cache.size),
+	])
  
 # requête initiale :
 # un client doit faire
 # token = POST /generatetoken body={url, username, password, ent}
 # GET * token=token
+# connexions : les connexions identiques en cours sont fusionnées et un client encore valide est réutilisé
+login_key_secret = secrets.token_bytes(32) # clé des empreintes d'identifiants (créée avant le fork, partagée par les workers)
+login_flights = SingleFlight() # connexions en cours, par clé des identifiants
+
+def __get_login_key(method: str, body: dict) -> str|None:
+	"""
+	Calcule l'empreinte des identifiants d'une connexion (les mots de passe ne sont pas gardés en clair).
+
+	Args:
+		method (str): La méthode de connexion ('url' ou 'token')
+		body (dict): Le corps de la requête /generatetoken
+
+	Returns:
+		str|None: L'empreinte, ou None si la connexion ne peut pas être réutilisée (QR code, à usage unique)
+	"""
+
+	if method == 'url':
+		parts = [method, body['url'], body['username'], body['password'], body.get('ent')]
+	elif method == 'token':
+		parts = [method, body['url'], body['username'], body['password'], body['uuid']]
+	else:
+		return None
+	return hmac.new(login_key_secret, json.dumps(parts).encode('utf8'), hashlib.sha256).hexdigest()
+
+def __login(login_key: str|None, function, *args, **kwargs) -> tuple[str, pronotepy.Client, bool]:
+	"""
+	Connecte un client Pronote et ouvre son jeton, ou ouvre un nouveau jeton sur le client déjà connecté avec les mêmes identifiants
+	(chaque jeton garde sa période sélectionnée, voir SessionClient).
+	Si une connexion identique est en cours, attend son résultat au lieu d'en lancer une autre.
+
+	Args:
+		login_key (str|None): La clé des identifiants (voir __get_login_key), None pour toujours se connecter
+		function (callable): La fonction de connexion de pronotepy
+		*args: Les arguments passés à __run_upstream avec function
+
+	Returns:
+		tuple[str, pronotepy.Client, bool]: Le jeton, le client et True si la connexion vient d'être faite
+	"""
+
+	if login_key is None:
+		token, client = __connect(None, function, *args, **kwargs)
+		return token, client, True
+
+	login = saved_clients.find_login(login_key)
+	if login is None:
+		(token, client), created = login_flights.run(login_key, __connect, login_key, function, *args, **kwargs)
+		entry = saved_clients.get(token)
+		if created or entry is None or not client.logged_in:
+			return token, client, created
+		login = (token, entry)
+
+	login[1]['last_interaction'] = time.time()
+	shared_client = login[1]['client']
+	if isinstance(shared_client, SessionClient):
+		shared_client = shared_client.shared_client
+	token = __new_token()
+	client = SessionClient(shared_client, __get_current_period(shared_client))
+	saved_clients.share(token, login[1], client)
+	return token, client, False
+
+def __connect(login_key: str|None, function, *args, **kwargs) -> tuple[str, pronotepy.Client]:
+	client = __run_upstream(None, function, *args, **kwargs)
+	token = __new_token()
+	__open_session(token, client, login_key=login_key if client.logged_in else None)
+	return token, client
+
 @hug.post('/generatetoken')
 def generate_token(response, body=None, method: hug.types.one_of(['url', 'qrcode', 'token'])='url'):
 	if MAINTENANCE['enable']:
@@ -117,9 +2045,9 @@ def generate_token(response, body=None, method: hug.types.one_of(['url', 'qrcode
 
 			try:
 				if noENT:
-					client = pronotepy.Client(body['url'], username=body['username'], password=body['password'])
+					token, client, created = __login(__get_login_key(method, body), pronotepy.Client, body['url'], username=body['username'], password=body['password'], upstream_url=body['url'])
 				else:
-					client = pronotepy.Client(body['url'], username=body['username'], password=body['password'], ent=getattr(pronotepy.ent, body['ent']))
+					token, client, created = __login(__get_login_key(method, body), pronotepy.Client, body['url'], username=body['username'], password=body['password'], ent=getattr(pronotepy.ent, body['ent']), upstream_url=body['url'])
 			except Exception as e:
 				response.status = falcon.get_http_status(498)
 				print(f"Error while trying to connect to {body['url']}")
@@ -148,11 +2076,11 @@ def generate_token(response, body=None, method: hug.types.one_of(['url', 'qrcode
 						}
 
 			try:
-				client = pronotepy.Client.qrcode_login({
+				token, client, created = __login(None, pronotepy.Client.qrcode_login, {
 					"jeton": body['qrToken'],
 					"login": body['login'],
 					"url": body['url']
-				}, body['checkCode'], body['uuid'])
+				}, body['checkCode'], body['uuid'], upstream_url=body['url'])
 			except Exception as e:
 				response.status = falcon.get_http_status(498)
 				print(e)
@@ -173,11 +2101,12 @@ def generate_token(response, body=None, method: hug.types.one_of(['url', 'qrcode
 					}
 
 			try:
-				client = pronotepy.Client.token_login(
+				token, client, created = __login(__get_login_key(method, body), pronotepy.Client.token_login,
 					pronote_url = body['url'],
 					username = body['username'],
 					password = body['password'],
-					uuid=body['uuid']
+					uuid=body['uuid'],
+					upstream_url=body['url']
 				)
 			except Exception as e:
 				response.status = falcon.get_http_status(498)
@@ -190,19 +2119,10 @@ def generate_token(response, body=None, method: hug.types.one_of(['url', 'qrcode
 				}
 				return error
 
-		token = secrets.token_urlsafe(16)
-
-		# Set current period
-		client.calculated_period = __get_current_period(client)
-		print(client.calculated_period)
-		client.activated_period = __get_current_period(client, False, None, True)
-
-		saved_clients[token] = {
-			'client': client,
-			'last_interaction': time.time()
-		}
-
-		print(len(saved_clients), 'valid tokens')
+		__save_session(token, client, method, body)
+		if created:
+			print(client.calculated_period)
+			print(len(saved_clients), 'valid tokens')
 
 		# if error return error
 		if client.logged_in:
@@ -240,6 +2160,79 @@ def generate_token(response, body=None, method: hug.types.one_of(['url', 'qrcode
 		return error
 
 
+class PeriodIndex:
+	"""
+	Index des périodes d'un client, construit une seule fois (client.periods reconstruit toutes les périodes à chaque accès).
+
+	Les périodes sont indexées par nom, par identifiant et par famille (premier mot du nom : Trimestre, Semestre, Année...),
+	et chaque famille est triée par date de début pour trouver en O(log n) la période qui contient une date.
+	"""
+
+	def __init__(self, client: pronotepy.Client):
+		self.periods = client.periods
+		self.by_name = {}
+		self.by_id = {}
+		self.by_family = {}
+		for period in self.periods:
+			self.by_name.setdefault(period.name, period)
+			self.by_id.setdefault(period.id, period)
+			self.by_family.setdefault(self.family(period.name), []).append(period)
+
+		self.sorted_by_family = {}
+		self.starts_by_family = {}
+		for family, periods in self.by_family.items():
+			periods = sorted(periods, key=lambda period: period.start)
+			self.sorted_by_family[family] = periods
+			self.starts_by_family[family] = [period.start for period in periods]
+
+		current_period = client.current_period
+		self.current = self.by_id.get(current_period.id, current_period)
+
+	@staticmethod
+	def family(name: str) -> str:
+		"""
+		Retourne la famille d'une période à partir de son nom (ex: "Trimestre 1" -> "Trimestre").
+		"""
+
+		return name.split(' ')[0]
+
+	def containing(self, date: datetime.datetime, family: str) -> pronotepy.Period|None:
+		"""
+		Retourne la période d'une famille qui contient une date.
+
+		Args:
+			date (datetime.datetime): La date
+			family (str): La famille de périodes (voir family)
+
+		Returns:
+			pronotepy.Period|None: La période, ou None si aucune période de la famille ne contient la date.
+		"""
+
+		starts = self.starts_by_family.get(family)
+		if not starts:
+			return None
+		i = bisect.bisect_right(starts, date) - 1
+		if i >= 0 and date <= self.sorted_by_family[family][i].end:
+			return self.sorted_by_family[family][i]
+		return None
+
+def __get_period_index(client: pronotepy.Client) -> PeriodIndex:
+	"""
+	Retourne l'index des périodes d'un client, en le construisant au premier appel.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+
+	Returns:
+		PeriodIndex: L'index des périodes
+	"""
+
+	index = getattr(client, 'period_index', None)
+	if index is None:
+		index = PeriodIndex(client)
+		client.period_index = index
+	return index
+
 # TODO: METTRE A JOUR CETTE PARTIE SI DES PROBLEMES APPARAISSENT
 # Peut poser problème avec certains établissements
 def __get_current_period(client: pronotepy.Client, wantSpecificPeriod: bool = False, specificPeriod: str = None, wantAllPeriods: bool = False) -> pronotepy.Period:
@@ -257,46 +2250,67 @@ def __get_current_period(client: pronotepy.Client, wantSpecificPeriod: bool = Fa
 	"""
 	
 	if client.logged_in:
-		if not wantSpecificPeriod:
-			CURRENT_PERIOD_NAME = client.current_period.name.split(' ')[0]
-			if CURRENT_PERIOD_NAME == 'Trimestre':
-				CURRENT_PERIOD_NAME = 'Trimestre'
-			elif CURRENT_PERIOD_NAME == 'Semestre':
-				CURRENT_PERIOD_NAME = 'Semestre'
-			elif CURRENT_PERIOD_NAME == 'Année':
-				CURRENT_PERIOD_NAME = 'Année'
-			else:
-				print("WARN: Couldn't find current period name")
-				return client.current_period
-			
-			allPeriods = []
-			currentPeriods = []
-
-			for period in client.periods:
-				if period.name.split(' ')[0] == CURRENT_PERIOD_NAME:
-					currentPeriods.append(period)
-
-			for i in range(len(currentPeriods)):
-				period = currentPeriods[i]
-				if not wantAllPeriods:   
-					raw = datetime.datetime.now().date()
-					now = datetime.datetime(raw.year, raw.month, raw.day)
-
-					if period.start <= now <= period.end:
-						return period
-
-					if i == len(currentPeriods) - 1:
-						return period
-				else:
-					allPeriods.append(period)
-			
-			return allPeriods
-		else:
-			for period in client.periods:
-				if period.name == specificPeriod:
-					return period
+		index = __get_period_index(client)
+
+		if wantSpecificPeriod:
+			period = index.by_name.get(specificPeriod)
+			if period is not None:
+				return period
 			print("WARN: Couldn't find specific period name")
-			return __get_current_period(client, False, None)
+
+		CURRENT_PERIOD_NAME = index.family(index.current.name)
+		if CURRENT_PERIOD_NAME not in ('Trimestre', 'Semestre', 'Année'):
+			print("WARN: Couldn't find current period name")
+			return index.current
+
+		currentPeriods = index.by_family[CURRENT_PERIOD_NAME]
+		if wantAllPeriods:
+			return list(currentPeriods)
+
+		raw = datetime.datetime.now().date()
+		now = datetime.datetime(raw.year, raw.month, raw.day)
+
+		period = index.containing(now, CURRENT_PERIOD_NAME)
+		if period is not None:
+			return period
+		return currentPeriods[-1]
+
+
+@hug.get('/credentials')
+def credentials(token: str, response):
+	"""
+	Renvoie les identifiants actuels d'une connexion par jeton ou QR code.
+	Le mot de passe de ces connexions change à chaque connexion : après une réponse avec l'en-tête X-Session-Reauthenticated,
+	l'application doit remplacer ceux reçus dans qr_credentials par ceux-ci.
+
+	Args:
+		token (str): Le token du client Pronote
+		response (falcon.Response): La réponse de la requête
+
+	Returns:
+		dict: Les identifiants, comme qr_credentials de /generatetoken
+	"""
+
+	success, client = get_client(token)
+	if success == 'ok':
+		if client.login_mode == 'normal':
+			response.status = falcon.get_http_status(400)
+			return {
+				'status': 'error',
+				'message': 'Only token and QR code logins have credentials to renew'
+			}
+		response.set_header('Cache-Control', 'no-store')
+		return {
+			'status': 'ok',
+			'qr_credentials': {
+				'username': client.username,
+				'password': client.password,
+				'url': client.pronote_url
+			}
+		}
+	else:
+		response.status = falcon.get_http_status(498)
+		return success
 
 
 @hug.post('/changePeriod')
@@ -318,6 +2332,8 @@ def change_period(token: str, response, periodName: str):
 		if client.logged_in:
 			try:
 				client.calculated_period = __get_current_period(client, True, periodName)
+				if session_backend is not None:
+					session_backend.set_period(token, client.calculated_period.name)
 				return {
 					'status': 'ok',
 					'period': client.calculated_period.name
@@ -333,6 +2349,43 @@ def change_period(token: str, response, periodName: str):
 		return success
 
 
+def __get_user_data(client: pronotepy.Client) -> dict:
+	"""
+	Construit les informations de l'utilisateur et la liste des périodes.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+
+	Returns:
+		dict: Les informations de l'utilisateur (voir user)
+	"""
+
+	periods = []
+	for period in __get_period_index(client).periods:
+		periods.append({
+			'start': period.start.strftime('%Y-%m-%d'),
+			'end': period.end.strftime('%Y-%m-%d'),
+			'name': period.name,
+			'id': period.id,
+			'actual': client.calculated_period.id == period.id
+		})
+
+	userData = {
+		"name": client.info.name,
+		"class": client.info.class_name,
+		"establishment": client.info.establishment,
+		"phone": client.info.phone,
+		"email": client.info.email,
+		"address": client.info.address,
+		"ine": client.info.ine_number,
+		"profile_picture": client.info.profile_picture.url if client.info.profile_picture else None,
+		"delegue": client.info.delegue,
+		"periods": periods
+	}
+
+	return userData
+
+
 @hug.get('/user')
 def user(token: str, response):
 	"""
@@ -362,35 +2415,209 @@ def user(token: str, response):
 	success, client = get_client(token)
 	if success == 'ok':
 		if client.logged_in:
-			periods = []
-			for period in client.periods:
-				periods.append({
-					'start': period.start.strftime('%Y-%m-%d'),
-					'end': period.end.strftime('%Y-%m-%d'),
-					'name': period.name,
-					'id': period.id,
-					'actual': client.calculated_period.id == period.id
-				})
-
-			userData = {
-				"name": client.info.name,
-				"class": client.info.class_name,
-				"establishment": client.info.establishment,
-				"phone": client.info.phone,
-				"email": client.info.email,
-				"address": client.info.address,
-				"ine": client.info.ine_number,
-				"profile_picture": client.info.profile_picture.url if client.info.profile_picture else None,
-				"delegue": client.info.delegue,
-				"periods": periods
-			}
-
-			return userData
+			return __get_cached_data(token, 'user', (client.calculated_period.id,), __get_user_data, client)
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
 
 
+# plages de dates déjà récupérées :
+# les cours (/timetable, /content) et les devoirs (/homework) sont gardés par jour pour chaque client,
+# une requête ne récupère depuis Pronote que les jours qui manquent
+class DateRangeStore:
+	"""
+	Éléments datés (cours ou devoirs) déjà récupérés depuis Pronote, rangés par jour, avec les plages de dates couvertes.
+
+	Chaque plage expire après ttl secondes. Pour une nouvelle plage demandée, les trous (jours jamais récupérés ou expirés)
+	sont récupérés en un seul appel à fetch qui couvre du premier au dernier trou.
+	Les appels doivent être faits avec le verrou du client (depuis une fonction exécutée par __run_upstream).
+	"""
+
+	def __init__(self, fetch, get_date, ttl: int):
+		self.fetch = fetch # (date de début, date de fin) -> éléments
+		self.get_date = get_date # élément -> datetime.date
+		self.ttl = ttl
+		self.ranges = [] # (début, fin, expiration), triées et sans chevauchement
+		self.days = {} # datetime.date -> éléments du jour
+
+	def missing(self, dateFrom: datetime.date, dateTo: datetime.date) -> list[tuple[datetime.date, datetime.date]]:
+		"""
+		Retourne les plages de dates qui ne sont pas couvertes (ou ont expiré) entre deux dates.
+
+		Args:
+			dateFrom (datetime.date): La date de début
+			dateTo (datetime.date): La date de fin
+
+		Returns:
+			list[tuple[datetime.date, datetime.date]]: Les trous, dans l'ordre
+		"""
+
+		now = time.time()
+		gaps = []
+		cursor = dateFrom
+		for start, end, expires in self.ranges:
+			if start > dateTo:
+				break
+			if expires < now or end < cursor:
+				continue
+			if start > cursor:
+				gaps.append((cursor, start - datetime.timedelta(days=1)))
+			cursor = end + datetime.timedelta(days=1)
+			if cursor > dateTo:
+				break
+		if cursor <= dateTo:
+			gaps.append((cursor, dateTo))
+		return gaps
+
+	def get(self, dateFrom: datetime.date, dateTo: datetime.date, refresh: bool = False) -> list:
+		"""
+		Retourne les éléments entre deux dates (incluses), en récupérant seulement les jours manquants.
+
+		Args:
+			dateFrom (datetime.date): La date de début
+			dateTo (datetime.date): La date de fin
+			refresh (bool, optional): Si True, toute la plage est récupérée à nouveau. Defaults to False.
+
+		Returns:
+			list: Les éléments, jour par jour
+		"""
+
+		gaps = [(dateFrom, dateTo)] if refresh else self.missing(dateFrom, dateTo)
+		if gaps:
+			self.__add(gaps[0][0], gaps[-1][1], self.fetch(gaps[0][0], gaps[-1][1]))
+
+		items = []
+		day = dateFrom
+		while day <= dateTo:
+			items.extend(self.days.get(day, ()))
+			day += datetime.timedelta(days=1)
+		return items
+
+	def __add(self, dateFrom: datetime.date, dateTo: datetime.date, items: list) -> None:
+		now = time.time()
+		oneDay = datetime.timedelta(days=1)
+
+		# les plages expirées sont oubliées, celles qui chevauchent la nouvelle sont raccourcies
+		ranges = []
+		for start, end, expires in self.ranges:
+			if expires < now:
+				continue
+			if start < dateFrom:
+				ranges.append((start, min(end, dateFrom - oneDay), expires))
+			if end > dateTo:
+				ranges.append((max(start, dateTo + oneDay), end, expires))
+		ranges.append((dateFrom, dateTo, now + self.ttl))
+		ranges.sort()
+		self.ranges = ranges
+
+		days = {}
+		for item in items:
+			day = self.get_date(item)
+			if dateFrom <= day <= dateTo:
+				days.setdefault(day, []).append(item)
+		for day, dayItems in list(self.days.items()):
+			if dateFrom <= day <= dateTo or not any(start <= day <= end for start, end, expires in ranges):
+				del self.days[day]
+		self.days.update(days)
+
+def __get_date_range_store(client: pronotepy.Client, kind: str) -> DateRangeStore:
+	"""
+	Retourne le stockage par jour des cours ('lessons') ou des devoirs ('homework') d'un client, en le créant au premier appel.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		kind (str): 'lessons' ou 'homework'
+
+	Returns:
+		DateRangeStore: Le stockage
+	"""
+
+	stores = getattr(client, 'date_range_stores', None)
+	if stores is None:
+		stores = client.date_range_stores = {
+			# sans heure, pronotepy exclut les cours du dernier jour : la fin de la plage est donc la fin de ce jour
+			'lessons': DateRangeStore(lambda dateFrom, dateTo: client.lessons(dateFrom, datetime.datetime.combine(dateTo, datetime.time.max)), lambda lesson: lesson.start.date(), cache_ttl['timetable']),
+			'homework': DateRangeStore(lambda dateFrom, dateTo: client.homework(date_from=dateFrom, date_to=dateTo), lambda homework: homework.date, cache_ttl['homework']),
+		}
+	return stores[kind]
+
+def __get_timetable_data(client: pronotepy.Client, dateToGet: datetime.date, refresh: bool = False) -> list[dict]:
+	"""
+	Construit l'emploi du temps d'une journée à partir de Pronote.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		dateToGet (datetime.date): La date à récupérer
+		refresh (bool, optional): Si True, les cours déjà récupérés pour ce jour sont ignorés (voir DateRangeStore.get). Defaults to False.
+
+	Returns:
+		list[dict]: Les cours de la journée (voir timetable)
+	"""
+
+	lessons = __get_date_range_store(client, 'lessons').get(dateToGet, dateToGet, refresh)
+
+	return [__get_lesson_data(lesson) for lesson in lessons]
+
+def __get_lesson_data(lesson: pronotepy.Lesson) -> dict:
+	"""
+	Construit les informations d'un cours.
+
+	Args:
+		lesson (pronotepy.Lesson): Le cours
+
+	Returns:
+		dict: Les informations du cours (voir timetable)
+	"""
+
+	return {
+		"id": lesson.id,
+		"num": lesson.num,
+		"subject": {
+			"id": lesson.subject.id if lesson.subject is not None else "0",
+			"name": lesson.subject.name if lesson.subject is not None else "",
+			"groups": lesson.subject.groups if lesson.subject is not None else False
+		},
+		"teachers": lesson.teacher_names,
+		"rooms": lesson.classrooms,
+		"group_names": lesson.group_names,
+		"memo": lesson.memo,
+		"virtual": lesson.virtual_classrooms,
+		"start": lesson.start,
+		"end": lesson.end,
+		"background_color": lesson.background_color,
+		"status": lesson.status,
+		"is_cancelled": lesson.canceled,
+		"is_outing": lesson.outing,
+		"is_detention": lesson.detention,
+		"is_exempted": lesson.exempted,
+		"is_test": lesson.test,
+	}
+
+def __get_timetable_range_data(client: pronotepy.Client, dateFrom: datetime.date, dateTo: datetime.date) -> dict[str, list[dict]]:
+	"""
+	Construit l'emploi du temps entre deux dates, jour par jour, en un seul appel à Pronote pour les jours manquants.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		dateFrom (datetime.date): La date de début
+		dateTo (datetime.date): La date de fin
+
+	Returns:
+		dict[str, list[dict]]: Les cours de chaque jour (voir timetable_range)
+	"""
+
+	lessonsData = {}
+	day = dateFrom
+	while day <= dateTo:
+		lessonsData[day.isoformat()] = []
+		day += datetime.timedelta(days=1)
+
+	for lesson in __get_date_range_store(client, 'lessons').get(dateFrom, dateTo):
+		lessonsData[lesson.start.date().isoformat()].append(__get_lesson_data(lesson))
+
+	return lessonsData
+
+
 @hug.get('/timetable')
 def timetable(token: str, dateString: str, response):
 	"""
@@ -431,40 +2658,96 @@ def timetable(token: str, dateString: str, response):
 
 	if success == 'ok':
 		if client.logged_in:
-			lessons = client.lessons(dateToGet)
-
-			lessonsData = []
-			for lesson in lessons:
-				lessonData = {
-					"id": lesson.id,
-					"num": lesson.num,
-					"subject": {
-						"id": lesson.subject.id if lesson.subject is not None else "0",
-						"name": lesson.subject.name if lesson.subject is not None else "",
-						"groups": lesson.subject.groups if lesson.subject is not None else False
-					},
-					"teachers": lesson.teacher_names,
-					"rooms": lesson.classrooms,
-					"group_names": lesson.group_names,
-					"memo": lesson.memo,
-					"virtual": lesson.virtual_classrooms,
-					"start": lesson.start.strftime("%Y-%m-%d %H:%M"),
-					"end": lesson.end.strftime("%Y-%m-%d %H:%M"),
-					"background_color": lesson.background_color,
-					"status": lesson.status,
-					"is_cancelled": lesson.canceled,
-					"is_outing": lesson.outing,
-					"is_detention": lesson.detention,
-					"is_exempted": lesson.exempted,
-					"is_test": lesson.test,
-				}
-				lessonsData.append(lessonData)
+			return __get_cached_data(token, 'timetable', (dateToGet.isoformat(),), __get_timetable_data, client, dateToGet)
+	else:
+		response.status = falcon.get_http_status(498)
+		return success
+
+timetable_range_max_days = 62 # le nombre max de jours demandés à /timetable/range
+
+@hug.get('/timetable/range')
+def timetable_range(token: str, dateFrom: str, dateTo: str, response):
+	"""
+	Récupère l'emploi du temps de l'utilisateur entre deux dates (une semaine, un mois...) en une seule requête.
+	
+	Args:
+		token (str): Le token du client Pronote
+		dateFrom (str): La date de début à récupérer sous la forme YYYY-MM-DD
+		dateTo (str): La date de fin à récupérer sous la forme YYYY-MM-DD
+		response (falcon.Response): La réponse de la requête
+		
+	Returns:
+		dict[str, list[dict]]: Les cours de chaque jour de la plage (même format que timetable), y compris les jours sans cours :
+		
+		{
+			"YYYY-MM-DD": [{
+				"id": str,
+				"num": int,
+				...
+			}]
+		}
+	"""
+	
+	dateFrom = datetime.datetime.strptime(dateFrom, "%Y-%m-%d").date()
+	dateTo = datetime.datetime.strptime(dateTo, "%Y-%m-%d").date()
+	if not 0 <= (dateTo - dateFrom).days < timetable_range_max_days:
+		response.status = falcon.get_http_status(400)
+		return {
+			"status": "error",
+			"error": f"La plage doit contenir entre 1 et {timetable_range_max_days} jours."
+		}
 
-			return lessonsData
+	success, client = get_client(token)
+
+	if success == 'ok':
+		if client.logged_in:
+			return __get_cached_data(token, 'timetable/range', (dateFrom.isoformat(), dateTo.isoformat()), __get_timetable_range_data, client, dateFrom, dateTo)
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
 
+def __get_content_data(client: pronotepy.Client, dateToGet: datetime.date) -> list[dict]:
+	"""
+	Construit le contenu des cours d'une journée à partir de Pronote.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		dateToGet (datetime.date): La date à récupérer
+
+	Returns:
+		list[dict]: Les contenus des cours (voir content)
+	"""
+
+	lessons = __get_date_range_store(client, 'lessons').get(dateToGet, dateToGet)
+
+	contentData = []
+	for lesson in lessons:
+		# pronotepy garde le contenu sur le cours : il n'est récupéré qu'une fois tant que le cours est dans le stockage
+		contentElement = lesson.content
+		if contentElement is None:
+			continue
+
+		files = []
+		for file in contentElement.files:
+			files.append({
+				"id": file.id,
+				"name": file.name,
+				"url": file.url,
+				"type": file.type
+			})
+		
+		contentList = {
+			"title": contentElement.title,
+			"description": contentElement.description,
+			"category": contentElement.category,
+			"files": files
+		}
+
+		contentData.append(contentList)
+
+	return contentData
+
+
 @hug.get('/content')
 def content(token: str, dateString: str, response):
 	"""
@@ -484,37 +2767,112 @@ def content(token: str, dateString: str, response):
 
 	if success == 'ok':
 		if client.logged_in:
-			content = client.lessons(dateToGet, dateToGet)
-
-			contentData = []
-			for lesson in content:
-				if lesson.content != None:
-					for contentElement in lesson.content:
-						files = []
-						for file in contentElement.files:
-							files.append({
-								"id": file.id,
-								"name": file.name,
-								"url": file.url,
-								"type": file.type
-							})
-						
-						contentList = {
-							"title": contentElement.title,
-							"description": contentElement.description,
-							"category": contentElement.category,
-							"files": files
-						}
-
-				contentData.append(contentList)
-
-			return contentData
+			return __run_upstream(token, __get_content_data, client, dateToGet)
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
 
+def __get_homework_local_id(homework: pronotepy.Homework) -> str:
+	"""
+	Construit l'identifiant local d'un devoir (utilisé par l'application pour /homework/changeState).
+
+	Args:
+		homework (pronotepy.Homework): Le devoir
+
+	Returns:
+		str: Les 20 premiers caractères de la description, les 2 premiers du nom de la matière et la date
+	"""
+
+	local_id = ""
+
+	# return a combination of the 20 first letters of description, 2 first letters of subject name and the date
+	if len(homework.description) > 20:
+		local_id += homework.description[:20]
+	else:
+		local_id += homework.description
+	
+	local_id += homework.subject.name[:2]
+	local_id += homework.date.strftime("%Y-%m-%d_%H:%M")
+	return local_id
+
+def __index_homework(client: pronotepy.Client, homework: pronotepy.Homework, local_id: str) -> None:
+	"""
+	Ajoute un devoir à l'index des devoirs du client (par identifiant Pronote et par identifiant local), utilisé par /homework/changeState.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		homework (pronotepy.Homework): Le devoir
+		local_id (str): L'identifiant local du devoir (voir __get_homework_local_id)
+	"""
+
+	index = getattr(client, 'homework_index', None)
+	if index is None:
+		index = client.homework_index = {}
+	index[homework.id] = homework
+	index[local_id] = homework
+
+def __iter_homework_data(client: pronotepy.Client, dateFrom: datetime.date, dateTo: datetime.date):
+	"""
+	Construit un par un les devoirs entre deux dates à partir de Pronote.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		dateFrom (datetime.date): La date de début
+		dateTo (datetime.date): La date de fin
+
+	Yields:
+		dict: Un devoir (voir homework)
+	"""
+
+	homeworks = __get_date_range_store(client, 'homework').get(dateFrom, dateTo)
+
+	for homework in homeworks:
+		files = []
+		for file in homework.files:
+			files.append({
+				"id": file.id,
+				"name": file.name,
+				"url": file.url,
+				"type": file.type
+			})
+
+		local_id = __get_homework_local_id(homework)
+		__index_homework(client, homework, local_id)
+
+		homeworkData = {
+			"id": homework.id,
+			"local_id": local_id,
+			"subject": {
+				"id": homework.subject.id,
+				"name": homework.subject.name,
+				"groups": homework.subject.groups,
+			},
+			"description": homework.description,
+			"background_color": homework.background_color,
+			"done": homework.done,
+			"date": homework.date,
+			"files": files
+		}
+		yield homeworkData
+
+def __get_homework_data(client: pronotepy.Client, dateFrom: datetime.date, dateTo: datetime.date) -> list[dict]:
+	"""
+	Construit la liste des devoirs entre deux dates à partir de Pronote.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		dateFrom (datetime.date): La date de début
+		dateTo (datetime.date): La date de fin
+
+	Returns:
+		list[dict]: Les devoirs (voir homework)
+	"""
+
+	return list(__iter_homework_data(client, dateFrom, dateTo))
+
+
 @hug.get('/homework')
-def homework(token: str, dateFrom: str, dateTo: str, response):
+def homework(token: str, dateFrom: str, dateTo: str, response, stream: hug.types.one_of(['json', 'ndjson'])='json'):
 	"""
 	Récupère les devoirs de l'utilisateur.
 	
@@ -523,6 +2881,7 @@ def homework(token: str, dateFrom: str, dateTo: str, response):
 		dateFrom (str): La date de début à récupérer sous la forme YYYY-MM-DD
 		dateTo (str): La date de fin à récupérer sous la forme YYYY-MM-DD
 		response (falcon.Response): La réponse de la requête
+		stream (str): "ndjson" pour recevoir un devoir par ligne au fur et à mesure. Par défaut, la liste est renvoyée en JSON.
 		
 	Returns:
 		list[dict]: Les informations des devoirs :
@@ -552,47 +2911,9 @@ def homework(token: str, dateFrom: str, dateTo: str, response):
 
 	if success == 'ok':
 		if client.logged_in:
-			homeworks = client.homework(date_from=dateFrom, date_to=dateTo)
-
-			homeworksData = []
-			for homework in homeworks:
-				files = []
-				for file in homework.files:
-					files.append({
-						"id": file.id,
-						"name": file.name,
-						"url": file.url,
-						"type": file.type
-					})
-
-				local_id = ""
-
-				# return a combination of the 20 first letters of description, 2 first letters of subject name and the date
-				if len(homework.description) > 20:
-					local_id += homework.description[:20]
-				else:
-					local_id += homework.description
-				
-				local_id += homework.subject.name[:2]
-				local_id += homework.date.strftime("%Y-%m-%d_%H:%M")
-
-				homeworkData = {
-					"id": homework.id,
-					"local_id": local_id,
-					"subject": {
-						"id": homework.subject.id,
-						"name": homework.subject.name,
-						"groups": homework.subject.groups,
-					},
-					"description": homework.description,
-					"background_color": homework.background_color,
-					"done": homework.done,
-					"date": homework.date.strftime("%Y-%m-%d %H:%M"),
-					"files": files
-				}
-				homeworksData.append(homeworkData)
-
-			return homeworksData
+			if stream == 'ndjson':
+				return __stream_cached_data(token, response, 'homework', (dateFrom.isoformat(), dateTo.isoformat()), __iter_homework_data(client, dateFrom, dateTo))
+			return __get_cached_data(token, 'homework', (dateFrom.isoformat(), dateTo.isoformat()), __get_homework_data, client, dateFrom, dateTo)
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
@@ -647,21 +2968,250 @@ def __get_grade_state(grade_value:str, significant:bool = False) -> int|str :
 			return "-1"
 
 
-def __transform_to_number(value:str)->float|int:
+def __transform_to_number(value:str)->float|int:
+	"""
+	Transforme une valeur en nombre (int ou float)
+	
+	Args:
+		value (str): La valeur à transformer
+		
+	Returns:
+		float|int: La valeur transformée ('1,5' -> 1.5)
+	"""
+	
+	try:
+		return int(value)
+	except ValueError:
+		return float(value.replace(",", "."))
+
+
+@functools.lru_cache(maxsize=4096)
+def __parse_grade_value(grade_value: str) -> float|int:
+	"""
+	Équivalent mémorisé de __transform_to_number(__get_grade_state(grade_value)) : les mêmes valeurs ("20", "1", "Absent"...) reviennent sans cesse.
+	"""
+
+	return __transform_to_number(__get_grade_state(grade_value))
+
+@functools.lru_cache(maxsize=256)
+def __parse_grade_state(grade_value: str) -> int:
+	"""
+	Équivalent mémorisé de __get_grade_state(grade_value, True).
+	"""
+
+	return __get_grade_state(grade_value, True)
+
+@functools.lru_cache(maxsize=1024)
+def __parse_number(value: str) -> float|int:
+	"""
+	Équivalent mémorisé de __transform_to_number(value).
+	"""
+
+	return __transform_to_number(value)
+
+# analyse des notes : les notes d'une période sont converties une seule fois en colonnes numériques
+grade_counted_states = (0, 6, 7) # les états des notes qui comptent dans la moyenne (note, Absent compte 0, Non Rendu compte 0)
+
+class GradeTable:
+	"""
+	Notes d'une période sous forme de colonnes (array) : une ligne par note, dans l'ordre de Pronote.
+
+	Les chaînes de Pronote (note, sur, coefficient, moyenne, min et max de la classe) sont converties une seule fois :
+	/grades lit ses valeurs dans les colonnes, et /grades/stats calcule les statistiques par matière à partir des notes
+	ramenées sur 20, sans relire les chaînes. Les notes qui ne comptent pas (Absent, Dispensé...) sont repérées par leur état.
+	"""
+
+	def __init__(self, grades: list[pronotepy.Grade], rows: list[tuple]):
+		"""
+		Args:
+			grades (list[pronotepy.Grade]): Les notes de Pronote
+			rows (list[tuple]): Pour chaque note : (valeur, sur, coefficient, moyenne, max, min, état, date ordinale)
+		"""
+
+		self.grades = grades
+		subjectIndex = {}
+		for grade in grades:
+			subjectIndex.setdefault(grade.subject.id, (len(subjectIndex), grade.subject))
+		self.subjects = [subject for _, subject in subjectIndex.values()] # matières, dans l'ordre d'apparition
+
+		value, outOf, coefficient, average, maximum, minimum, state, day = zip(*rows) if rows else ((),) * 8
+		self.subject = array.array('H', [subjectIndex[grade.subject.id][0] for grade in grades])
+		self.value = array.array('d', value) # telle que donnée par Pronote (-1 pour Absent, Dispensé...)
+		self.out_of = array.array('d', outOf)
+		self.coefficient = array.array('d', coefficient)
+		self.average = array.array('d', average) # moyenne de la classe
+		self.max = array.array('d', maximum)
+		self.min = array.array('d', minimum)
+		self.state = array.array('b', state)
+		self.day = array.array('l', day) # date (ordinal)
+		# sur 20, 0 pour Absent/Non Rendu compte 0
+		self.score = array.array('d', [v * 20 / o if s == 0 and o > 0 else 0 for v, o, s in zip(value, outOf, state)])
+		# 1 si la note compte dans la moyenne
+		self.counted = array.array('b', [
+			s in grade_counted_states and o > 0 and not grade.is_bonus and not grade.is_optionnal
+			for grade, o, s in zip(grades, outOf, state)
+		])
+
+	def grades_data(self) -> list[dict]:
+		"""
+		Construit la liste des notes renvoyée par /grades à partir des colonnes.
+
+		Returns:
+			list[dict]: Les notes (voir grades)
+		"""
+
+		number = self.__number
+		return [{
+			"id": grade.id,
+			"subject": {
+				"id": grade.subject.id,
+				"name": grade.subject.name,
+				"groups": grade.subject.groups,
+			},
+			"date": grade.date,
+			"description": grade.comment,
+			"is_bonus": grade.is_bonus,
+			"is_optional": grade.is_optionnal,
+			"is_out_of_20": grade.is_out_of_20,
+			"grade": {
+				"value": number(value),
+				"out_of": number(outOf),
+				"coefficient": number(coefficient),
+				"average": number(average),
+				"max": number(maximum),
+				"min": number(minimum),
+				"significant": state,
+			}
+		} for grade, value, outOf, coefficient, average, maximum, minimum, state in zip(
+			self.grades, self.value, self.out_of, self.coefficient, self.average, self.max, self.min, self.state
+		)]
+
+	@staticmethod
+	def __number(value: float) -> float|int:
+		# les colonnes sont en float : les valeurs entières sont renvoyées comme Pronote les donne ("15" -> 15)
+		return int(value) if value.is_integer() else value
+
+	def stats(self) -> list[dict]:
+		"""
+		Calcule les statistiques de chaque matière : moyenne pondérée, min, max et tendance (sur 20).
+		Les notes bonus et facultatives ne sont pas prises en compte.
+
+		Returns:
+			list[dict]: Les statistiques par matière (voir grades_stats)
+		"""
+
+		rows = [[] for _ in self.subjects]
+		for i, subject in enumerate(self.subject):
+			if self.counted[i]:
+				rows[subject].append(i)
+
+		subjectsData = []
+		for subject, indexes in zip(self.subjects, rows):
+			values = [self.score[i] for i in indexes]
+			coefficients = [self.coefficient[i] for i in indexes]
+			days = [self.day[i] for i in indexes]
+			weight = sum(coefficients)
+
+			subjectsData.append({
+				"subject": {
+					"id": subject.id,
+					"name": subject.name,
+					"groups": subject.groups,
+				},
+				"count": len(indexes),
+				"average": round(sum(value * coefficient for value, coefficient in zip(values, coefficients)) / weight, 2) if weight > 0 else None,
+				"min": min(values) if values else None,
+				"max": max(values) if values else None,
+				"trend": self.__trend(days, values),
+			})
+		return subjectsData
+
+	@staticmethod
+	def __trend(days: list[int], values: list[float]) -> float|None:
+		# pente de la droite des moindres carrés, en points sur 20 par tranche de 30 jours
+		if len(values) < 2:
+			return None
+		meanDay = sum(days) / len(days)
+		meanValue = sum(values) / len(values)
+		variance = sum((day - meanDay) ** 2 for day in days)
+		if variance == 0:
+			return None
+		covariance = sum((day - meanDay) * (value - meanValue) for day, value in zip(days, values))
+		return round(covariance / variance * 30, 2)
+
+def __get_grade_table(period: pronotepy.Period, refresh: bool = False) -> GradeTable:
 	"""
-	Transforme une valeur en nombre (int ou float)
-	
+	Retourne les notes d'une période sous forme de GradeTable.
+	Elles sont récupérées depuis Pronote au plus une fois toutes les cache_ttl['grades'] secondes et partagées par /grades et /grades/stats.
+
 	Args:
-		value (str): La valeur à transformer
-		
+		period (pronotepy.Period): La période
+		refresh (bool, optional): Si True, les notes sont récupérées à nouveau même si elles n'ont pas expiré. Defaults to False.
+
 	Returns:
-		float|int: La valeur transformée ('1,5' -> 1.5)
+		GradeTable: Les notes de la période
 	"""
-	
-	try:
-		return int(value)
-	except ValueError:
-		return float(value.replace(",", "."))
+
+	table = getattr(period, 'grade_table', None)
+	if refresh or table is None or table[0] < time.time():
+		allGrades = period.grades
+		rows = [(
+			__parse_grade_value(str(grade.grade)),
+			__parse_number(grade.out_of),
+			__parse_number(grade.coefficient),
+			__parse_grade_value(str(grade.average)),
+			__parse_grade_value(str(grade.max)),
+			__parse_grade_value(str(grade.min)),
+			__parse_grade_state(str(grade.grade)),
+			grade.date.toordinal(),
+		) for grade in allGrades]
+		table = (time.time() + cache_ttl['grades'], GradeTable(allGrades, rows))
+		period.grade_table = table
+	return table[1]
+
+def __get_grades_data(period: pronotepy.Period, refresh: bool = False) -> dict:
+	"""
+	Construit les notes et moyennes d'une période à partir de Pronote.
+
+	Args:
+		period (pronotepy.Period): La période à récupérer
+		refresh (bool, optional): Si True, les notes gardées avec la période sont récupérées à nouveau (voir __get_grade_table). Defaults to False.
+
+	Returns:
+		dict: Les notes et moyennes (voir grades)
+	"""
+
+	gradesData = __get_grade_table(period, refresh).grades_data()
+
+	averagesData = []
+
+	allAverages = period.averages
+	for average in allAverages:
+		averageData = {
+			"subject": {
+				"id": average.subject.id,
+				"name": average.subject.name,
+				"groups": average.subject.groups,
+			},
+			"average": __parse_grade_value(str(average.student)),
+			"class_average": __parse_grade_value(str(average.class_average)),
+			"max": __parse_grade_value(str(average.max)),
+			"min": __parse_grade_value(str(average.min)),
+			"out_of": __parse_grade_value(str(average.out_of)),
+			"significant": __parse_grade_state(str(average.student)),
+			"color": average.background_color if average.background_color != None else "#08BE88"
+		}
+
+		averagesData.append(averageData)
+
+	gradeReturn = {
+		"grades": gradesData,
+		"averages": averagesData,
+		"overall_average": __parse_grade_value(str(period.overall_average)),
+		"class_overall_average": __parse_grade_value(str(period.class_overall_average)),
+	}
+
+	return gradeReturn
 
 
 @hug.get('/grades')
@@ -719,68 +3269,135 @@ def grades(token: str, response):
 	
 	success, client = get_client(token)
 	if success == 'ok':
-		allGrades = client.calculated_period.grades
-		gradesData = []
-		for grade in allGrades:
-			gradeData = {
-				"id": grade.id,
-				"subject": {
-					"id": grade.subject.id,
-					"name": grade.subject.name,
-					"groups": grade.subject.groups,
-				},
-				"date": grade.date.strftime("%Y-%m-%d %H:%M"),
-				"description": grade.comment,
-				"is_bonus": grade.is_bonus,
-				"is_optional": grade.is_optionnal,
-				"is_out_of_20": grade.is_out_of_20,
-				"grade": {
-					"value": __transform_to_number(__get_grade_state(grade.grade)),
-					"out_of": __transform_to_number(grade.out_of),
-					"coefficient": __transform_to_number(grade.coefficient),
-					"average": __transform_to_number(__get_grade_state(grade.average)),
-					"max": __transform_to_number(__get_grade_state(grade.max)),
-					"min": __transform_to_number(__get_grade_state(grade.min)),
-					"significant": __get_grade_state(grade.grade, True),
-				}
-			}
+		return __get_cached_data(token, 'grades', (client.calculated_period.id,), __get_grades_data, client.calculated_period)
+	else:
+		response.status = falcon.get_http_status(498)
+		return success
 
-			gradesData.append(gradeData)
 
-		averagesData = []
+def __get_grades_stats_data(period: pronotepy.Period) -> dict:
+	"""
+	Construit les statistiques des notes d'une période (à partir des notes déjà récupérées par /grades si possible).
 
-		allAverages = client.calculated_period.averages
-		for average in allAverages:
-			averageData = {
-				"subject": {
-					"id": average.subject.id,
-					"name": average.subject.name,
-					"groups": average.subject.groups,
-				},
-				"average": __transform_to_number(__get_grade_state(average.student)),
-				"class_average": __transform_to_number(__get_grade_state(average.class_average)),
-				"max": __transform_to_number(__get_grade_state(average.max)),
-				"min": __transform_to_number(__get_grade_state(average.min)),
-				"out_of": __transform_to_number(__get_grade_state(average.out_of)),
-				"significant": __get_grade_state(average.student, True),
-				"color": average.background_color if average.background_color != None else "#08BE88"
-			}
+	Args:
+		period (pronotepy.Period): La période à récupérer
 
-			averagesData.append(averageData)
+	Returns:
+		dict: Les statistiques (voir grades_stats)
+	"""
 
-		gradeReturn = {
-			"grades": gradesData,
-			"averages": averagesData,
-			"overall_average": __transform_to_number(__get_grade_state(client.calculated_period.overall_average)),
-			"class_overall_average": __transform_to_number(__get_grade_state(client.calculated_period.class_overall_average)),
-		}
+	table = __get_grade_table(period)
+	subjectsData = table.stats()
+	averages = [subjectData["average"] for subjectData in subjectsData if subjectData["average"] is not None]
 
-		return gradeReturn
+	return {
+		"subjects": subjectsData,
+		"count": sum(table.counted),
+		"overall_average": round(sum(averages) / len(averages), 2) if averages else None,
+	}
+
+
+@hug.get('/grades/stats')
+def grades_stats(token: str, response):
+	"""
+	Calcule des statistiques sur les notes de la période sélectionnée, sans appel supplémentaire à Pronote si /grades a déjà été demandé.
+	Toutes les valeurs sont sur 20 ; les notes bonus, facultatives ou qui ne comptent pas (Absent, Dispensé...) sont ignorées,
+	les notes "Absent compte 0" et "Non Rendu compte 0" comptent pour 0.
+	
+	Args:
+		token (str): Le token du client Pronote
+		response (falcon.Response): La réponse de la requête
+		
+	Returns:
+		dict: Les statistiques des notes :
+		
+		{
+			"subjects": [{
+				"subject": {
+					"id": str,
+					"name": str,
+					"groups": bool
+				},
+				"count": int,
+				"average": float|None,
+				"min": float|None,
+				"max": float|None,
+				"trend": float|None (évolution en points par tranche de 30 jours)
+			}],
+			"count": int,
+			"overall_average": float|None (moyenne des moyennes des matières)
+		}
+	"""
+	
+	success, client = get_client(token)
+	if success == 'ok':
+		return __get_cached_data(token, 'grades/stats', (client.calculated_period.id,), __get_grades_stats_data, client.calculated_period)
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
 
 
+def __get_period_items(client: pronotepy.Client, kind: str, period: pronotepy.Period) -> list:
+	"""
+	Retourne les absences, retards ou punitions d'une période.
+	Une période terminée ne change plus : elle n'est récupérée qu'une fois depuis Pronote et gardée pour toute la session.
+	Celles en cours (ou à venir) sont récupérées à nouveau après cache_ttl[kind] secondes.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		kind (str): 'absences', 'delays' ou 'punishments'
+		period (pronotepy.Period): La période
+
+	Returns:
+		list: Les éléments de Pronote
+	"""
+
+	periodItems = getattr(client, 'period_items', None)
+	if periodItems is None:
+		periodItems = client.period_items = {}
+
+	key = (kind, period.id)
+	entry = periodItems.get(key)
+	if entry is None or (entry[0] is not None and entry[0] < time.time()):
+		items = getattr(period, kind)
+		closed = period.end.date() < datetime.date.today()
+		entry = (None if closed else time.time() + cache_ttl[kind], items)
+		periodItems[key] = entry
+	return entry[1]
+
+def __get_absences_data(client: pronotepy.Client, allPeriods: bool) -> list[dict]:
+	"""
+	Construit la liste des absences à partir de Pronote.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		allPeriods (bool): Si toutes les périodes doivent être récupérées
+
+	Returns:
+		list[dict]: Les absences (voir absences)
+	"""
+
+	if allPeriods:
+		allAbsences = [absence for period in client.activated_period for absence in __get_period_items(client, 'absences', period)]
+	else:
+		allAbsences = __get_period_items(client, 'absences', client.calculated_period)
+
+	absencesData = []
+	for absence in allAbsences:
+		absenceData = {
+			"id": absence.id,
+			"from": absence.from_date,
+			"to": absence.to_date,
+			"justified": absence.justified,
+			"hours": absence.hours,
+			"reasons": absence.reasons,
+		}
+
+		absencesData.append(absenceData)
+
+	return absencesData
+
+
 @hug.get('/absences')
 def absences(token: str, response, allPeriods: bool = True):
 	"""
@@ -806,30 +3423,45 @@ def absences(token: str, response, allPeriods: bool = True):
 	
 	success, client = get_client(token)
 	if success == 'ok':
-		if allPeriods:
-			allAbsences = [absence for period in client.activated_period for absence in period.absences]
-		else:
-			allAbsences = client.calculated_period.absences
-
-		absencesData = []
-		for absence in allAbsences:
-			absenceData = {
-				"id": absence.id,
-				"from": absence.from_date.strftime("%Y-%m-%d %H:%M"),
-				"to": absence.to_date.strftime("%Y-%m-%d %H:%M"),
-				"justified": absence.justified,
-				"hours": absence.hours,
-				"reasons": absence.reasons,
-			}
-
-			absencesData.append(absenceData)
-
-		return absencesData
+		return __get_cached_data(token, 'absences', __get_periods_key(client, allPeriods), __get_absences_data, client, allPeriods)
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
 
 
+def __get_delays_data(client: pronotepy.Client, allPeriods: bool) -> list[dict]:
+	"""
+	Construit la liste des retards à partir de Pronote.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		allPeriods (bool): Si toutes les périodes doivent être récupérées
+
+	Returns:
+		list[dict]: Les retards (voir delays)
+	"""
+
+	if allPeriods:
+		allDelays = [delay for period in client.activated_period for delay in __get_period_items(client, 'delays', period)]
+	else:
+		allDelays = __get_period_items(client, 'delays', client.calculated_period)
+	
+	delaysData = []
+	for delay in allDelays:
+		delayData = {
+			"id": delay.id,
+			"date": delay.date,
+			"duration": delay.minutes,
+			"justified": delay.justified,
+			"justification": delay.justification,
+			"reasons": delay.reasons,
+		}
+
+		delaysData.append(delayData)
+
+	return delaysData
+
+
 @hug.get('/delays')
 def delays(token: str, response, allPeriods: bool = True):
 	"""
@@ -855,32 +3487,99 @@ def delays(token: str, response, allPeriods: bool = True):
 	
 	success, client = get_client(token)
 	if success == 'ok':
-		if allPeriods:
-			allDelays = [delay for period in client.activated_period for delay in period.delays]
-		else:
-			allDelays = client.calculated_period.delays
-		
-		delaysData = []
-		for delay in allDelays:
-			delayData = {
-				"id": delay.id,
-				"date": delay.date.strftime("%Y-%m-%d %H:%M"),
-				"duration": delay.minutes,
-				"justified": delay.justified,
-				"justification": delay.justification,
-				"reasons": delay.reasons,
-			}
-
-			delaysData.append(delayData)
-
-		return delaysData
+		return __get_cached_data(token, 'delays', __get_periods_key(client, allPeriods), __get_delays_data, client, allPeriods)
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
 
 
+def __iter_punishments_data(client: pronotepy.Client, allPeriods: bool):
+	"""
+	Construit une par une les punitions à partir de Pronote (les périodes sont récupérées au fur et à mesure).
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		allPeriods (bool): Si toutes les périodes doivent être récupérées
+
+	Yields:
+		dict: Une punition (voir punishments)
+	"""
+
+	if allPeriods:
+		allPunishments = (punishment for period in client.activated_period for punishment in __get_period_items(client, 'punishments', period))
+	else:
+		allPunishments = __get_period_items(client, 'punishments', client.calculated_period)
+	
+	for punishment in allPunishments:
+		homeworkDocs = []
+		if punishment.homework_documents is not None:
+			for homeworkDoc in punishment.homework_documents:
+				homeworkDocs.append({
+					"id": homeworkDoc.id,
+					"name": homeworkDoc.name,
+					"url": homeworkDoc.url,
+					"type": homeworkDoc.type
+				})
+
+		circumstanceDocs = []
+		if punishment.circumstance_documents is not None:
+			for circumstanceDoc in punishment.circumstance_documents:
+				circumstanceDocs.append({
+					"id": circumstanceDoc.id,
+					"name": circumstanceDoc.name,
+					"url": circumstanceDoc.url,
+					"type": circumstanceDoc.type
+				})
+
+		schedules = []
+		if punishment.schedule is not None:
+			for schedule in punishment.schedule:
+				schedules.append({
+					"id": schedule.id,
+					"start": schedule.start,
+					"duration": schedule.duration,
+				})
+
+		punishmentData = {
+			"id": punishment.id,
+			"schedulable": punishment.schedulable,
+			"schedule": schedules,
+			"date": punishment.given,
+			"given_by": punishment.giver,
+			"exclusion": punishment.exclusion,
+			"during_lesson": punishment.during_lesson,
+			"homework": {
+				"text": punishment.homework,
+				"documents": homeworkDocs,
+			},
+			"reason": {
+				"text": punishment.reasons,
+				"circumstances": punishment.circumstances,
+				"documents": circumstanceDocs,
+			},
+			"nature": punishment.nature,
+			"duration": punishment.duration
+		}
+
+		yield punishmentData
+
+def __get_punishments_data(client: pronotepy.Client, allPeriods: bool) -> list[dict]:
+	"""
+	Construit la liste des punitions à partir de Pronote.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		allPeriods (bool): Si toutes les périodes doivent être récupérées
+
+	Returns:
+		list[dict]: Les punitions (voir punishments)
+	"""
+
+	return list(__iter_punishments_data(client, allPeriods))
+
+
 @hug.get('/punishments')
-def punishments(token: str, response, allPeriods: bool = True):
+def punishments(token: str, response, allPeriods: bool = True, stream: hug.types.one_of(['json', 'ndjson'])='json'):
 	"""
 	Récupère les punitions de l'utilisateur.
 	
@@ -888,6 +3587,7 @@ def punishments(token: str, response, allPeriods: bool = True):
 		token (str): Le token du client Pronote
 		response (falcon.Response): La réponse de la requête
 		allPeriods (bool): Si toutes les périodes doivent être récupérées. Par défaut, toutes les périodes sont récupérées.
+		stream (str): "ndjson" pour recevoir une punition par ligne au fur et à mesure. Par défaut, la liste est renvoyée en JSON.
 		
 	Returns:
 		list[dict]: Les informations des punitions :
@@ -931,79 +3631,77 @@ def punishments(token: str, response, allPeriods: bool = True):
 	
 	success, client = get_client(token)
 	if success == 'ok':
-		if allPeriods:
-			allPunishments = [punishment for period in client.activated_period for punishment in period.punishments]
-		else:
-			allPunishments = client.calculated_period.punishments
-		
-		punishmentsData = []
-		for punishment in allPunishments:
-			homeworkDocs = []
-			if punishment.homework_documents is not None:
-				for homeworkDoc in punishment.homework_documents:
-					homeworkDocs.append({
-						"id": homeworkDoc.id,
-						"name": homeworkDoc.name,
-						"url": homeworkDoc.url,
-						"type": homeworkDoc.type
-					})
-
-			circumstanceDocs = []
-			if punishment.circumstance_documents is not None:
-				for circumstanceDoc in punishment.circumstance_documents:
-					circumstanceDocs.append({
-						"id": circumstanceDoc.id,
-						"name": circumstanceDoc.name,
-						"url": circumstanceDoc.url,
-						"type": circumstanceDoc.type
-					})
-
-			schedules = []
-			if punishment.schedule is not None:
-				for schedule in punishment.schedule:
-					schedules.append({
-						"id": schedule.id,
-						"start": schedule.start.strftime("%Y-%m-%d %H:%M"),
-						"duration": schedule.duration,
-					})
-
-			punishmentData = {
-				"id": punishment.id,
-				"schedulable": punishment.schedulable,
-				"schedule": schedules,
-				"date": punishment.given.strftime("%Y-%m-%d %H:%M"),
-				"given_by": punishment.giver,
-				"exclusion": punishment.exclusion,
-				"during_lesson": punishment.during_lesson,
-				"homework": {
-					"text": punishment.homework,
-					"documents": homeworkDocs,
-				},
-				"reason": {
-					"text": punishment.reasons,
-					"circumstances": punishment.circumstances,
-					"documents": circumstanceDocs,
-				},
-				"nature": punishment.nature,
-				"duration": punishment.duration
-			}
-
-			punishmentsData.append(punishmentData)
-
-		return punishmentsData
+		if stream == 'ndjson':
+			return __stream_cached_data(token, response, 'punishments', __get_periods_key(client, allPeriods), __iter_punishments_data(client, allPeriods))
+		return __get_cached_data(token, 'punishments', __get_periods_key(client, allPeriods), __get_punishments_data, client, allPeriods)
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
 
 
+def __iter_news_data(client: pronotepy.Client):
+	"""
+	Construit une par une les actualités à partir de Pronote.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+
+	Yields:
+		dict: Une actualité (voir news)
+	"""
+
+	allNews = client.information_and_surveys()
+
+	for news in allNews:
+		attachments = []
+		if news.attachments is not None:
+			for attachment in news.attachments:
+				attachments.append({
+					"id": attachment.id,
+					"name": attachment.name,
+					"url": attachment.url,
+					"type": attachment.type
+				})
+
+		newsData = {
+			"id": news.id,
+			"title": news.title,
+			"date": news.creation_date,
+			"category": news.category,
+			"read": news.read,
+			"survey": news.survey,
+			"anonymous_survey": news.anonymous_response,
+			"author": news.author,
+			"content": news.content,
+			"attachments": attachments,
+			"html_content": news._raw_content
+		}
+
+		yield newsData
+
+def __get_news_data(client: pronotepy.Client) -> list[dict]:
+	"""
+	Construit la liste des actualités à partir de Pronote.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+
+	Returns:
+		list[dict]: Les actualités (voir news)
+	"""
+
+	return list(__iter_news_data(client))
+
+
 @hug.get('/news')
-def news(token: str, response):
+def news(token: str, response, stream: hug.types.one_of(['json', 'ndjson'])='json'):
 	"""
 	Récupère les actualités de l'utilisateur.
 	
 	Args:
 		token (str): Le token du client Pronote
 		response (falcon.Response): La réponse de la requête
+		stream (str): "ndjson" pour recevoir une actualité par ligne au fur et à mesure. Par défaut, la liste est renvoyée en JSON.
 		
 	Returns:
 		list[dict]: Les informations des actualités :
@@ -1030,50 +3728,76 @@ def news(token: str, response):
  
 	success, client = get_client(token)
 	if success == 'ok':
-		allNews = client.information_and_surveys()
-
-		newsAllData = []
-		for news in allNews:
-			attachments = []
-			if news.attachments is not None:
-				for attachment in news.attachments:
-					attachments.append({
-						"id": attachment.id,
-						"name": attachment.name,
-						"url": attachment.url,
-						"type": attachment.type
-					})
-
-			newsData = {
-				"id": news.id,
-				"title": news.title,
-				"date": news.creation_date.strftime("%Y-%m-%d %H:%M"),
-				"category": news.category,
-				"read": news.read,
-				"survey": news.survey,
-				"anonymous_survey": news.anonymous_response,
-				"author": news.author,
-				"content": news.content,
-				"attachments": attachments,
-				"html_content": news._raw_content
-			}
-
-			newsAllData.append(newsData)
-
-		return newsAllData
+		if stream == 'ndjson':
+			return __stream_cached_data(token, response, 'news', (), __iter_news_data(client))
+		return __get_cached_data(token, 'news', (), __get_news_data, client)
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
 
 
+def __iter_discussions_data(client: pronotepy.Client):
+	"""
+	Construit une par une les discussions à partir de Pronote (les messages sont récupérés au fur et à mesure).
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+
+	Yields:
+		dict: Une discussion (voir discussions)
+	"""
+
+	allDiscussions = client.discussions()
+	__index_discussions(client, allDiscussions)
+
+	for discussion in allDiscussions:
+		messages = []
+		for message in discussion.messages:
+			messages.append({
+				"id": message.id,
+				"content": message.content,
+				"author": message.author,
+				"date": message.date,
+				"seen": message.seen
+			})
+
+		discussionData = {
+			"id": discussion.id,
+			"subject": discussion.subject,
+			"creator": discussion.creator,
+			"participants": discussion.participants,
+			"date": discussion.date,
+			"unread": discussion.unread,
+			"closed": discussion.close,
+			"replyable": discussion.replyable,
+			"messages": messages,
+		}
+
+		yield discussionData
+
+def __get_discussions_data(client: pronotepy.Client) -> list[dict]:
+	"""
+	Construit la liste des discussions à partir de Pronote.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+
+	Returns:
+		list[dict]: Les discussions (voir discussions)
+	"""
+
+	return list(__iter_discussions_data(client))
+
+
 @hug.get('/discussions')
-def discussions(token: str, response):
+def discussions(token: str, response, stream: hug.types.one_of(['json', 'ndjson'])='json'):
 	"""
 	Récupère les discussions de l'utilisateur.
 	
 	Args:
 		token (str): Le token du client Pronote
 		response (falcon.Response): La réponse de la requête
+		stream (str): "ndjson" pour recevoir une discussion par ligne au fur et à mesure. Par défaut, la liste est renvoyée en JSON.
 		
 	Returns:
 		list[dict]: Les informations des discussions :
@@ -1098,39 +3822,47 @@ def discussions(token: str, response):
 	
 	success, client = get_client(token)
 	if success == 'ok':
-		allDiscussions = client.discussions()
-
-		discussionsAllData = []
-		for discussion in allDiscussions:
-			messages = []
-			for message in discussion.messages:
-				messages.append({
-					"id": message.id,
-					"content": message.content,
-					"author": message.author,
-					"date": message.date.strftime("%Y-%m-%d %H:%M") if message.date is not None else None,
-					"seen": message.seen
-				})
-
-			discussionData = {
-				"subject": discussion.subject,
-				"creator": discussion.creator,
-				"participants": discussion.participants,
-				"date": discussion.date.strftime("%Y-%m-%d %H:%M") if discussion.date is not None else None,
-				"unread": discussion.unread,
-				"closed": discussion.close,
-				"replyable": discussion.replyable,
-				"messages": messages,
-			}
-
-			discussionsAllData.append(discussionData)
-
-		return discussionsAllData
+		if stream == 'ndjson':
+			return __stream_cached_data(token, response, 'discussions', (), __iter_discussions_data(client))
+		return __get_cached_data(token, 'discussions', (), __get_discussions_data, client)
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
 
 
+def __index_discussions(client: pronotepy.Client, allDiscussions: list[pronotepy.Discussion]) -> None:
+	"""
+	Remplace l'index des discussions d'un client (identifiant -> discussion), utilisé par les routes /discussion/*.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		allDiscussions (list[pronotepy.Discussion]): Les discussions récupérées depuis Pronote
+	"""
+
+	client.discussion_index = {discussion.id: discussion for discussion in allDiscussions}
+
+def __get_discussion(token: str, client: pronotepy.Client, discussionId: str) -> pronotepy.Discussion|None:
+	"""
+	Retourne une discussion à partir de son identifiant.
+	L'index rempli par /discussions est utilisé en priorité, la liste n'est récupérée depuis Pronote que si la discussion n'y est pas.
+
+	Args:
+		token (str): Le token du client Pronote
+		client (pronotepy.Client): Le client Pronote
+		discussionId (str): L'identifiant de la discussion
+
+	Returns:
+		pronotepy.Discussion|None: La discussion, ou None si elle n'existe pas.
+	"""
+
+	index = getattr(client, 'discussion_index', None)
+	if index is not None and discussionId in index:
+		return index[discussionId]
+
+	__index_discussions(client, __run_upstream(token, client.discussions))
+	return client.discussion_index.get(discussionId)
+
+
 @hug.post('/discussion/delete')
 def delete_discussion(token: str, discussionId: str, response):
 	"""
@@ -1148,20 +3880,21 @@ def delete_discussion(token: str, discussionId: str, response):
 	success, client = get_client(token)
 	if success == 'ok':
 		try:
-			allDiscussions = client.discussions()
-			for discussion in allDiscussions:
-				if discussion.id == discussionId:
-					discussion.delete()
-					return {
-						"status": "ok",
-						"error": None
-					}
-				else:
-					response.status = falcon.get_http_status(404)
-					return {
-						"status": "not found",
-						"error": "La discussion n'a pas été trouvée."
-					}
+			discussion = __get_discussion(token, client, discussionId)
+			if discussion is None:
+				response.status = falcon.get_http_status(404)
+				return {
+					"status": "not found",
+					"error": "La discussion n'a pas été trouvée."
+				}
+
+			__run_upstream(token, discussion.delete)
+			client.discussion_index.pop(discussionId, None)
+			__invalidate_cached_data(token, 'discussions')
+			return {
+				"status": "ok",
+				"error": None
+			}
 		except Exception as e:
 			response.status = falcon.get_http_status(500)
 			return {
@@ -1189,21 +3922,25 @@ def read_discussion(token: str, discussionId: str, response):
 	success, client = get_client(token)
 	if success == 'ok':
 		try:
-			allDiscussions = client.discussions()
-			for discussion in allDiscussions:
-				if discussion.id == discussionId:
-					if discussion.unread == 0: discussion.mark_as(False)
-					else: discussion.mark_as(True)
-					return {
-						"status": "ok",
-						"error": None
-					}
-				else:
-					response.status = falcon.get_http_status(404)
-					return {
-						"status": "not found",
-						"error": "La discussion n'a pas été trouvée."
-					}
+			discussion = __get_discussion(token, client, discussionId)
+			if discussion is None:
+				response.status = falcon.get_http_status(404)
+				return {
+					"status": "not found",
+					"error": "La discussion n'a pas été trouvée."
+				}
+
+			if discussion.unread == 0:
+				__run_upstream(token, discussion.mark_as, False)
+				discussion.unread = 1
+			else:
+				__run_upstream(token, discussion.mark_as, True)
+				discussion.unread = 0
+			__invalidate_cached_data(token, 'discussions')
+			return {
+				"status": "ok",
+				"error": None
+			}
 		except Exception as e:
 			response.status = falcon.get_http_status(500)
 			return {
@@ -1232,27 +3969,27 @@ def reply_discussion(token: str, discussionId: str, content: str, response):
 	success, client = get_client(token)
 	if success == 'ok':
 		try:
-			allDiscussions = client.discussions()
-			for discussion in allDiscussions:
-				if discussion.id == discussionId:
-					if discussion.replyable:
-						discussion.reply(content)
-						return {
-							"status": "ok",
-							"error": None
-						}
-					else:
-						response.status = falcon.get_http_status(403)
-						return {
-							"status": "not replyable",
-							"error": "La discussion n'est pas ouverte à la réponse."
-						}
-				else:
-					response.status = falcon.get_http_status(404)
-					return {
-						"status": "not found",
-						"error": "La discussion n'a pas été trouvée."
-					}
+			discussion = __get_discussion(token, client, discussionId)
+			if discussion is None:
+				response.status = falcon.get_http_status(404)
+				return {
+					"status": "not found",
+					"error": "La discussion n'a pas été trouvée."
+				}
+
+			if discussion.replyable:
+				__run_upstream(token, discussion.reply, content)
+				__invalidate_cached_data(token, 'discussions')
+				return {
+					"status": "ok",
+					"error": None
+				}
+			else:
+				response.status = falcon.get_http_status(403)
+				return {
+					"status": "not replyable",
+					"error": "La discussion n'est pas ouverte à la réponse."
+				}
 		except Exception as e:
 			response.status = falcon.get_http_status(500)
 			return {
@@ -1264,6 +4001,53 @@ def reply_discussion(token: str, discussionId: str, content: str, response):
 		return success
 
 
+def __get_recipient_directory(client: pronotepy.Client) -> dict:
+	"""
+	Retourne l'annuaire des destinataires d'un client (identifiant -> destinataire).
+	Il est récupéré depuis Pronote au plus une fois toutes les cache_ttl['recipients'] secondes et partagé par /recipients et /discussion/create.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+
+	Returns:
+		dict[str, pronotepy.Recipient]: Les destinataires par identifiant, dans l'ordre de Pronote
+	"""
+
+	directory = getattr(client, 'recipient_directory', None)
+	if directory is None or directory[0] < time.time():
+		directory = (time.time() + cache_ttl['recipients'], {recipient.id: recipient for recipient in client.get_recipients()})
+		client.recipient_directory = directory
+	return directory[1]
+
+def __get_recipients_data(client: pronotepy.Client) -> list[dict]:
+	"""
+	Construit la liste des destinataires possibles à partir de Pronote.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+
+	Returns:
+		list[dict]: Les destinataires (voir recipients)
+	"""
+
+	allRecipients = __get_recipient_directory(client).values()
+
+	recipientsAllData = []
+	for recipient in allRecipients:
+		recipientData = {
+			"id": recipient.id,
+			"name": recipient.name,
+			"type": recipient.type,
+			"email": recipient.email,
+			"functions": recipient.functions,
+			"with_discussion": recipient.with_discussion
+		}
+
+		recipientsAllData.append(recipientData)
+	
+	return recipientsAllData
+
+
 @hug.get('/recipients')
 def recipients(token: str, response):
 	"""
@@ -1288,22 +4072,7 @@ def recipients(token: str, response):
 	
 	success, client = get_client(token)
 	if success == 'ok':
-		allRecipients = client.get_recipients()
-
-		recipientsAllData = []
-		for recipient in allRecipients:
-			recipientData = {
-				"id": recipient.id,
-				"name": recipient.name,
-				"type": recipient.type,
-				"email": recipient.email,
-				"functions": recipient.functions,
-				"with_discussion": recipient.with_discussion
-			}
-
-			recipientsAllData.append(recipientData)
-		
-		return recipientsAllData
+		return __get_cached_data(token, 'recipients', (), __get_recipients_data, client)
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
@@ -1328,11 +4097,8 @@ def create_discussion(token: str, subject: str, content: str, recipientsId: str,
 	success, client = get_client(token)
 	if success == 'ok':
 		try:
-			prn_recipients = []
-			for recipient in json.loads(recipientsId):
-				for prn_recipient in client.get_recipients():
-					if prn_recipient.id == recipient:
-						prn_recipients.append(prn_recipient)
+			directory = __run_upstream(token, __get_recipient_directory, client)
+			prn_recipients = [directory[recipient] for recipient in json.loads(recipientsId) if recipient in directory]
 						
 			if len(prn_recipients) == 0:
 				response.status = falcon.get_http_status(400)
@@ -1349,7 +4115,8 @@ def create_discussion(token: str, subject: str, content: str, recipientsId: str,
 						"error": "Un ou plusieurs destinataires n'acceptent pas les discussions."
 					}
 					
-			client.new_discussion(subject, content, prn_recipients)
+			__run_upstream(token, client.new_discussion, subject, content, prn_recipients)
+			__invalidate_cached_data(token, 'discussions')
 			return {
 				"status": "ok",
 				"error": None
@@ -1365,6 +4132,54 @@ def create_discussion(token: str, subject: str, content: str, recipientsId: str,
 		return success
 
 
+def __get_evaluations_data(period: pronotepy.Period) -> list[dict]:
+	"""
+	Construit la liste des évaluations d'une période à partir de Pronote.
+
+	Args:
+		period (pronotepy.Period): La période à récupérer
+
+	Returns:
+		list[dict]: Les évaluations (voir evaluations)
+	"""
+
+	allEvaluations = period.evaluations
+
+	evaluationsAllData = []
+	for evaluation in allEvaluations:
+		acquisitions = []
+		if evaluation.acquisitions is not None:
+			for acquisition in evaluation.acquisitions:
+				acquisitions.append({
+					"id": acquisition.id,
+					"name": acquisition.name,
+					"coefficient": acquisition.coefficient,
+					"abbreviation": acquisition.abbreviation,
+					"domain": acquisition.domain,
+					"level": acquisition.level
+				})
+
+		evaluationData = {
+			"id": evaluation.id,
+			"subject": {
+				"id": evaluation.subject.id,
+				"name": evaluation.subject.name,
+				"groups": evaluation.subject.groups,
+			},
+			"name": evaluation.name,
+			"description": evaluation.description,
+			"teacher": evaluation.teacher,
+			"date": evaluation.date,
+			"paliers": evaluation.paliers,
+			"coefficient": evaluation.coefficient,
+			"acquisitions": acquisitions,
+		}
+
+		evaluationsAllData.append(evaluationData)
+
+	return evaluationsAllData
+
+
 @hug.get('/evaluations')
 def evaluations(token: str, response):
 	"""
@@ -1403,41 +4218,7 @@ def evaluations(token: str, response):
 	
 	success, client = get_client(token)
 	if success == 'ok':
-		allEvaluations = client.calculated_period.evaluations
-
-		evaluationsAllData = []
-		for evaluation in allEvaluations:
-			acquisitions = []
-			if evaluation.acquisitions is not None:
-				for acquisition in evaluation.acquisitions:
-					acquisitions.append({
-						"id": acquisition.id,
-						"name": acquisition.name,
-						"coefficient": acquisition.coefficient,
-						"abbreviation": acquisition.abbreviation,
-						"domain": acquisition.domain,
-						"level": acquisition.level
-					})
-
-			evaluationData = {
-				"id": evaluation.id,
-				"subject": {
-					"id": evaluation.subject.id,
-					"name": evaluation.subject.name,
-					"groups": evaluation.subject.groups,
-				},
-				"name": evaluation.name,
-				"description": evaluation.description,
-				"teacher": evaluation.teacher,
-				"date": evaluation.date.strftime("%Y-%m-%d %H:%M"),
-				"paliers": evaluation.paliers,
-				"coefficient": evaluation.coefficient,
-				"acquisitions": acquisitions,
-			}
-
-			evaluationsAllData.append(evaluationData)
-
-		return evaluationsAllData
+		return __get_cached_data(token, 'evaluations', (client.calculated_period.id,), __get_evaluations_data, client.calculated_period)
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
@@ -1487,6 +4268,51 @@ def __get_food_labels(labels: list[dict]):
 			})
 		return foodLabels
 
+def __get_menu_data(client: pronotepy.Client, dateFrom: datetime.date, dateTo: datetime.date) -> list[dict]:
+	"""
+	Construit la liste des menus entre deux dates à partir de Pronote.
+
+	Args:
+		client (pronotepy.Client): Le client Pronote
+		dateFrom (datetime.date): La date de début
+		dateTo (datetime.date): La date de fin
+
+	Returns:
+		list[dict]: Les menus (voir menu)
+	"""
+
+	allMenus = client.menus(date_from=dateFrom, date_to=dateTo)
+
+	menusAllData = []
+	for menu in allMenus:
+		cheese = __get_meal_food(menu.cheese)
+		dessert = __get_meal_food(menu.dessert)
+		other_meal = __get_meal_food(menu.other_meal)
+		side_meal = __get_meal_food(menu.side_meal)
+		main_meal = __get_meal_food(menu.main_meal)
+		first_meal = __get_meal_food(menu.first_meal)
+
+		menuData = {
+			"id": menu.id,
+			"name": menu.name,
+			"date": menu.date.strftime("%Y-%m-%d"),
+			"type": {
+				"is_lunch": menu.is_lunch,
+				"is_dinner": menu.is_dinner,
+			},
+			"first_meal": first_meal,
+			"dessert": dessert,
+			"cheese": cheese,
+			"other_meal": other_meal,
+			"side_meal": side_meal,
+			"main_meal": main_meal,
+		}
+
+		menusAllData.append(menuData)
+
+	return menusAllData
+
+
 @hug.get('/menu')
 def menu(token: str, dateFrom: str, dateTo: str, response):
 	"""
@@ -1522,36 +4348,7 @@ def menu(token: str, dateFrom: str, dateTo: str, response):
 	dateTo = datetime.datetime.strptime(dateTo, "%Y-%m-%d").date()
 	success, client = get_client(token)
 	if success == 'ok':
-		allMenus = client.menus(date_from=dateFrom, date_to=dateTo)
-
-		menusAllData = []
-		for menu in allMenus:
-			cheese = __get_meal_food(menu.cheese)
-			dessert = __get_meal_food(menu.dessert)
-			other_meal = __get_meal_food(menu.other_meal)
-			side_meal = __get_meal_food(menu.side_meal)
-			main_meal = __get_meal_food(menu.main_meal)
-			first_meal = __get_meal_food(menu.first_meal)
-
-			menuData = {
-				"id": menu.id,
-				"name": menu.name,
-				"date": menu.date.strftime("%Y-%m-%d"),
-				"type": {
-					"is_lunch": menu.is_lunch,
-					"is_dinner": menu.is_dinner,
-				},
-				"first_meal": first_meal,
-				"dessert": dessert,
-				"cheese": cheese,
-				"other_meal": other_meal,
-				"side_meal": side_meal,
-				"main_meal": main_meal,
-			}
-
-			menusAllData.append(menuData)
-
-		return menusAllData
+		return __get_establishment_data(token, client, 'menu', (dateFrom.isoformat(), dateTo.isoformat()), __get_menu_data, client, dateFrom, dateTo)
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
@@ -1571,7 +4368,7 @@ def export_ical(token: str, response):
 	
 	success, client = get_client(token)
 	if success == 'ok':
-		ical_url = client.export_ical()
+		ical_url = __run_upstream(token, client.export_ical)
 		return ical_url
 	else:
 		response.status = falcon.get_http_status(498)
@@ -1587,7 +4384,7 @@ def set_homework_as_done(token: str, dateFrom: str, dateTo: str, homeworkId: str
 		token (str): Le token du client Pronote
 		dateFrom (str): La date de début
 		dateTo (str): La date de fin
-		homeworkId (str): Le LocaID du devoir
+		homeworkId (str): Le LocaID du devoir (ou son identifiant Pronote)
 		response (falcon.Response): La réponse de la requête
 		
 	Returns:
@@ -1601,35 +4398,34 @@ def set_homework_as_done(token: str, dateFrom: str, dateTo: str, homeworkId: str
 	if success == 'ok':
 		if client.logged_in:
 			try:
-				homeworks = client.homework(date_from=dateFrom, date_to=dateTo)
-				
-				for homework in homeworks:
-					local_id = ""
+				# les devoirs déjà renvoyés par /homework sont dans l'index, la plage n'est récupérée que si le devoir n'y est pas
+				homework = getattr(client, 'homework_index', {}).get(homeworkId)
+				if homework is None:
+					for homework in __run_upstream(token, __get_date_range_store(client, 'homework').get, dateFrom, dateTo):
+						__index_homework(client, homework, __get_homework_local_id(homework))
+					homework = getattr(client, 'homework_index', {}).get(homeworkId)
 
-					# return a combination of the 20 first letters of description, 2 first letters of subject name and the date
-					if len(homework.description) > 20:
-						local_id += homework.description[:20]
-					else:
-						local_id += homework.description
-					
-					local_id += homework.subject.name[:2]
-					local_id += homework.date.strftime("%Y-%m-%d_%H:%M")
-
-					changed = False
-					if local_id == homeworkId:
-						if homework.done: homework.set_done(False)
-						else: homework.set_done(True)
-						changed = True
-						return {
-							"status": "ok",
-							"error": None
-						}
-				if not changed:
+				if homework is None:
 					response.status = falcon.get_http_status(404)
 					return {
 						"status": "not found",
 						"error": "Aucun devoir trouvé avec cet ID local."
 					}
+
+				if homework.done: __run_upstream(token, homework.set_done, False)
+				else: __run_upstream(token, homework.set_done, True)
+
+				# le devoir est mis à jour directement dans les plages de dates en cache qui le contiennent
+				homeworkDate = homework.date.strftime("%Y-%m-%d")
+				local_id = __get_homework_local_id(homework)
+				for homeworksData in __find_cached_data(token, 'homework', lambda args: args[0] <= homeworkDate <= args[1]):
+					for homeworkData in homeworksData:
+						if homeworkData["local_id"] == local_id:
+							homeworkData["done"] = homework.done
+				return {
+					"status": "ok",
+					"error": None
+				}
 			except Exception as e:
 				response.status = falcon.get_http_status(500)
 				return {
@@ -1639,3 +4435,414 @@ def set_homework_as_done(token: str, dateFrom: str, dateTo: str, homeworkId: str
 	else:
 		response.status = falcon.get_http_status(498)
 		return success
+
+
+# requêtes groupées
+batch_max_requests = 20 # le nombre max de sous-requêtes dans un /batch
+batch_max_workers = int(os.environ.get('PAPILLON_BATCH_WORKERS', 32)) # le nombre max de sous-requêtes cherchées en cache en parallèle
+batch_pool = concurrent.futures.ThreadPoolExecutor(max_workers=batch_max_workers, thread_name_prefix='batch')
+batch_endpoints = {
+	'/user': user,
+	'/timetable': timetable,
+	'/timetable/range': timetable_range,
+	'/content': content,
+	'/homework': homework,
+	'/grades': grades,
+	'/grades/stats': grades_stats,
+	'/evaluations': evaluations,
+	'/absences': absences,
+	'/delays': delays,
+	'/punishments': punishments,
+	'/news': news,
+	'/discussions': discussions,
+	'/recipients': recipients,
+	'/menu': menu,
+	'/export/ical': export_ical,
+} # les routes de lecture utilisables dans /batch
+
+def __run_batch_request(token: str, query: dict, phase: str|None = None) -> dict|None:
+	"""
+	Exécute une sous-requête de /batch en appelant directement la fonction de la route.
+
+	Args:
+		token (str): Le token du client Pronote
+		query (dict): La sous-requête sous la forme {"endpoint": str, "params": dict}
+		phase (str, optional): 'lookup' pour ne répondre que depuis le cache, 'upstream' si la sous-requête a déjà été cherchée en cache. Defaults to None.
+
+	Returns:
+		dict|None: Le résultat de la sous-requête sous la forme {"endpoint": str, "status": int, "data": Any}, ou None si elle doit appeler Pronote en phase 'lookup'
+	"""
+
+	endpoint = '/' + str(query.get('endpoint', '')).strip('/')
+	if endpoint not in batch_endpoints:
+		return {
+			"endpoint": endpoint,
+			"status": 404,
+			"data": None,
+			"error": "Route inconnue."
+		}
+
+	route = batch_endpoints[endpoint]
+	params = dict(query.get('params') or {})
+	params.pop('stream', None) # les sous-requêtes sont toujours renvoyées en JSON
+	for name, value in params.items():
+		if route.__annotations__.get(name) is bool and isinstance(value, str):
+			params[name] = hug.types.smart_boolean(value)
+
+	subResponse = falcon.Response()
+	batch_phase.phase = phase
+	try:
+		data = route(token=token, response=subResponse, **params)
+	except UpstreamSkipped:
+		return None
+	except (TimeoutError, concurrent.futures.TimeoutError) as e:
+		subResponse.status = falcon.get_http_status(504)
+		data = {
+			'status': 'timeout',
+			'error': str(e)
+		}
+	except (TypeError, ValueError) as e:
+		subResponse.status = falcon.get_http_status(400)
+		data = {
+			'status': 'bad request',
+			'error': str(e)
+		}
+	except Exception as e:
+		subResponse.status = falcon.get_http_status(500)
+		data = {
+			'status': 'error',
+			'error': str(e)
+		}
+	finally:
+		batch_phase.phase = None
+		serialized_response.data = serialized_response.body = None
+
+	return {
+		"endpoint": endpoint,
+		"status": int(subResponse.status.split(' ')[0]),
+		"data": data
+	}
+
+@hug.post('/batch')
+def batch(token: str, response, body=None):
+	"""
+	Exécute plusieurs routes de lecture pour un même token en une seule requête.
+	Les sous-requêtes sont d'abord cherchées en cache en parallèle, puis celles qui doivent appeler Pronote
+	sont exécutées l'une après l'autre (elles prennent toutes le verrou du client).
+
+	Args:
+		token (str): Le token du client Pronote
+		response (falcon.Response): La réponse de la requête
+		body (dict): Le corps de la requête, avec la liste des sous-requêtes dans "requests" (liste JSON ou chaîne JSON) :
+
+		{
+			"token": str,
+			"requests": [{
+				"endpoint": str,
+				"params": dict
+			}]
+		}
+
+	Returns:
+		dict: Les résultats des sous-requêtes, dans le même ordre :
+
+		{
+			"status": "ok",
+			"results": [{
+				"endpoint": str,
+				"status": int,
+				"data": Any
+			}]
+		}
+	"""
+
+	success, client = get_client(token)
+	if success == 'ok':
+		queries = body.get('requests') if isinstance(body, dict) else None
+		if isinstance(queries, str):
+			try:
+				queries = json.loads(queries)
+			except ValueError:
+				queries = None
+
+		if not isinstance(queries, list) or not all(isinstance(query, dict) for query in queries):
+			response.status = falcon.get_http_status(400)
+			return {
+				"status": "error",
+				"error": "requests doit être une liste de sous-requêtes."
+			}
+		if len(queries) > batch_max_requests:
+			response.status = falcon.get_http_status(400)
+			return {
+				"status": "error",
+				"error": f"Trop de sous-requêtes (max {batch_max_requests})."
+			}
+
+		futures = [batch_pool.submit(__run_batch_request, token, query, 'lookup') for query in queries]
+		results = [future.result() for future in futures]
+		for i, query in enumerate(queries):
+			if results[i] is None:
+				results[i] = __run_batch_request(token, query, 'upstream')
+		return {
+			"status": "ok",
+			"results": results
+		}
+	else:
+		response.status = falcon.get_http_status(498)
+		return success
+
+# préchargement :
+# juste après la connexion, l'application demande presque toujours /user, /timetable du jour et /grades.
+# Ces réponses sont construites en arrière-plan dès que le jeton est créé, puis rafraîchies régulièrement
+# tant que le jeton est utilisé, pour que le premier écran soit servi depuis le cache.
+prefetch_interval = int(os.environ.get('PAPILLON_PREFETCH_INTERVAL', 240)) # le temps en sec entre deux rafraîchissements (0 pour désactiver)
+prefetch_max_workers = int(os.environ.get('PAPILLON_PREFETCH_WORKERS', 8)) # le nombre max de préchargements en parallèle
+prefetch_pool = concurrent.futures.ThreadPoolExecutor(max_workers=prefetch_max_workers, thread_name_prefix='prefetch')
+prefetch_requests = {
+	'user': lambda client, refresh: ((client.calculated_period.id,), __get_user_data, client),
+	'timetable': lambda client, refresh: ((datetime.date.today().isoformat(),), __get_timetable_data, client, datetime.date.today(), refresh),
+	'grades': lambda client, refresh: ((client.calculated_period.id,), __get_grades_data, client.calculated_period, refresh),
+} # route -> (client, rafraîchissement) -> (arguments normalisés, builder, arguments de builder), le rafraîchissement ignore aussi les données gardées avec le client
+prefetch_endpoints = [endpoint for endpoint in os.environ.get('PAPILLON_PREFETCH', 'user,timetable,grades').split(',') if endpoint in prefetch_requests] # les routes préchargées (vide pour désactiver)
+
+def __prefetch_session(token: str, refresh: bool = False) -> None:
+	"""
+	Construit les réponses préchargées d'un jeton, l'une après l'autre.
+
+	Args:
+		token (str): Le token du client Pronote
+		refresh (bool, optional): Si True, les réponses déjà en cache sont reconstruites. Defaults to False.
+	"""
+
+	for endpoint in prefetch_endpoints:
+		client_dict = saved_clients.get(token)
+		if client_dict is None:
+			return
+		try:
+			args, builder, *builder_args = prefetch_requests[endpoint](client_dict['client'], refresh)
+			if refresh:
+				__refresh_cached_data(token, endpoint, args, builder, *builder_args)
+			else:
+				__get_cached_data(token, endpoint, args, builder, *builder_args)
+				serialized_response.data = serialized_response.body = None
+		except Exception as e:
+			print(f"Error while prefetching {endpoint}")
+			print(e)
+
+def __start_prefetch(token: str) -> None:
+	"""
+	Lance le préchargement d'un jeton en arrière-plan.
+
+	Args:
+		token (str): Le token du client Pronote
+	"""
+
+	if prefetch_endpoints:
+		prefetch_pool.submit(__prefetch_session, token)
+
+def __start_prefetch_refresher() -> None:
+	"""
+	Lance le thread qui rafraîchit les réponses préchargées des jetons utilisés depuis le dernier passage.
+	"""
+
+	if not prefetch_endpoints or prefetch_interval <= 0:
+		return
+
+	def refresh_forever():
+		while True:
+			time.sleep(prefetch_interval)
+			now = time.time()
+			for token, client_dict in saved_clients.items():
+				if now - client_dict['last_interaction'] < prefetch_interval:
+					try:
+						prefetch_pool.submit(__prefetch_session, token, True)
+					except RuntimeError:
+						# le pool est arrêté : le processus se termine
+						return
+
+	threading.Thread(target=refresh_forever, name='prefetch-refresher', daemon=True).start()
+
+# serveur de production :
+# python server.py traite les requêtes sur un pool de threads, une école lente ne bloque donc plus les autres utilisateurs
+# (python -m hug -f server.py reste utilisable en développement)
+http_max_workers = int(os.environ.get('PAPILLON_HTTP_WORKERS', 64)) # le nombre max de requêtes HTTP traitées en parallèle
+
+class PooledWSGIServer(WSGIServer):
+	"""
+	Serveur WSGI qui traite chaque requête sur un pool de threads borné.
+	Les connexions en trop attendent dans la file du pool.
+	"""
+
+	request_queue_size = 128
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=http_max_workers, thread_name_prefix='http')
+
+	def process_request(self, request, client_address):
+		self.pool.submit(self.process_request_thread, request, client_address)
+
+	def process_request_thread(self, request, client_address):
+		try:
+			self.finish_request(request, client_address)
+		except Exception:
+			self.handle_error(request, client_address)
+		finally:
+			self.shutdown_request(request)
+
+# plusieurs workers :
+# chaque worker est un processus qui accepte les connexions sur le même port. Un client Pronote ne peut pas
+# changer de processus, donc une requête qui arrive sur le mauvais worker est transmise à celui qui a créé le jeton
+# (chaque worker écoute aussi sur 127.0.0.1:worker_port_base+numéro). Si ce worker ne répond pas, le jeton est
+# reconnecté localement depuis session_backend.
+# Les connexions (/generatetoken) sont réparties selon l'URL et le nom d'utilisateur, pour retrouver les clients déjà connectés.
+worker_count = int(os.environ.get('PAPILLON_WORKERS', 1)) # le nombre de processus qui traitent les requêtes
+worker_port_base = int(os.environ.get('PAPILLON_WORKER_PORT_BASE', 18000)) # le premier port interne des workers
+worker_id = None # le numéro du worker courant (None sans workers)
+skipped_headers = ('connection', 'keep-alive', 'transfer-encoding', 'content-encoding', 'content-length', 'host', 'date', 'server') # en-têtes gérés par chaque serveur, non transmis
+
+def __get_request_param(environ: dict, body: bytes, name: str) -> str|None:
+	"""
+	Retrouve un paramètre d'une requête WSGI (URL, formulaire ou JSON).
+
+	Args:
+		environ (dict): L'environnement WSGI de la requête
+		body (bytes): Le corps de la requête
+		name (str): Le nom du paramètre
+
+	Returns:
+		str|None: La valeur, ou None si elle est absente
+	"""
+
+	query = urllib.parse.parse_qs(environ.get('QUERY_STRING', ''))
+	if name in query:
+		return query[name][0]
+	if not body:
+		return None
+
+	content_type = environ.get('CONTENT_TYPE', '')
+	if content_type.startswith('application/json'):
+		try:
+			data = json.loads(body)
+		except ValueError:
+			return None
+		return data.get(name) if isinstance(data, dict) and isinstance(data.get(name), str) else None
+	if content_type.startswith('application/x-www-form-urlencoded'):
+		form = urllib.parse.parse_qs(body.decode('utf8', 'replace'))
+		return form[name][0] if name in form else None
+	return None
+
+def __get_login_owner(environ: dict, body: bytes) -> str:
+	"""
+	Choisit le worker qui traite une connexion : toujours le même pour les mêmes identifiants,
+	pour que les connexions identiques soient fusionnées et les clients réutilisés (voir __login).
+
+	Args:
+		environ (dict): L'environnement WSGI de la requête
+		body (bytes): Le corps de la requête
+
+	Returns:
+		str: Le numéro du worker, ou '' pour traiter la connexion localement (QR code)
+	"""
+
+	if (__get_request_param(environ, body, 'method') or 'url') not in ('url', 'token'):
+		return ''
+	url = __get_request_param(environ, body, 'url')
+	username = __get_request_param(environ, body, 'username')
+	if url is None or username is None:
+		return ''
+	digest = hashlib.sha256(f'{url}\n{username}'.encode('utf8')).digest()
+	return str(int.from_bytes(digest[:4], 'big') % worker_count)
+
+def worker_router(environ, start_response):
+	"""
+	Application WSGI des workers : transmet la requête au worker qui a créé son jeton, ou la traite localement.
+	"""
+
+	body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+	environ['wsgi.input'] = io.BytesIO(body)
+
+	token = __get_request_param(environ, body, 'token')
+	if token is None and environ.get('PATH_INFO') == '/generatetoken':
+		owner = __get_login_owner(environ, body)
+	else:
+		owner = token.split('.', 1)[0] if token and '.' in token else ''
+	if not owner.isdigit() or int(owner) == worker_id or int(owner) >= worker_count:
+		return __hug_wsgi__(environ, start_response)
+
+	headers = {key[5:].replace('_', '-').title(): value for key, value in environ.items() if key.startswith('HTTP_')}
+	headers = {key: value for key, value in headers.items() if key.lower() not in skipped_headers}
+	if environ.get('CONTENT_TYPE'):
+		headers['Content-Type'] = environ['CONTENT_TYPE']
+	url = f"http://127.0.0.1:{worker_port_base + int(owner)}{urllib.parse.quote(environ.get('PATH_INFO', '/'))}"
+	if environ.get('QUERY_STRING'):
+		url += '?' + environ['QUERY_STRING']
+
+	try:
+		forwarded = requests.request(environ['REQUEST_METHOD'], url, data=body, headers=headers, timeout=upstream_timeout + 5, allow_redirects=False, stream=True)
+	except requests.RequestException as e:
+		print(f"Worker {owner} unreachable, handling the request locally: {e}")
+		return __hug_wsgi__(environ, start_response)
+
+	start_response(f'{forwarded.status_code} {forwarded.reason}', [(key, value) for key, value in forwarded.headers.items() if key.lower() not in skipped_headers])
+	return __iter_forwarded_body(forwarded)
+
+def __iter_forwarded_body(forwarded: requests.Response):
+	"""
+	Relaie le corps d'une réponse transmise par un autre worker dès qu'il arrive (les réponses NDJSON ne sont pas mises en mémoire).
+	"""
+
+	try:
+		while chunk := forwarded.raw.read1(64 * 1024, decode_content=True):
+			yield chunk
+	finally:
+		forwarded.close()
+
+def __serve_worker(httpd: PooledWSGIServer, number: int) -> None:
+	"""
+	Boucle d'un worker (processus enfant) : écoute sur son port interne et sur le port public partagé.
+
+	Args:
+		httpd (PooledWSGIServer): Le serveur du port public, créé avant le fork
+		number (int): Le numéro du worker
+	"""
+
+	global worker_id
+	worker_id = number
+	worker_processes.clear()
+
+	internal = make_server('127.0.0.1', worker_port_base + number, __hug_wsgi__, server_class=PooledWSGIServer)
+	threading.Thread(target=internal.serve_forever, name='internal-http', daemon=True).start()
+
+	httpd.set_app(worker_router)
+	httpd.serve_forever()
+
+if __name__ == '__main__':
+	host = os.environ.get('PAPILLON_HOST', '0.0.0.0')
+	port = int(os.environ.get('PAPILLON_PORT', 8000))
+	httpd = make_server(host, port, __hug_wsgi__, server_class=PooledWSGIServer)
+	print(f'Serving on {host}:{port} ({worker_count} workers, {http_max_workers} HTTP threads, {upstream_max_workers} Pronote threads)')
+
+	if worker_count <= 1:
+		httpd.serve_forever()
+	else:
+		def start_worker(number: int) -> None:
+			pid = os.fork()
+			if pid == 0:
+				try:
+					__serve_worker(httpd, number)
+				finally:
+					sys.exit(0)
+			worker_processes[pid] = number
+
+		for number in range(worker_count):
+			start_worker(number)
+
+		# relance les workers qui s'arrêtent
+		while True:
+			pid, status = os.wait()
+			number = worker_processes.pop(pid, None)
+			if number is not None:
+				print(f'Worker {number} exited ({status}), restarting')
+				time.sleep(1)
+				start_worker(number)
@@ -0,0 +1,92 @@
+# configure le serveur pour les tests et remplace pronotepy.Client par un faux client (aucun appel réseau)
+import os
+import sys
+import uuid
+import types
+import datetime
+
+import pytest
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT) # server.py lit VERSION, maintenance.json et cas_list.json dans le dossier courant
+sys.path.insert(0, ROOT)
+
+os.environ['PAPILLON_SESSION_BACKEND'] = 'memory'
+os.environ['PAPILLON_SESSION_KEY'] = 'papillon-tests'
+os.environ['PAPILLON_PREFETCH'] = '' # pas de préchargement en arrière-plan pendant les tests
+
+import pronotepy
+
+class FakePeriod:
+	def __init__(self, id: str, name: str, start: datetime.datetime, end: datetime.datetime):
+		self.id = id
+		self.name = name
+		self.start = start
+		self.end = end
+
+class FakeClient:
+	"""
+	Faux pronotepy.Client : connecté, avec trois trimestres, deux semestres et une année pour 2021-2022.
+	"""
+
+	def __init__(self, pronote_url: str = 'https://0000000a.index-education.net/pronote/eleve.html', username: str = 'eleve', password: str = 'mdp', ent=None, uuid: str = '', mode: str = 'normal'):
+		self.pronote_url = pronote_url
+		self.username = username
+		self.password = password
+		self.ent = ent
+		self.uuid = uuid
+		self.login_mode = mode
+		self.logged_in = True
+		self.communication = types.SimpleNamespace(session=requests.Session(), root_site=pronote_url.rsplit('/', 1)[0])
+		self.periods = [
+			FakePeriod('1', 'Trimestre 1', datetime.datetime(2021, 9, 1), datetime.datetime(2021, 11, 30)),
+			FakePeriod('2', 'Trimestre 2', datetime.datetime(2021, 12, 1), datetime.datetime(2022, 2, 28)),
+			FakePeriod('3', 'Trimestre 3', datetime.datetime(2022, 3, 1), datetime.datetime(2022, 7, 5)),
+			FakePeriod('4', 'Semestre 1', datetime.datetime(2021, 9, 1), datetime.datetime(2022, 1, 31)),
+			FakePeriod('5', 'Semestre 2', datetime.datetime(2022, 2, 1), datetime.datetime(2022, 7, 5)),
+			FakePeriod('6', 'Année continue', datetime.datetime(2021, 9, 1), datetime.datetime(2022, 7, 5)),
+		]
+		self.current_period = FakePeriod('2', 'Trimestre 2', datetime.datetime(2021, 12, 1), datetime.datetime(2022, 2, 28))
+		self.news = []
+
+	@classmethod
+	def token_login(cls, pronote_url: str, username: str, password: str, uuid: str, **kwargs):
+		return cls(pronote_url, username, password, uuid=uuid, mode='token')
+
+	def refresh(self) -> None:
+		pass
+
+	def session_check(self) -> bool:
+		return False
+
+	def export_ical(self) -> str:
+		return 'https://0000000a.index-education.net/pronote/ical/Agenda.ics'
+
+	def information_and_surveys(self, only_unread: bool = False) -> list:
+		return self.news
+
+pronotepy.Client = FakeClient
+
+import hug
+import server
+
+@pytest.fixture
+def client() -> FakeClient:
+	return FakeClient()
+
+@pytest.fixture
+def login():
+	"""
+	Connecte un nouvel élève (identifiants uniques) avec /generatetoken et retourne son jeton.
+	"""
+
+	def login(method: str = 'url') -> str:
+		body = {'url': 'https://0000000a.index-education.net/pronote/eleve.html', 'username': uuid.uuid4().hex, 'password': 'mdp'}
+		if method == 'token':
+			body['uuid'] = uuid.uuid4().hex
+		response = hug.test.post(server, '/generatetoken', body=body, params={'method': method})
+		assert response.status == '200 OK', response.data
+		return response.data['token']
+
+	return login
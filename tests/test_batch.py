@@ -0,0 +1,91 @@
+import hug
+import pronotepy
+
+import server
+
+def batch(token: str, requests):
+	return hug.test.post(server, '/batch', body={'token': token, 'requests': requests})
+
+def test_results_keep_request_order(login):
+	token = login()
+	response = batch(token, [{'endpoint': '/export/ical'}, {'endpoint': 'news'}])
+
+	assert response.status == '200 OK'
+	assert [(result['endpoint'], result['status']) for result in response.data['results']] == [('/export/ical', 200), ('/news', 200)]
+	assert response.data['results'][0]['data'] == 'https://0000000a.index-education.net/pronote/ical/Agenda.ics'
+
+def test_requests_as_json_string(login):
+	token = login()
+	response = batch(token, '[{"endpoint": "/export/ical"}]')
+
+	assert response.status == '200 OK'
+	assert response.data['results'][0]['status'] == 200
+
+def test_invalid_token():
+	response = batch('unknown', [{'endpoint': '/news'}])
+
+	assert response.status.startswith('498')
+
+def test_requests_must_be_a_list(login):
+	token = login()
+
+	for requests in ('not json', {'endpoint': '/news'}, ['/news'], None):
+		response = batch(token, requests)
+		assert response.status == '400 Bad Request', requests
+		assert response.data['status'] == 'error'
+
+def test_too_many_requests(login):
+	token = login()
+	response = batch(token, [{'endpoint': '/export/ical'}] * (server.batch_max_requests + 1))
+
+	assert response.status == '400 Bad Request'
+
+def test_errors_stay_in_their_sub_request(login, monkeypatch):
+	token = login()
+
+	def fail(self, only_unread=False):
+		raise pronotepy.PronoteAPIError('Pronote error')
+
+	monkeypatch.setattr(type(server.saved_clients[token]['client']), 'information_and_surveys', fail)
+	response = batch(token, [
+		{'endpoint': '/unknown'},
+		{'endpoint': '/timetable', 'params': {'dateString': 'not a date'}},
+		{'endpoint': '/timetable', 'params': {'unknown': 1}},
+		{'endpoint': '/news'},
+		{'endpoint': '/export/ical'},
+	])
+
+	assert response.status == '200 OK'
+	results = response.data['results']
+	assert [result['status'] for result in results] == [404, 400, 400, 500, 200]
+	assert results[0]['endpoint'] == '/unknown'
+	assert results[3]['data']['error'] == 'Pronote error'
+
+def test_upstream_timeout_is_504(login, monkeypatch):
+	token = login()
+
+	def timeout(self):
+		raise TimeoutError('Pronote did not respond in time')
+
+	monkeypatch.setattr(type(server.saved_clients[token]['client']), 'export_ical', timeout)
+	response = batch(token, [{'endpoint': '/export/ical'}])
+
+	assert response.data['results'][0]['status'] == 504
+	assert response.data['results'][0]['data'] == {'status': 'timeout', 'error': 'Pronote did not respond in time'}
+
+def test_cached_responses_skip_upstream(login, monkeypatch):
+	token = login()
+	calls = []
+	client_type = type(server.saved_clients[token]['client'])
+	information_and_surveys = client_type.information_and_surveys
+
+	def count(self, only_unread=False):
+		calls.append(True)
+		return information_and_surveys(self, only_unread)
+
+	monkeypatch.setattr(client_type, 'information_and_surveys', count)
+	batch(token, [{'endpoint': '/news'}])
+	response = batch(token, [{'endpoint': '/news'}, {'endpoint': '/news'}])
+
+	assert [result['status'] for result in response.data['results']] == [200, 200]
+	assert len(calls) == 1
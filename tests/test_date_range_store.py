@@ -0,0 +1,94 @@
+import datetime
+
+import server
+
+def day(n: int) -> datetime.date:
+	return datetime.date(2022, 1, n)
+
+class Fetcher:
+	"""
+	Faux appel à Pronote : un élément par jour, chaque appel est enregistré.
+	"""
+
+	def __init__(self):
+		self.calls = []
+
+	def __call__(self, dateFrom: datetime.date, dateTo: datetime.date) -> list:
+		self.calls.append((dateFrom, dateTo))
+		items = []
+		while dateFrom <= dateTo:
+			items.append((dateFrom, len(self.calls)))
+			dateFrom += datetime.timedelta(days=1)
+		return items
+
+def store(ttl: int = 300) -> tuple[server.DateRangeStore, Fetcher]:
+	fetch = Fetcher()
+	return server.DateRangeStore(fetch, lambda item: item[0], ttl), fetch
+
+def test_missing_on_empty_store():
+	rangeStore, fetch = store()
+
+	assert rangeStore.missing(day(3), day(9)) == [(day(3), day(9))]
+
+def test_covered_range_is_not_fetched_again():
+	rangeStore, fetch = store()
+	rangeStore.get(day(3), day(9))
+	items = rangeStore.get(day(4), day(6))
+
+	assert fetch.calls == [(day(3), day(9))]
+	assert items == [(day(4), 1), (day(5), 1), (day(6), 1)]
+	assert rangeStore.missing(day(3), day(9)) == []
+
+def test_gaps_are_merged_into_one_fetch():
+	rangeStore, fetch = store()
+	rangeStore.get(day(5), day(6))
+	rangeStore.get(day(10), day(11))
+
+	assert rangeStore.missing(day(3), day(13)) == [(day(3), day(4)), (day(7), day(9)), (day(12), day(13))]
+	items = rangeStore.get(day(3), day(13))
+
+	assert fetch.calls[-1] == (day(3), day(13))
+	assert len(fetch.calls) == 3
+	assert [item[0] for item in items] == [day(n) for n in range(3, 14)]
+	assert rangeStore.ranges == [(day(3), day(13), rangeStore.ranges[0][2])]
+	assert rangeStore.missing(day(3), day(13)) == []
+
+def test_overlapping_ranges_are_split():
+	rangeStore, fetch = store()
+	rangeStore.get(day(3), day(9))
+	rangeStore.get(day(8), day(12))
+
+	assert fetch.calls == [(day(3), day(9)), (day(10), day(12))]
+	assert [(start, end) for start, end, expires in rangeStore.ranges] == [(day(3), day(9)), (day(10), day(12))]
+	assert rangeStore.get(day(3), day(12)) == [(day(n), 1) for n in range(3, 10)] + [(day(n), 2) for n in range(10, 13)]
+
+def test_refresh_fetches_the_whole_range():
+	rangeStore, fetch = store()
+	rangeStore.get(day(3), day(9))
+	items = rangeStore.get(day(5), day(6), refresh=True)
+
+	assert fetch.calls[-1] == (day(5), day(6))
+	assert items == [(day(5), 2), (day(6), 2)]
+	assert [(start, end) for start, end, expires in rangeStore.ranges] == [(day(3), day(4)), (day(5), day(6)), (day(7), day(9))]
+	assert rangeStore.get(day(3), day(9))[0] == (day(3), 1)
+
+def test_expired_ranges_are_fetched_again(monkeypatch):
+	now = [1000.0]
+	monkeypatch.setattr(server.time, 'time', lambda: now[0])
+	rangeStore, fetch = store(ttl=60)
+	rangeStore.get(day(3), day(4))
+	now[0] += 30
+	rangeStore.get(day(5), day(6))
+
+	now[0] += 31 # la première plage a expiré, pas la deuxième
+	assert rangeStore.missing(day(3), day(6)) == [(day(3), day(4))]
+	rangeStore.get(day(3), day(6))
+
+	assert fetch.calls[-1] == (day(3), day(4))
+	assert day(3) in rangeStore.days and day(5) in rangeStore.days
+
+def test_items_outside_the_range_are_ignored():
+	rangeStore = server.DateRangeStore(lambda dateFrom, dateTo: [(day(1), 'x'), (day(5), 'y')], lambda item: item[0], 300)
+
+	assert rangeStore.get(day(3), day(6)) == [(day(5), 'y')]
+	assert day(1) not in rangeStore.days
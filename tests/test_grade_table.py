@@ -0,0 +1,116 @@
+import datetime
+import types
+
+import pytest
+
+import server
+
+def subject(id: str) -> types.SimpleNamespace:
+	return types.SimpleNamespace(id=id, name=id.capitalize(), groups=False)
+
+MATHS, FRENCH, HISTORY, SPORT = subject('maths'), subject('french'), subject('history'), subject('sport')
+
+def grade(id: str, subject, value: str, out_of: str = '20', coefficient: str = '1', day: int = 1, is_bonus: bool = False, is_optionnal: bool = False, average: str = '11,25', max: str = '18', min: str = '3') -> types.SimpleNamespace:
+	return types.SimpleNamespace(
+		id=id, subject=subject, date=datetime.datetime(2022, 1, 1, 8) + datetime.timedelta(days=day - 1), comment='',
+		is_bonus=is_bonus, is_optionnal=is_optionnal, is_out_of_20=out_of == '20',
+		grade=value, out_of=out_of, coefficient=coefficient, average=average, max=max, min=min
+	)
+
+GRADES = [
+	grade('m1', MATHS, '15', day=1),
+	grade('m2', MATHS, '8', out_of='10', coefficient='2', day=31), # 16 sur 20
+	grade('m3', MATHS, '12', coefficient='0', day=61), # compte dans min, max et tendance, pas dans la moyenne
+	grade('m4', MATHS, '20', day=61, is_bonus=True),
+	grade('m5', MATHS, '19', day=61, is_optionnal=True),
+	grade('m6', MATHS, 'AbsentZero', day=91), # compte 0
+	grade('m7', MATHS, 'Absent', day=91), # ne compte pas
+	grade('f1', FRENCH, '14,5', average='12,5', max='17,5', min='4,5'),
+	grade('h1', HISTORY, '10', day=5),
+	grade('h2', HISTORY, 'NonRenduZero', day=5), # compte 0, même jour
+	grade('s1', SPORT, '18', is_bonus=True),
+]
+
+@pytest.fixture
+def period() -> types.SimpleNamespace:
+	return types.SimpleNamespace(grades=GRADES)
+
+def by_subject(stats: list[dict]) -> dict:
+	return {subjectData['subject']['id']: subjectData for subjectData in stats}
+
+def test_columns(period):
+	table = server.__get_grade_table(period)
+
+	assert list(table.state) == [0, 0, 0, 0, 0, 6, 1, 0, 0, 7, 0]
+	assert list(table.score) == [15, 16, 12, 20, 19, 0, 0, 14.5, 10, 0, 18]
+	assert list(table.counted) == [1, 1, 1, 0, 0, 1, 0, 1, 1, 1, 0]
+	assert [subjectData.id for subjectData in table.subjects] == ['maths', 'french', 'history', 'sport']
+
+def test_weighted_average_min_max_and_trend(period):
+	maths = by_subject(server.__get_grade_table(period).stats())['maths']
+
+	# (15 * 1 + 16 * 2 + 12 * 0 + 0 * 1) / (1 + 2 + 0 + 1)
+	assert maths['average'] == 11.75
+	assert maths['count'] == 4
+	assert (maths['min'], maths['max']) == (0, 16)
+	# jours 0, 30, 60, 90 et notes 15, 16, 12, 0 : pente -735 / 4500 par jour
+	assert maths['trend'] == -4.9
+
+def test_single_grade_has_no_trend(period):
+	french = by_subject(server.__get_grade_table(period).stats())['french']
+
+	assert (french['count'], french['average'], french['min'], french['max'], french['trend']) == (1, 14.5, 14.5, 14.5, None)
+
+def test_grades_on_the_same_day_have_no_trend(period):
+	history = by_subject(server.__get_grade_table(period).stats())['history']
+
+	assert (history['count'], history['average'], history['min'], history['max'], history['trend']) == (2, 5, 0, 10, None)
+
+def test_subject_with_only_bonus_grades(period):
+	sport = by_subject(server.__get_grade_table(period).stats())['sport']
+
+	assert (sport['count'], sport['average'], sport['min'], sport['max'], sport['trend']) == (0, None, None, None, None)
+
+def test_stats_data(period):
+	stats = server.__get_grades_stats_data(period)
+
+	assert stats['count'] == 7
+	assert stats['overall_average'] == round((11.75 + 14.5 + 5) / 3, 2)
+
+def test_table_is_kept_with_the_period(period):
+	table = server.__get_grade_table(period)
+
+	assert server.__get_grade_table(period) is table
+	assert server.__get_grade_table(period, refresh=True) is not table
+
+def test_grades_data_matches_the_previous_output(period):
+	# construction de /grades avant GradeTable
+	expected = [{
+		"id": grade.id,
+		"subject": {
+			"id": grade.subject.id,
+			"name": grade.subject.name,
+			"groups": grade.subject.groups,
+		},
+		"date": grade.date.strftime("%Y-%m-%d %H:%M"),
+		"description": grade.comment,
+		"is_bonus": grade.is_bonus,
+		"is_optional": grade.is_optionnal,
+		"is_out_of_20": grade.is_out_of_20,
+		"grade": {
+			"value": server.__transform_to_number(server.__get_grade_state(grade.grade)),
+			"out_of": server.__transform_to_number(grade.out_of),
+			"coefficient": server.__transform_to_number(grade.coefficient),
+			"average": server.__transform_to_number(server.__get_grade_state(grade.average)),
+			"max": server.__transform_to_number(server.__get_grade_state(grade.max)),
+			"min": server.__transform_to_number(server.__get_grade_state(grade.min)),
+			"significant": server.__get_grade_state(grade.grade, True),
+		}
+	} for grade in GRADES]
+
+	data = server.__get_grade_table(period).grades_data()
+
+	assert server.dump_json(data) == server.dump_json(expected)
+	assert data[0]['grade']['value'] == 15 and type(data[0]['grade']['value']) is int
+	assert data[7]['grade']['value'] == 14.5 and data[7]['grade']['average'] == 12.5
+	assert data[6]['grade']['value'] == -1
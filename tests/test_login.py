@@ -0,0 +1,84 @@
+import threading
+import time
+import uuid
+
+import hug
+import pytest
+
+import server
+from conftest import FakeClient
+
+@pytest.fixture
+def body() -> dict:
+	return {'url': 'https://0000000a.index-education.net/pronote/eleve.html', 'username': uuid.uuid4().hex, 'password': 'mdp'}
+
+def generate_token(body: dict) -> str:
+	response = hug.test.post(server, '/generatetoken', body=body)
+	assert response.status == '200 OK', response.data
+	return response.data['token']
+
+def shared_client(token: str):
+	client = server.saved_clients[token]['client']
+	return getattr(client, 'shared_client', client)
+
+def test_same_credentials_share_the_client(body):
+	first = generate_token(body)
+	second = generate_token(body)
+
+	assert first != second
+	assert shared_client(first) is shared_client(second)
+	assert server.saved_clients[first]['cache'] is server.saved_clients[second]['cache']
+	assert server.saved_clients[first]['lock'] is server.saved_clients[second]['lock']
+
+def test_other_credentials_get_another_client(body):
+	first = generate_token(body)
+	second = generate_token(dict(body, password='autre'))
+
+	assert shared_client(first) is not shared_client(second)
+
+def test_each_token_keeps_its_period(body):
+	first = generate_token(body)
+	second = generate_token(body)
+
+	assert hug.test.post(server, '/changePeriod', token=first, periodName='Trimestre 1').data['period'] == 'Trimestre 1'
+	assert hug.test.post(server, '/changePeriod', token=second, periodName='Trimestre 3').data['period'] == 'Trimestre 3'
+
+	assert server.get_client(first)[1].calculated_period.name == 'Trimestre 1'
+	assert server.get_client(second)[1].calculated_period.name == 'Trimestre 3'
+	assert server.session_backend.load(first)['period'] == 'Trimestre 1'
+
+def test_expiring_one_token_keeps_the_shared_session(body):
+	first = generate_token(body)
+	second = generate_token(body)
+	closed = []
+	shared_client(first).communication.session.close = lambda: closed.append(True)
+
+	server.saved_clients[first]['last_interaction'] -= server.session_lifetime
+	server.saved_clients.sweep()
+	assert closed == []
+	assert server.get_client(second)[0] == 'ok'
+
+	server.saved_clients[second]['last_interaction'] -= server.session_lifetime
+	server.saved_clients.sweep()
+	assert closed == [True]
+
+def test_concurrent_logins_call_pronote_once(body, monkeypatch):
+	logins = []
+
+	class SlowClient(FakeClient):
+		def __init__(self, *args, **kwargs):
+			logins.append(True)
+			time.sleep(0.3)
+			super().__init__(*args, **kwargs)
+
+	monkeypatch.setattr(server.pronotepy, 'Client', SlowClient)
+	tokens = []
+	threads = [threading.Thread(target=lambda: tokens.append(generate_token(body))) for _ in range(6)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+
+	assert len(logins) == 1
+	assert len(set(tokens)) == 6
+	assert len({id(shared_client(token)) for token in tokens}) == 1
@@ -0,0 +1,67 @@
+import datetime
+
+import server
+
+def test_index_by_name_id_and_family(client):
+	index = server.PeriodIndex(client)
+
+	assert index.by_name['Trimestre 2'].id == '2'
+	assert index.by_id['5'].name == 'Semestre 2'
+	assert [period.name for period in index.by_family['Trimestre']] == ['Trimestre 1', 'Trimestre 2', 'Trimestre 3']
+	assert index.family('Année continue') == 'Année'
+
+def test_current_period_is_taken_from_periods(client):
+	index = server.PeriodIndex(client)
+
+	assert index.current is index.by_id['2']
+
+def test_containing(client):
+	index = server.PeriodIndex(client)
+
+	assert index.containing(datetime.datetime(2021, 9, 1), 'Trimestre').name == 'Trimestre 1'
+	assert index.containing(datetime.datetime(2021, 11, 30), 'Trimestre').name == 'Trimestre 1'
+	assert index.containing(datetime.datetime(2022, 2, 1), 'Trimestre').name == 'Trimestre 2'
+	assert index.containing(datetime.datetime(2022, 2, 1), 'Semestre').name == 'Semestre 2'
+	assert index.containing(datetime.datetime(2022, 7, 5), 'Année').name == 'Année continue'
+
+def test_containing_outside_periods(client):
+	index = server.PeriodIndex(client)
+
+	assert index.containing(datetime.datetime(2021, 8, 31), 'Trimestre') is None
+	assert index.containing(datetime.datetime(2022, 7, 6), 'Trimestre') is None
+	assert index.containing(datetime.datetime(2022, 1, 1), 'Unknown') is None
+
+def test_containing_with_a_gap_between_periods(client):
+	client.periods[1].start = datetime.datetime(2021, 12, 15)
+	index = server.PeriodIndex(client)
+
+	assert index.containing(datetime.datetime(2021, 12, 10), 'Trimestre') is None
+
+def test_index_is_built_once(client):
+	index = server.__get_period_index(client)
+	client.periods = []
+
+	assert server.__get_period_index(client) is index
+
+def test_current_period_lookup(client, monkeypatch):
+	class FakeDatetime(datetime.datetime):
+		@classmethod
+		def now(cls, tz=None):
+			return cls(2022, 3, 15, 10)
+
+	monkeypatch.setattr(server.datetime, 'datetime', FakeDatetime)
+
+	assert server.__get_current_period(client).name == 'Trimestre 3'
+	assert server.__get_current_period(client, True, 'Semestre 1').name == 'Semestre 1'
+	assert server.__get_current_period(client, True, 'Unknown').name == 'Trimestre 3'
+	assert [period.name for period in server.__get_current_period(client, False, None, True)] == ['Trimestre 1', 'Trimestre 2', 'Trimestre 3']
+
+def test_current_period_after_the_last_period(client, monkeypatch):
+	class FakeDatetime(datetime.datetime):
+		@classmethod
+		def now(cls, tz=None):
+			return cls(2022, 8, 15, 10)
+
+	monkeypatch.setattr(server.datetime, 'datetime', FakeDatetime)
+
+	assert server.__get_current_period(client).name == 'Trimestre 3'
@@ -0,0 +1,84 @@
+import server
+
+def test_get_returns_cached_data():
+	cache = server.ResponseCache(1024)
+	cache.set('news', (), [{'id': 'n1'}])
+
+	assert cache.get('news', ()) == [{'id': 'n1'}]
+	assert cache.get('news', ('other',)) is None
+	assert (cache.hits, cache.misses) == (1, 1)
+
+def test_size_counts_json_bytes():
+	cache = server.ResponseCache(1024)
+	cache.set('news', (), [1, 2, 3])
+	cache.set('user', (), {'name': 'x'}, size=100)
+
+	assert cache.size == len(server.dump_json([1, 2, 3])) + 100
+
+def test_byte_cap_evicts_least_recently_used():
+	cache = server.ResponseCache(250)
+	cache.set('timetable', ('2022-01-03',), 'a', size=100)
+	cache.set('timetable', ('2022-01-04',), 'b', size=100)
+	cache.get('timetable', ('2022-01-03',)) # 2022-01-03 devient la plus récemment utilisée
+	cache.set('timetable', ('2022-01-05',), 'c', size=100)
+
+	assert cache.get('timetable', ('2022-01-04',)) is None
+	assert cache.get('timetable', ('2022-01-03',)) == 'a'
+	assert cache.get('timetable', ('2022-01-05',)) == 'c'
+	assert cache.size == 200
+
+def test_entry_larger_than_cap_is_not_cached():
+	cache = server.ResponseCache(100)
+	cache.set('user', (), 'small', size=50)
+	cache.set('grades', (), 'big', size=101)
+
+	assert cache.get('grades', ()) is None
+	assert cache.get('user', ()) == 'small'
+	assert cache.size == 50
+
+def test_replacing_an_entry_keeps_size_consistent():
+	cache = server.ResponseCache(1024)
+	cache.set('user', (), 'old', size=300)
+	cache.set('user', (), 'new', size=200)
+
+	assert cache.get('user', ()) == 'new'
+	assert cache.size == 200
+
+def test_none_is_not_cached():
+	cache = server.ResponseCache(1024)
+	cache.set('user', (), None)
+
+	assert cache.size == 0
+	assert not cache.entries
+
+def test_entries_expire_after_ttl(monkeypatch):
+	now = [1000.0]
+	monkeypatch.setattr(server.time, 'time', lambda: now[0])
+	monkeypatch.setitem(server.cache_ttl, 'news', 60)
+	cache = server.ResponseCache(1024)
+	cache.set('news', (), ['n1'], size=10)
+
+	now[0] += 59
+	assert cache.get('news', ()) == ['n1']
+	assert cache.find('news') == [['n1']]
+
+	now[0] += 2
+	assert cache.find('news') == []
+	assert cache.get('news', ()) is None
+	assert cache.size == 0
+
+def test_endpoint_without_ttl_is_never_served():
+	cache = server.ResponseCache(1024)
+	cache.set('unknown', (), 'x', size=1)
+
+	assert cache.get('unknown', ()) is None
+
+def test_invalidate_with_match():
+	cache = server.ResponseCache(1024)
+	cache.set('homework', ('2022-01-03', '2022-01-09'), 'a', size=10)
+	cache.set('homework', ('2022-01-10', '2022-01-16'), 'b', size=10)
+	cache.invalidate('homework', lambda args: args[0] <= '2022-01-05' <= args[1])
+
+	assert cache.get('homework', ('2022-01-03', '2022-01-09')) is None
+	assert cache.get('homework', ('2022-01-10', '2022-01-16')) == 'b'
+	assert cache.size == 10
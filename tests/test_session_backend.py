@@ -0,0 +1,98 @@
+import os
+import stat
+import sqlite3
+import time
+
+import hug
+import pytest
+
+import server
+
+URL = 'https://0000000a.index-education.net/pronote/eleve.html'
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch) -> server.SQLiteSessionBackend:
+	backend = server.SQLiteSessionBackend(str(tmp_path / 'sessions.db'))
+	monkeypatch.setattr(server, 'session_backend', backend)
+	return backend
+
+def test_save_and_load(backend):
+	backend.save('a', 'url', URL, 'eleve', 'mdp', None, None, 'Trimestre 1')
+	row = backend.load('a')
+
+	assert (row['method'], row['url'], row['username'], row['password'], row['period']) == ('url', URL, 'eleve', 'mdp', 'Trimestre 1')
+	assert backend.load('unknown') is None
+
+	backend.set_period('a', 'Trimestre 2')
+	assert backend.load('a')['period'] == 'Trimestre 2'
+	backend.delete('a')
+	assert backend.load('a') is None
+
+def test_file_is_private_and_password_encrypted(backend):
+	backend.save('a', 'url', URL, 'eleve', 'mdp')
+
+	assert stat.S_IMODE(os.stat(backend.path).st_mode) == 0o600
+	password = sqlite3.connect(backend.path).execute('SELECT password FROM sessions').fetchone()[0]
+	assert password.startswith(server.CredentialCipher.prefix)
+	assert 'mdp' not in password
+
+def test_rows_survive_a_restart(backend):
+	backend.save('a', 'url', URL, 'eleve', 'mdp')
+
+	assert server.SQLiteSessionBackend(backend.path).load('a')['password'] == 'mdp'
+
+def test_rows_need_the_same_key_and_token(backend, monkeypatch):
+	backend.save('a', 'url', URL, 'eleve', 'mdp')
+	db = sqlite3.connect(backend.path, isolation_level=None)
+	db.execute("INSERT INTO sessions SELECT 'b', method, url, username, password, ent, uuid, period, last_interaction FROM sessions WHERE token = 'a'")
+
+	assert backend.load('b') is None # mot de passe copié sur un autre jeton
+	monkeypatch.setattr(server, 'credential_cipher', server.CredentialCipher('other key'))
+	assert backend.load('a') is None
+
+def test_flush_updates_and_expires_rows(backend, monkeypatch):
+	store = server.SessionStore(max_count=10, shard_count=1)
+	backend.save('active', 'url', URL, 'eleve', 'mdp')
+	backend.save('idle', 'url', URL, 'eleve', 'mdp')
+	store['active'] = {'client': None, 'last_interaction': time.time() + 10}
+
+	now = time.time()
+	monkeypatch.setattr(server.time, 'time', lambda: now + server.session_lifetime + 1)
+	backend.flush(store)
+
+	assert backend.load('active') is not None
+	assert backend.load('idle') is None
+
+def test_token_is_restored_after_restart(backend, login):
+	token = login()
+	assert hug.test.post(server, '/changePeriod', token=token, periodName='Trimestre 3').status == '200 OK'
+
+	# un redémarrage vide saved_clients, le jeton est reconnecté depuis le fichier
+	server.saved_clients.pop(token)
+	status, client = server.get_client(token)
+
+	assert status == 'ok'
+	assert client is not None and client.logged_in
+	assert client.calculated_period.name == 'Trimestre 3'
+	assert server.saved_clients.get(token)['client'] is client
+
+def test_failed_restore_deletes_the_row(backend, login, monkeypatch):
+	token = login()
+	server.saved_clients.pop(token)
+
+	def fail(*args, **kwargs):
+		raise server.pronotepy.PronoteAPIError('Wrong credentials')
+
+	monkeypatch.setattr(server.pronotepy, 'Client', fail)
+	assert server.get_client(token) == ('expired', None)
+	assert backend.load(token) is None
+	assert server.get_client(token) == ('notfound', None)
+
+def test_too_old_row_is_expired(backend, login, monkeypatch):
+	token = login()
+	server.saved_clients.pop(token)
+
+	now = time.time()
+	monkeypatch.setattr(server.time, 'time', lambda: now + server.session_lifetime)
+	assert server.get_client(token) == ('expired', None)
+	assert backend.load(token) is None
@@ -0,0 +1,113 @@
+import time
+
+import server
+
+def entry(client, last_interaction: float|None = None, login_key: str|None = None) -> dict:
+	return {
+		'client': client,
+		'last_interaction': time.time() if last_interaction is None else last_interaction,
+		'cache': server.ResponseCache(),
+		'lock': None,
+		'login_key': login_key
+	}
+
+def test_get_and_pop(client):
+	store = server.SessionStore(max_count=10, shard_count=2)
+	closed = []
+	client.communication.session.close = lambda: closed.append(True)
+	store['a'] = entry(client)
+
+	assert 'a' in store
+	assert store.get('a')['client'] is client
+	assert store.pop('a')['client'] is client
+	assert store.get('a') is None
+	assert closed == [True]
+
+def test_sweep_removes_expired_tokens_only(client):
+	store = server.SessionStore(max_count=10, shard_count=2)
+	now = time.time()
+	store['old'] = entry(client, now - 301)
+	store['fresh'] = entry(client, now - 10)
+
+	assert store.sweep(300) == 1
+	assert 'old' not in store
+	assert 'fresh' in store
+	assert store.stats()['expired'] == 1
+
+def test_sweep_forgets_login_of_expired_token(client):
+	store = server.SessionStore(max_count=10, shard_count=2)
+	store['old'] = entry(client, time.time() - 301, login_key='key')
+
+	assert store.find_login('key', timeout=300) is None
+	store.sweep(300)
+	assert 'key' not in store.logins
+
+def test_find_login_returns_valid_token(client):
+	store = server.SessionStore(max_count=10, shard_count=2)
+	store['a'] = entry(client, login_key='key')
+
+	token, found = store.find_login('key', timeout=300)
+	assert token == 'a'
+	assert found is store.get('a')
+
+def test_full_shard_evicts_least_recently_used(client):
+	store = server.SessionStore(max_count=2, shard_count=1)
+	store['a'] = entry(client)
+	store['b'] = entry(client)
+	store.get('a')
+	store['c'] = entry(client)
+
+	assert 'b' not in store
+	assert 'a' in store and 'c' in store
+	assert store.stats()['evicted'] == 1
+
+def test_shared_client_is_closed_with_last_token(client):
+	store = server.SessionStore(max_count=10, shard_count=2)
+	closed = []
+	client.communication.session.close = lambda: closed.append(True)
+	store['a'] = entry(client)
+	store.share('b', store.get('a'), client)
+
+	store.pop('a')
+	assert closed == []
+	store.pop('b')
+	assert closed == [True]
+
+def test_idle_token_expires(login):
+	token = login()
+	assert server.get_client(token)[0] == 'ok'
+
+	server.saved_clients[token]['last_interaction'] -= server.client_timeout_threshold
+	assert server.get_client(token) == ('expired', None)
+	assert token not in server.saved_clients
+	assert server.get_client(token) == ('notfound', None) # supprimé aussi de session_backend
+
+def test_swept_token_is_reported_expired(login):
+	token = login()
+	server.saved_clients[token]['last_interaction'] -= server.session_lifetime
+	server.saved_clients.sweep()
+
+	assert token not in server.saved_clients
+	assert server.get_client(token) == ('expired', None)
+	assert server.get_client(token) == ('notfound', None)
+	assert server.session_backend.load(token) is None
+
+def test_tombstones_are_bounded(client, monkeypatch):
+	store = server.SessionStore(max_count=2, shard_count=1)
+	now = time.time()
+	for token in ('a', 'b', 'c'):
+		store[token] = entry(client, now - 301)
+	store.sweep(300)
+
+	assert list(store.tombstones) == ['b', 'c']
+	monkeypatch.setattr(server.time, 'time', lambda: now + server.session_tombstone_lifetime + 1)
+	store.sweep(300)
+	assert not store.tombstones
+
+def test_reused_token_forgets_its_tombstone(client):
+	store = server.SessionStore(max_count=10, shard_count=1)
+	store['a'] = entry(client, time.time() - 301)
+	store.sweep(300)
+	store['a'] = entry(client)
+
+	assert not store.pop_expired('a')
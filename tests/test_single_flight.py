@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+import server
+
+def run_together(flights: server.SingleFlight, function, count: int) -> list:
+	results = []
+
+	def run():
+		try:
+			results.append(flights.run('key', function))
+		except Exception as e:
+			results.append(e)
+
+	threads = [threading.Thread(target=run) for _ in range(count)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	return results
+
+def test_followers_get_the_leader_result():
+	flights = server.SingleFlight()
+	calls = []
+
+	def slow():
+		calls.append(True)
+		time.sleep(0.2)
+		return 'data'
+
+	results = run_together(flights, slow, 4)
+
+	assert len(calls) == 1
+	assert sorted(results, key=lambda result: result[1]) == [('data', False)] * 3 + [('data', True)]
+	assert flights.calls == {}
+
+def test_followers_wait_longer_than_the_upstream_timeout(monkeypatch):
+	# le premier appel peut attendre son tour (upstream_queue_timeout) avant l'appel à Pronote (upstream_timeout) :
+	# les autres ne doivent pas abandonner après upstream_timeout + 5 secondes (ici 0.2 s)
+	monkeypatch.setattr(server, 'upstream_timeout', -4.8)
+	flights = server.SingleFlight()
+
+	def slow():
+		time.sleep(0.5)
+		return 'data'
+
+	assert sorted(run_together(flights, slow, 3), key=lambda result: result[1]) == [('data', False)] * 2 + [('data', True)]
+
+def test_followers_get_the_leader_exception():
+	flights = server.SingleFlight()
+
+	def fail():
+		time.sleep(0.2)
+		raise ValueError('Pronote error')
+
+	results = run_together(flights, fail, 3)
+
+	assert all(isinstance(result, ValueError) for result in results)
+	assert flights.calls == {}
+
+def test_next_call_runs_again():
+	flights = server.SingleFlight()
+
+	assert flights.run('key', lambda: 1) == (1, True)
+	assert flights.run('key', lambda: 2) == (2, True)
+	with pytest.raises(KeyError):
+		flights.run('key', lambda: {}['missing'])
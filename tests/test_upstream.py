@@ -0,0 +1,29 @@
+import time
+
+import hug
+
+import server
+
+def test_slow_upstream_call_is_504(login, monkeypatch):
+	token = login()
+
+	def slow(self):
+		time.sleep(0.5)
+		return 'https://0000000a.index-education.net/pronote/ical/Agenda.ics'
+
+	monkeypatch.setattr(server, 'upstream_timeout', 0.1)
+	monkeypatch.setattr(type(server.saved_clients[token]['client']), 'export_ical', slow)
+	response = hug.test.get(server, '/export/ical', token=token)
+
+	assert response.status == '504 Gateway Timeout'
+	assert response.data == {'status': 'timeout', 'error': 'Pronote did not respond in time'}
+
+def test_busy_client_is_504(login, monkeypatch):
+	token = login()
+	monkeypatch.setattr(server, 'upstream_queue_timeout', 0.1)
+
+	with server.saved_clients[token]['lock']: # un autre appel du même client est en cours
+		response = hug.test.get(server, '/export/ical', token=token)
+
+	assert response.status == '504 Gateway Timeout'
+	assert response.data['error'] == 'Pronote is busy, try again later'